@@ -0,0 +1,81 @@
+"""Benchmark do pico de memória no envio de um alerta com muitos anexos: mensagem serializada inteira com as_string()
+e enviada com smtplib.SMTP.sendmail (versão anterior) versus mensagem serializada em partes, diretamente no comando
+DATA, com SMTPFluxo.sendmail_fluxo. O envio é feito a um servidor SMTP local, que descarta as mensagens.
+
+Uso, a partir do diretório raiz do projeto:
+    python benchmarks/bench_envio_memoria.py --anexos 50 --tamanho-kb 200
+"""
+
+import argparse
+import os
+import smtplib
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+root_dir = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(root_dir / 'src'))
+
+import email_sender  # noqa: E402
+from servidor_smtp import ServidorSMTP  # noqa: E402
+
+template_html = root_dir / 'data/input/html_templates/alerta_usuario.html'
+logo = root_dir / 'data/input/images/logoSAAT_email.png'
+
+
+def envia_as_string(porta: int, msg: email_sender.EmailMessageHTML):
+    with smtplib.SMTP('127.0.0.1', porta) as server:
+        server.sendmail(msg.sender_email, msg.destinatario, msg.message.as_string())
+
+
+def envia_fluxo(porta: int, msg: email_sender.EmailMessageHTML):
+    with email_sender.email_sender.SMTPFluxo('127.0.0.1', porta) as server:
+        server.sendmail_fluxo(msg.sender_email, msg.destinatario, msg.escrever)
+
+
+def mede(funcao, porta: int, msg: email_sender.EmailMessageHTML) -> tuple[float, float]:
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    funcao(porta, msg)
+    tempo = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico / 1024 ** 2, tempo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--anexos', type=int, default=50, help='Número de anexos PDF')
+    parser.add_argument('--tamanho-kb', type=int, default=200, help='Tamanho de cada anexo, em KB')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir, ServidorSMTP() as servidor:
+        servidor.iniciar()
+
+        anexos = []
+        for i in range(args.anexos):
+            anexo = Path(temp_dir) / f'cat{i}.pdf'
+            anexo.write_bytes(os.urandom(args.tamanho_kb * 1024))
+            anexos.append(anexo)
+
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Benchmark',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=anexos,
+                                            imagens=logo)
+
+        pico_antes, tempo_antes = mede(envia_as_string, servidor.porta, msg)
+        pico_depois, tempo_depois = mede(envia_fluxo, servidor.porta, msg)
+
+        print(f'Anexos: {args.anexos} x {args.tamanho_kb} KB '
+              f'(mensagem com {servidor.bytes_recebidos / 2 / 1024 ** 2:.1f} MB)')
+        print(f'as_string() + sendmail:  pico de {pico_antes:.1f} MB em {tempo_antes:.2f} s')
+        print(f'Serialização em partes: pico de {pico_depois:.1f} MB em {tempo_depois:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
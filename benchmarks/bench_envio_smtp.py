@@ -0,0 +1,133 @@
+"""Benchmark da vazão de envio dos alertas: mensagens montadas pelo EmailMessageHTML, com anexos PDF sintéticos, são
+enviadas pelo DespachanteSMTP a um servidor SMTP local com STARTTLS e AUTH, para cada número de conexões informado.
+São reportadas as mensagens e os bytes por segundo e os percentis da latência de envio de cada mensagem. A latência e
+as falhas temporárias (4xx) do servidor podem ser simuladas, para medir o efeito da concorrência, da reutilização das
+sessões e do limitador de taxa.
+
+Uso, a partir do diretório raiz do projeto:
+    python benchmarks/bench_envio_smtp.py --mensagens 200 --conexoes 1 2 4 8 --latencia-ms 50 --taxa-falhas 0.02
+"""
+
+import argparse
+import functools
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(root_dir / 'src'))
+
+import email_sender  # noqa: E402
+from servidor_smtp import ServidorSMTP  # noqa: E402
+
+template_html = root_dir / 'data/input/html_templates/alerta_usuario.html'
+logo = root_dir / 'data/input/images/logoSAAT_email.png'
+
+USUARIO = 'bench'
+SENHA = 'senha'
+
+
+class SessaoCronometrada(email_sender.SessaoSMTP):
+    """Sessão SMTP que registra a duração de cada envio, incluindo a espera pelo limitador e as reconexões"""
+    latencias = []
+    lock = threading.Lock()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        inicio = time.perf_counter()
+        try:
+            return super().sendmail(from_addr, to_addrs, msg)
+        finally:
+            with SessaoCronometrada.lock:
+                SessaoCronometrada.latencias.append(time.perf_counter() - inicio)
+
+
+def construtores(n: int, anexos: list[Path], cache_mime: email_sender.CacheMIME) -> list:
+    return [functools.partial(email_sender.EmailMessageHTML,
+                              destinatario=f'usuario{i}@economia.gov.br',
+                              sender_email='remetente@economia.gov.br',
+                              assunto='Benchmark',
+                              template_html=template_html,
+                              template_campos={},
+                              anexos=anexos,
+                              imagens=logo,
+                              cache_mime=cache_mime)
+            for i in range(n)]
+
+
+def percentis(latencias: list[float]) -> tuple[float, float, float]:
+    if len(latencias) < 2:
+        return (latencias[0] * 1000,) * 3 if latencias else (0.0, 0.0, 0.0)
+    cortes = statistics.quantiles(latencias, n=100, method='inclusive')
+    return cortes[49] * 1000, cortes[94] * 1000, cortes[98] * 1000
+
+
+def mede(args: argparse.Namespace, conexoes: int, anexos: list[Path]) -> dict:
+    SessaoCronometrada.latencias = []
+
+    with ServidorSMTP(tls=True,
+                      usuario=USUARIO,
+                      senha=SENHA,
+                      latencia=args.latencia_ms / 1000,
+                      taxa_falhas=args.taxa_falhas,
+                      codigo_falha=args.codigo_falha,
+                      semente=0) as servidor:
+        servidor.iniciar()
+
+        limitador = None
+        if args.mensagens_por_minuto:
+            limitador = email_sender.LimitadorTaxa(args.mensagens_por_minuto, rajada=conexoes)
+        criar_sessao = functools.partial(SessaoCronometrada, USUARIO, SENHA, '127.0.0.1', servidor.porta,
+                                         ssl_context=servidor.contexto_cliente(),
+                                         limitador=limitador)
+
+        inicio = time.perf_counter()
+        with email_sender.DespachanteSMTP(criar_sessao, conexoes=conexoes) as despachante:
+            resultados = despachante.despachar(construtores(args.mensagens, anexos, email_sender.CacheMIME()))
+            conexoes_abertas = despachante.conexoes_abertas
+        tempo = time.perf_counter() - inicio
+
+        p50, p95, p99 = percentis(SessaoCronometrada.latencias)
+        return {'conexoes': conexoes,
+                'enviadas': sum(resultado.sucesso for resultado in resultados),
+                'falhas': sum(not resultado.sucesso for resultado in resultados),
+                'conexoes_abertas': conexoes_abertas,
+                'mensagens_s': servidor.mensagens / tempo,
+                'mb_s': servidor.bytes_recebidos / tempo / 1024 ** 2,
+                'p50': p50, 'p95': p95, 'p99': p99}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mensagens', type=int, default=200, help='Número de mensagens enviadas')
+    parser.add_argument('--anexos', type=int, default=3, help='Número de anexos PDF por mensagem')
+    parser.add_argument('--tamanho-kb', type=int, default=150, help='Tamanho de cada anexo, em KB')
+    parser.add_argument('--conexoes', type=int, nargs='+', default=[1, 2, 4, 8], help='Números de conexões')
+    parser.add_argument('--latencia-ms', type=float, default=50, help='Atraso do servidor na resposta ao DATA, em ms')
+    parser.add_argument('--taxa-falhas', type=float, default=0, help='Fração das mensagens recusadas com 4xx')
+    parser.add_argument('--codigo-falha', type=int, default=451, help='Código das falhas injetadas (ex.: 451, 421)')
+    parser.add_argument('--mensagens-por-minuto', type=float, help='Taxa do limitador. Se omitida, sem limitador')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        anexos = []
+        for i in range(args.anexos):
+            anexo = Path(temp_dir) / f'cat{i}.pdf'
+            anexo.write_bytes(os.urandom(args.tamanho_kb * 1024))
+            anexos.append(anexo)
+
+        print(f'{args.mensagens} mensagens com {args.anexos} x {args.tamanho_kb} KB, latência de '
+              f'{args.latencia_ms:.0f} ms e {args.taxa_falhas:.0%} de falhas {args.codigo_falha}')
+        print(f'{"conexões":>8} {"enviadas":>8} {"falhas":>6} {"abertas":>7} {"msg/s":>8} {"MB/s":>7} '
+              f'{"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7}')
+        for conexoes in args.conexoes:
+            r = mede(args, conexoes, anexos)
+            print(f'{r["conexoes"]:>8} {r["enviadas"]:>8} {r["falhas"]:>6} {r["conexoes_abertas"]:>7} '
+                  f'{r["mensagens_s"]:>8.1f} {r["mb_s"]:>7.2f} {r["p50"]:>7.1f} {r["p95"]:>7.1f} {r["p99"]:>7.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark da geração dos PDFs das CATs: folha de estilos interpretada a cada documento (CSS embutido no HTML,
+como na versão anterior do template) versus folha de estilos e configuração de fontes compartilhadas pelo
+RenderizadorPDF.
+
+Uso, a partir do diretório raiz do projeto:
+    python benchmarks/bench_renderizador_pdf.py --n 1000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(root_dir / 'src'))
+
+import weasyprint  # noqa: E402
+import acidentes  # noqa: E402
+
+html_template = root_dir / 'data/input/html_templates/cat.html'
+logo = root_dir / 'data/input/images/logoSIT.png'
+
+
+def campos_cat(i: int) -> dict:
+    return {'meta_nr_recibo': f'1.2.{i:019d}',
+            'DTEmissaoCAT': '01/08/2022',
+            'nmtrab': 'Trabalhador de Teste',
+            'obsCAT': 'Observação da CAT ' * 20}
+
+
+def renderiza_css_por_documento(renderizador: acidentes.RenderizadorPDF, css: str, campos: dict) -> bytes:
+    html = renderizador.html(campos).replace('</head>', f'<style>{css}</style></head>', 1)
+    return weasyprint.HTML(string=html,
+                           base_url=renderizador.base_url,
+                           url_fetcher=renderizador._url_fetcher).write_pdf()
+
+
+def renderiza_css_compartilhado(renderizador: acidentes.RenderizadorPDF, css: str, campos: dict) -> bytes:
+    return renderizador.pdf(campos)
+
+
+def mede(funcao, renderizador: acidentes.RenderizadorPDF, css: str, n: int) -> float:
+    funcao(renderizador, css, campos_cat(0))  # Aquecimento
+
+    inicio = time.perf_counter()
+    for i in range(n):
+        funcao(renderizador, css, campos_cat(i))
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=1000, help='Número de documentos')
+    args = parser.parse_args()
+
+    renderizador = acidentes.RenderizadorPDF(html_template, logo)
+    css = html_template.with_suffix('.css').read_text(encoding='utf-8')
+
+    t_antes = mede(renderiza_css_por_documento, renderizador, css, args.n)
+    t_depois = mede(renderiza_css_compartilhado, renderizador, css, args.n)
+
+    print(f'Documentos: {args.n}')
+    print(f'CSS interpretado a cada documento: {t_antes:.1f} s ({1000 * t_antes / args.n:.1f} ms/documento)')
+    print(f'CSS e fontes compartilhados:       {t_depois:.1f} s ({1000 * t_depois / args.n:.1f} ms/documento)')
+    print(f'Economia por documento: {1000 * (t_antes - t_depois) / args.n:.1f} ms '
+          f'({100 * (1 - t_depois / t_antes):.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
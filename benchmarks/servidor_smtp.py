@@ -0,0 +1,236 @@
+"""Servidor SMTP local, que descarta as mensagens recebidas, utilizado nos benchmarks de envio de e-mails. Suporta
+STARTTLS, com certificado autoassinado gerado pelo openssl, e AUTH (PLAIN e LOGIN), como o servidor de produção, e
+permite injetar latência e falhas temporárias (4xx) nas respostas ao comando DATA.
+
+Uso, a partir do diretório raiz do projeto:
+    python benchmarks/servidor_smtp.py --porta 8025 --tls --usuario bench --senha senha --latencia-ms 50
+"""
+
+import argparse
+import base64
+import random
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+def gerar_certificado(diretorio: Path) -> tuple[Path, Path]:
+    """Gera, com o openssl, um certificado autoassinado válido para localhost e 127.0.0.1.
+
+    Args:
+        diretorio: Diretório onde são gravados o certificado e a chave
+
+    Returns:
+        Tupla com os locais do certificado e da chave
+    """
+    certificado = Path(diretorio) / 'certificado.pem'
+    chave = Path(diretorio) / 'chave.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-keyout', str(chave), '-out', str(certificado), '-subj', '/CN=localhost',
+                    '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'],
+                   check=True, capture_output=True)
+    return certificado, chave
+
+
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    def responder(self, linha: str):
+        self.wfile.write(f'{linha}\r\n'.encode('ascii'))
+
+    def receber_dados(self) -> int:
+        tamanho = 0
+        while (linha := self.rfile.readline()) not in (b'.\r\n', b''):
+            tamanho += len(linha)
+        return tamanho
+
+    def iniciar_tls(self):
+        self.responder('220 Ready to start TLS')
+        self.request = self.server.contexto_tls.wrap_socket(self.request, server_side=True)
+        self.rfile = self.request.makefile('rb')
+        self.wfile = self.request.makefile('wb', buffering=0)
+        self.tls = True
+        self.autenticado = False
+
+    def credenciais(self, mecanismo: bytes, argumento: bytes) -> tuple[str, str]:
+        if mecanismo == b'PLAIN':
+            if not argumento:
+                self.responder('334 ')
+                argumento = self.rfile.readline().strip()
+            _, usuario, senha = base64.b64decode(argumento).split(b'\0', 2)
+        else:
+            if not argumento:
+                self.responder('334 VXNlcm5hbWU6')
+                argumento = self.rfile.readline().strip()
+            usuario = base64.b64decode(argumento)
+            self.responder('334 UGFzc3dvcmQ6')
+            senha = base64.b64decode(self.rfile.readline().strip())
+        return usuario.decode(), senha.decode()
+
+    def autenticar(self, argumentos: bytes):
+        mecanismo, _, argumento = argumentos.partition(b' ')
+        if mecanismo.upper() not in (b'PLAIN', b'LOGIN'):
+            self.responder('504 Unrecognized authentication type')
+            return
+        if self.credenciais(mecanismo.upper(), argumento) == (self.server.usuario, self.server.senha):
+            self.autenticado = True
+            self.responder('235 Authentication successful')
+        else:
+            self.responder('535 Authentication credentials invalid')
+
+    def handle(self):
+        servidor = self.server
+        self.tls = False
+        self.autenticado = servidor.usuario is None
+
+        self.responder('220 localhost ESMTP')
+        while linha := self.rfile.readline():
+            comando, _, argumentos = linha.strip().partition(b' ')
+            comando = comando.upper()
+
+            if comando == b'EHLO':
+                extensoes = ['8BITMIME']
+                if servidor.contexto_tls is not None and not self.tls:
+                    extensoes.append('STARTTLS')
+                if servidor.usuario is not None and (self.tls or servidor.contexto_tls is None):
+                    extensoes.append('AUTH PLAIN LOGIN')
+                self.responder('250-localhost')
+                for extensao in extensoes[:-1]:
+                    self.responder(f'250-{extensao}')
+                self.responder(f'250 {extensoes[-1]}')
+            elif comando == b'STARTTLS' and servidor.contexto_tls is not None and not self.tls:
+                self.iniciar_tls()
+            elif comando == b'AUTH' and servidor.usuario is not None:
+                self.autenticar(argumentos)
+            elif comando == b'MAIL' and not self.autenticado:
+                self.responder('530 Authentication required')
+            elif comando in (b'HELO', b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self.responder('250 OK')
+            elif comando == b'DATA':
+                self.responder('354 End data with <CR><LF>.<CR><LF>')
+                tamanho = self.receber_dados()
+                if servidor.latencia:
+                    time.sleep(servidor.latencia)
+                if servidor.sortear_falha():
+                    self.responder(f'{servidor.codigo_falha} Temporary failure, try again later')
+                    if servidor.codigo_falha == 421:
+                        break
+                else:
+                    servidor.registrar(tamanho)
+                    self.responder('250 OK')
+            elif comando == b'QUIT':
+                self.responder('221 Bye')
+                break
+            else:
+                self.responder('502 Command not implemented')
+
+
+class ServidorSMTP(socketserver.ThreadingTCPServer):
+    """Servidor SMTP que aceita e descarta as mensagens, contabilizando o número de mensagens e de bytes recebidos e
+    de falhas injetadas.
+
+    Args:
+        endereco: Endereço e porta do servidor. Com a porta 0, é utilizada uma porta livre
+        tls: Se True, oferece STARTTLS, com certificado autoassinado gerado na inicialização
+        usuario: Usuário aceito no AUTH. Se informado, o envio exige autenticação
+        senha: Senha aceita no AUTH
+        latencia: Atraso, em segundos, na resposta a cada comando DATA
+        taxa_falhas: Fração das mensagens recusadas com resposta temporária
+        codigo_falha: Código da resposta temporária (ex.: 451; com 421, a conexão é encerrada)
+        semente: Semente do sorteio das falhas, para execuções reprodutíveis
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self,
+                 endereco: tuple[str, int] = ('127.0.0.1', 0),
+                 tls: bool = False,
+                 usuario: str | None = None,
+                 senha: str | None = None,
+                 latencia: float = 0.0,
+                 taxa_falhas: float = 0.0,
+                 codigo_falha: int = 451,
+                 semente: int | None = None):
+        super().__init__(endereco, _SessaoSMTP)
+        self.usuario = usuario
+        self.senha = senha
+        self.latencia = latencia
+        self.taxa_falhas = taxa_falhas
+        self.codigo_falha = codigo_falha
+        self.mensagens = 0
+        self.bytes_recebidos = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+        self._aleatorio = random.Random(semente)
+
+        self.certificado = None
+        self.contexto_tls = None
+        self._temp_dir = None
+        if tls:
+            self._temp_dir = tempfile.TemporaryDirectory()
+            self.certificado, chave = gerar_certificado(Path(self._temp_dir.name))
+            self.contexto_tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.contexto_tls.load_cert_chain(self.certificado, chave)
+
+    @property
+    def porta(self) -> int:
+        return self.server_address[1]
+
+    def contexto_cliente(self) -> ssl.SSLContext:
+        """Contexto SSL, para os clientes, que confia no certificado autoassinado do servidor"""
+        return ssl.create_default_context(cafile=self.certificado)
+
+    def registrar(self, tamanho: int):
+        with self._lock:
+            self.mensagens += 1
+            self.bytes_recebidos += tamanho
+
+    def sortear_falha(self) -> bool:
+        with self._lock:
+            falha = self._aleatorio.random() < self.taxa_falhas
+            self.falhas += falha
+        return falha
+
+    def iniciar(self) -> 'ServidorSMTP':
+        """Atende as conexões em uma thread em segundo plano"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def server_close(self):
+        super().server_close()
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+
+    def __exit__(self, *args):
+        self.shutdown()
+        super().__exit__(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--porta', type=int, default=8025, help='Porta do servidor')
+    parser.add_argument('--tls', action='store_true', help='Oferece STARTTLS')
+    parser.add_argument('--usuario', help='Usuário exigido no AUTH')
+    parser.add_argument('--senha', help='Senha exigida no AUTH')
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Atraso na resposta ao DATA, em ms')
+    parser.add_argument('--taxa-falhas', type=float, default=0, help='Fração das mensagens recusadas com 4xx')
+    parser.add_argument('--codigo-falha', type=int, default=451, help='Código das falhas injetadas')
+    args = parser.parse_args()
+
+    with ServidorSMTP(('127.0.0.1', args.porta),
+                      tls=args.tls,
+                      usuario=args.usuario,
+                      senha=args.senha,
+                      latencia=args.latencia_ms / 1000,
+                      taxa_falhas=args.taxa_falhas,
+                      codigo_falha=args.codigo_falha) as servidor:
+        print(f'Servidor SMTP em 127.0.0.1:{servidor.porta}')
+        if servidor.certificado is not None:
+            print(f'Certificado: {servidor.certificado}')
+        servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
 from .acidentes import *
 from . import helpers_consequencia
 from .helpers_fator_risco import reshape_fatores_params
+from .cubo import cubo_atualizar, cubo_carregar, cubo_fatiar, cubo_contar, cubo_agregar
+from .pdf_lote import planejar_anexos, planejar_pdf_unico, cat_to_pdf_lote
+from .renderizador_pdf import RenderizadorPDF
+from .cache_pdf import CachePDF
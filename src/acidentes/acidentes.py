@@ -1,6 +1,6 @@
 """Módulo com funções para extrair e tratar e salvar em PDF dados das CATs"""
-import filecmp
 import functools
+import hashlib
 from functools import reduce, partial
 import pandas as pd
 from datetime import datetime, timedelta
@@ -8,12 +8,38 @@ import sqlalchemy
 import numpy as np
 import os
 from pathlib import Path
-from jinja2 import Template
-import weasyprint
-import shutil
+import backup
 from . import helpers_consequencia
 from . import helpers_vpn as vpn
 from .helpers_format_identificadores import format_cnae, format_cbo, format_nrinsc, format_cpf
+from .cubo import cubo_atualizar
+from .renderizador_pdf import cat_template, cat_renderizador, campos_template, gravar_pdf
+from .cache_pdf import CachePDF
+
+# Coluna com o html pré-renderizado da linha de cada CAT na tabela de resumo dos alertas (ver cat_resumo_html)
+COLUNA_RESUMO_HTML = 'resumo_html'
+
+# Títulos das colunas da tabela de resumo dos alertas (ver cat_tabela_resumo)
+COLUNAS_TABELA_RESUMO = ['Número da CAT', 'Tipo', 'Consequências', 'Fatores de risco', 'Local do Acidente']
+
+
+def ultima_execucao(log_execucoes: Path) -> pd.Series | None:
+    """Identifica, no log de execuções, o registro da execução em que foi baixada a CAT mais recente. As partições do
+    log são lidas da mais recente para a mais antiga, até a primeira com CAT baixada.
+
+    Args:
+        log_execucoes: Path do arquivo .csv contendo o log de execuções do script.
+
+    Returns:
+        Pandas Series com o registro da execução ou None, se nenhuma CAT tiver sido baixada
+    """
+    for df_log_execucoes in backup.ler_log_recentes(log_execucoes, dtype='object'):
+        df_log_execucoes = df_log_execucoes.fillna('')
+        df_log_execucoes = df_log_execucoes[df_log_execucoes.ultima_cat_baixada != '']
+        if not df_log_execucoes.empty:
+            ultima_cat = df_log_execucoes.ultima_cat_baixada.max()
+            return df_log_execucoes[df_log_execucoes.ultima_cat_baixada == ultima_cat].iloc[-1]
+    return None
 
 
 def cat_extrair(log_execucoes: Path) -> pd.DataFrame:
@@ -27,21 +53,13 @@ def cat_extrair(log_execucoes: Path) -> pd.DataFrame:
     """
     sete_dias_atras = (datetime.now() - timedelta(days=7)).strftime('%Y%m%d')
 
-    if os.path.exists(log_execucoes):
-        df_log_execucoes = pd.read_csv(log_execucoes)
-        ultima_cat = df_log_execucoes.ultima_cat_baixada.fillna('').max()
-        if ultima_cat != '':
-            query = f"""
-                SELECT *
-                FROM [DBCAT].[dbo].[TBCAT_eSocial]
-                WHERE meta_nr_recibo > '{ultima_cat}'
-                """
-        else:
-            query = f"""
-                SELECT *
-                FROM [DBCAT].[dbo].[TBCAT_eSocial]
-                WHERE LEFT(meta_row_key, 8) >= {sete_dias_atras}
-                """
+    execucao = ultima_execucao(log_execucoes)
+    if execucao is not None:
+        query = f"""
+            SELECT *
+            FROM [DBCAT].[dbo].[TBCAT_eSocial]
+            WHERE meta_nr_recibo > '{execucao.ultima_cat_baixada}'
+            """
 
     else:
         query = f"""
@@ -470,7 +488,8 @@ def cat_tratadas(vpn_path: str,
                  url_test_connection: str,
                  log_execucoes: Path,
                  aux_tables_dir: Path,
-                 fatores_risco: dict):
+                 fatores_risco: dict,
+                 cubo_path: Path | None = None):
 
     # Tenta conectar à VPN
     vpn.try_connection_forticlient_vpn(vpn_path=vpn_path,
@@ -483,9 +502,8 @@ def cat_tratadas(vpn_path: str,
 
     # Erro por ausência de carga de novas CATs
     if cats.empty:
-        if os.path.exists(log_execucoes):
-            df_log_execucoes = pd.read_csv(log_execucoes, dtype='object').fillna('')
-            ultima_cat = df_log_execucoes[df_log_execucoes.ultima_cat_baixada == df_log_execucoes.ultima_cat_baixada.max()].squeeze()
+        ultima_cat = ultima_execucao(log_execucoes)
+        if ultima_cat is not None:
             sem_cat_msg = (
                 'Não há novos registros no banco de dados das CATs.'
                 f' A CAT {ultima_cat.ultima_cat_baixada}, de {ultima_cat.dt_ultima_cat_baixada}, é a mais recente no banco.')
@@ -530,55 +548,132 @@ def cat_tratadas(vpn_path: str,
 
     cats_tratadas = reduce(lambda x, y: y(x), functions_list, cats)
 
+    # Atualiza o cubo de contagens com o novo lote de CATs
+    if cubo_path:
+        cubo_atualizar(cubo_path, cats_tratadas)
+
     return cats_tratadas
 
 
-def cat_to_pdf(series: pd.Series,
+def cat_contextos(df_cat: pd.DataFrame, campos: frozenset[str] | None = None) -> list[dict]:
+    """ Prepara, em lote, os dados das CATs para apresentação no PDF, em uma única passagem de fillna e to_dict sobre
+    as colunas utilizadas pelo template.
+
+    Args:
+        df_cat: DataFrame com os dados das CATs
+        campos: Campos utilizados pelo template (ver campos_template). Se não informados, são incluídas todas as colunas
+
+    Returns:
+        Lista com o dicionário de campos a serem preenchidos no template, para cada CAT
+    """
+    colunas = [col for col in df_cat.columns
+               if col != COLUNA_RESUMO_HTML and (campos is None or col in campos or col == 'meta_nr_recibo')]
+    df = df_cat[colunas].fillna('N/A')
+
+    if 'idade_DTAcidente' in df:
+        df['idade_DTAcidente'] = df['idade_DTAcidente'].map(lambda idade: idade if idade == 'N/A' else int(idade))
+
+    return df.to_dict('records')
+
+
+def cat_campos(series: pd.Series) -> dict:
+    """ Prepara os dados da CAT para apresentação no PDF.
+
+    Args:
+        series: Series com os dados da CAT
+
+    Returns:
+        Dicionário com os campos a serem preenchidos no template
+    """
+    return cat_contextos(series.to_frame().T)[0]
+
+
+def cat_to_pdf(cat: pd.Series | dict,
                html_template: Path,
                logo: Path,
-               output_dir: Path | None = None):
+               output_dir: Path | None = None,
+               cache: CachePDF | None = None) -> bytes | None:
     """ Gera um PDF para a CAT.
 
     Args:
-        series: Series com os dados da CAT
+        cat: Dicionário com os campos da CAT, já preparados para o template (ver cat_contextos), ou Series com os dados
+            da CAT
         html_template: Local do template HTML.
         logo:  Local do logo para ser inserido no template
-        output_dir: Diretório de destino do arquivo PDF
+        output_dir: Diretório de destino do arquivo PDF. Se não informado, o PDF é retornado em bytes
+        cache: Cache persistente de PDFs, consultado antes da renderização
 
+    Returns:
+        Bytes do PDF, caso output_dir não seja informado
     """
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    renderizador = cat_renderizador(html_template, logo)
+    campos = cat if isinstance(cat, dict) else cat_contextos(cat.to_frame().T, renderizador.campos)[0]
+
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        pdf_path = output_dir / f'{campos["meta_nr_recibo"]}.pdf'
+        if os.path.isfile(pdf_path):
+            return None
+    else:
+        pdf_path = None
 
-    nr_recibo = series.meta_nr_recibo
+    if cache is None:
+        # Preenche o template com os dados da CAT e transforma o html em pdf, em memória
+        return renderizador.pdf(campos, pdf_path)
 
-    html_path = output_dir / f'{nr_recibo}.html' if output_dir else f'{nr_recibo}.html'
-    pdf_path = output_dir / f'{nr_recibo}.pdf' if output_dir else f'{nr_recibo}.pdf'
+    chave = cache.chave(campos, renderizador.versao)
+    pdf = cache.get(chave)
+    if pdf is None:
+        pdf = renderizador.pdf(campos)
+        cache.put(chave, pdf)
 
-    # Copia a logo para o diretório de destino, de modo a permitir a geração do pdf
-    if os.path.isfile(output_dir / logo.name):
-        if not filecmp.cmp(logo, output_dir / logo.name, shallow=True):
-            shutil.copy(logo, output_dir / logo.name)
-    else:
-        shutil.copy(logo, output_dir / logo.name)
+    if pdf_path is None:
+        return pdf
 
-    if not os.path.isfile(pdf_path):
-        # Tratamento de dados para apresentação no PDF
-        series = series.fillna('N/A')
-        if series.idade_DTAcidente != 'N/A':
-            series['idade_DTAcidente'] = int(series.idade_DTAcidente)
+    gravar_pdf(pdf_path, pdf)
+
+
+def cat_pdf_unico_path(output_dir: Path, df_cat: pd.DataFrame) -> Path:
+    """ Retorna o local do PDF único contendo as CATs informadas. O nome do arquivo depende somente do conjunto de
+    CATs, de modo que destinatários com as mesmas CATs compartilhem o mesmo arquivo.
+
+    Args:
+        output_dir: Diretório de destino do arquivo PDF
+        df_cat: DataFrame com os dados das CATs.
+
+    Returns:
+        Path do arquivo PDF
+    """
+    recibos = '|'.join(sorted(df_cat.meta_nr_recibo))
+    return output_dir / f'CATs {hashlib.sha1(recibos.encode("utf-8")).hexdigest()[:10]}.pdf'
 
-        # carrega template html
-        with open(html_template, 'r', encoding='utf-8') as f:
-            template = Template(f.read())
 
-        # Preenche o template com os dados da CAT
-        cat_html = template.render({col: series[col] for col in series.index} | {'logo_path': logo.name})
-        with open(html_path, 'w', encoding="utf-8") as file:
-            file.write(cat_html)
+def cat_to_pdf_unico(df_cat: pd.DataFrame,
+                     html_template: Path,
+                     logo: Path,
+                     output_dir: Path,
+                     limite_cats: int | None = None) -> Path:
+    """ Gera um único PDF, com um marcador por CAT, contendo todas as CATs informadas.
 
-        # Transforma o html em pdf
-        weasyprint.HTML(html_path, encoding="utf-8").write_pdf(pdf_path)
+    Args:
+        df_cat: DataFrame com os dados das CATs.
+        html_template: Local do template HTML.
+        logo:  Local do logo para ser inserido no template
+        output_dir: Diretório de destino do arquivo PDF
+        limite_cats: Número máximo de CATs incluídas no PDF, de modo a limitar o tamanho do arquivo
 
-        os.remove(html_path)
+    Returns:
+        Path do arquivo PDF
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    pdf_path = cat_pdf_unico_path(output_dir, df_cat)
+
+    if not os.path.isfile(pdf_path):
+        cats = df_cat.head(limite_cats) if limite_cats else df_cat
+        renderizador = cat_renderizador(html_template, logo)
+        renderizador.pdf_unico(cat_contextos(cats, renderizador.campos), pdf_path)
+
+    return pdf_path
 
 
 def cat_tabela_resumo(df_cat: pd.DataFrame) -> pd.DataFrame:
@@ -606,3 +701,52 @@ def cat_tabela_resumo(df_cat: pd.DataFrame) -> pd.DataFrame:
                            'CDFatorAmbiental': 'Fatores de risco'}))
 
     return df
+
+
+def cat_resumo_html(df_cat: pd.DataFrame) -> pd.Series:
+    """Renderiza, em uma única passagem, a linha (<tr>) de cada CAT na tabela de resumo dos alertas, no mesmo formato
+    de DataFrame.to_html. O resultado é armazenado na coluna COLUNA_RESUMO_HTML, para que a tabela de cada alerta seja
+    montada pela concatenação das linhas já renderizadas (ver cat_tabela_resumo_html).
+
+    Args:
+        df_cat: DataFrame com os dados das CATs.
+
+    Returns:
+        Series com o html da linha de cada CAT
+    """
+    df = cat_tabela_resumo(df_cat)
+
+    linhas = pd.Series('    <tr>\n', index=df.index, dtype=object)
+    for coluna in df.columns:
+        texto = df[coluna].astype(str)
+        # Como em DataFrame.to_html, os valores ausentes são apresentados como NaN, exceto None
+        texto[df[coluna].isna() & (texto == 'nan')] = 'NaN'
+        linhas = linhas + '      <td>' + texto + '</td>\n'
+
+    return linhas + '    </tr>\n'
+
+
+def cat_tabela_resumo_html(df_cat: pd.DataFrame) -> str:
+    """Gera o html da tabela de resumo das CATs, a ser inserida no corpo do email do alerta, a partir das linhas já
+    renderizadas na coluna COLUNA_RESUMO_HTML (ver cat_resumo_html). Na ausência da coluna, as linhas são renderizadas.
+    Equivale a cat_tabela_resumo(df_cat).to_html(index=False, escape=False).
+
+    Args:
+        df_cat: DataFrame com os dados das CATs.
+
+    Returns:
+        Tabela em html
+    """
+    linhas = df_cat[COLUNA_RESUMO_HTML] if COLUNA_RESUMO_HTML in df_cat else cat_resumo_html(df_cat)
+    cabecalho = ''.join(f'      <th>{coluna}</th>\n' for coluna in COLUNAS_TABELA_RESUMO)
+
+    return ('<table border="1" class="dataframe">\n'
+            '  <thead>\n'
+            '    <tr style="text-align: right;">\n'
+            f'{cabecalho}'
+            '    </tr>\n'
+            '  </thead>\n'
+            '  <tbody>\n'
+            f'{"".join(linhas)}'
+            '  </tbody>\n'
+            '</table>')
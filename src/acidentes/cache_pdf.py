@@ -0,0 +1,117 @@
+"""Módulo com o cache persistente, endereçado por conteúdo, dos PDFs das CATs"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+
+class CachePDF:
+    """Armazena os PDFs das CATs entre execuções, indexados pelo hash dos campos renderizados e da versão do template.
+    Os arquivos são gravados de forma atômica e removidos por idade (desde a gravação), por desuso (LRU) e por tamanho
+    total do cache.
+
+    Args:
+        diretorio: Diretório do cache
+        tamanho_max_mb: Tamanho máximo do cache, em MB. Os PDFs usados há mais tempo são removidos primeiro
+        idade_max_dias: Idade máxima, em dias, de cada PDF no cache
+    """
+    def __init__(self, diretorio: Path, tamanho_max_mb: float | None = None, idade_max_dias: float | None = None):
+        self.diretorio = Path(diretorio)
+        self.tamanho_max_mb = tamanho_max_mb
+        self.idade_max_dias = idade_max_dias
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def chave(campos: dict, versao_template: str) -> str:
+        """Calcula a chave do PDF a partir dos campos renderizados e da versão do template.
+
+        Args:
+            campos: Dicionário com os dados da CAT
+            versao_template: Identificador da versão do template
+
+        Returns:
+            Hash SHA-256, em hexadecimal
+        """
+        conteudo = json.dumps(campos, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f'{versao_template}\n{conteudo}'.encode('utf-8')).hexdigest()
+
+    def _path(self, chave: str) -> Path:
+        return self.diretorio / chave[:2] / f'{chave}.pdf'
+
+    def get(self, chave: str) -> bytes | None:
+        """Retorna o PDF armazenado para a chave, ou None se ele não estiver no cache.
+
+        Args:
+            chave: Chave do PDF, conforme o método chave
+
+        Returns:
+            Bytes do PDF
+        """
+        path = self._path(chave)
+        try:
+            with open(path, 'rb') as f:
+                pdf = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # Registra o último uso no horário de acesso, preservando o horário de gravação
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+        self.hits += 1
+        return pdf
+
+    def put(self, chave: str, pdf: bytes):
+        """Armazena o PDF no cache. A gravação é feita em arquivo temporário, renomeado ao final, de modo que leitores
+        concorrentes nunca encontrem um arquivo incompleto.
+
+        Args:
+            chave: Chave do PDF, conforme o método chave
+            pdf: Bytes do PDF
+        """
+        path = self._path(chave)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as f:
+            f.write(pdf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, path)
+
+    def limpar(self):
+        """Remove do cache os PDFs que excedem a idade máxima e, em seguida, os usados há mais tempo, até que o
+        tamanho total do cache respeite o limite."""
+        if not self.diretorio.is_dir():
+            return
+
+        agora = time.time()
+        arquivos = []
+        for path in self.diretorio.glob('*/*.pdf'):
+            stat = path.stat()
+            if self.idade_max_dias is not None and agora - stat.st_mtime > self.idade_max_dias * 86400:
+                path.unlink(missing_ok=True)
+            else:
+                arquivos.append((stat.st_atime, stat.st_size, path))
+
+        if self.tamanho_max_mb is not None:
+            tamanho_total = sum(tamanho for _, tamanho, _ in arquivos)
+            tamanho_max = self.tamanho_max_mb * 1024 ** 2
+            for _, tamanho, path in sorted(arquivos):
+                if tamanho_total <= tamanho_max:
+                    break
+                path.unlink(missing_ok=True)
+                tamanho_total -= tamanho
+
+    def estatisticas(self) -> dict:
+        """Retorna as estatísticas de uso do cache na execução corrente.
+
+        Returns:
+            Dicionário com o número de acertos, de falhas e a taxa de acerto
+        """
+        consultas = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'taxa_acerto': self.hits / consultas if consultas else 0.0}
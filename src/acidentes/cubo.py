@@ -0,0 +1,257 @@
+"""Módulo com funções para manter e consultar o cubo de contagens de CATs, agregadas por dia de emissão, UF, UORG,
+tipo de acidente, consequências, fatores de risco e Seção da CNAE"""
+
+import re
+from datetime import date, datetime
+from pathlib import Path
+import csv
+import os
+import pandas as pd
+
+# Dimensões do cubo. Os nomes das colunas coincidem com os da DataFrame de CATs tratadas, de modo que as funções do
+# módulo acidentes_filtrar possam ser aplicadas diretamente às células do cubo
+DIMENSOES = ['dia', 'sguf_local_acidente', 'uorg_local_acidente', 'tpacid', 'Consequencia', 'CDFatorAmbiental',
+             'secao_cnae_local_acidente']
+
+# Dimensões cujo valor é uma lista (um acidente pode ter mais de uma consequência e mais de um fator de risco)
+DIMENSOES_LISTA = ['Consequencia', 'CDFatorAmbiental']
+
+COLUNAS = DIMENSOES + ['qtd', 'ultimo_recibo']
+
+SEPARADOR_LISTA = '|'
+
+
+def _codigos_fatores_risco(fatores) -> list[str]:
+    """Extrai os códigos dos fatores de risco, que ao fim de cat_tratadas estão no formato '111 - Descrição<br>...'"""
+    if isinstance(fatores, list):
+        return sorted(fatores)
+    if pd.isna(fatores) or fatores == '':
+        return []
+    return sorted(re.findall(r'(?:^|<br>)([0-9]{3}) -', fatores))
+
+
+def cubo_indice_path(cubo_path: Path) -> Path:
+    """Local do índice das CATs contabilizadas no cubo, com a célula em que cada acidente foi contado"""
+    return Path(cubo_path).with_name(f'{Path(cubo_path).stem}_recibos.csv')
+
+
+def cubo_cats(df_cat: pd.DataFrame) -> pd.DataFrame:
+    """Obtém os valores das dimensões do cubo de cada acidente. Em caso de reabertura ou de comunicação de óbito, o
+    acidente é identificado pelo recibo da CAT original (ver acidentes.cat_identifica_recibo_raiz) e somente a última
+    CAT é mantida.
+
+    Args:
+        df_cat: DataFrame com os dados das CATs tratadas.
+
+    Returns:
+        DataFrame com as colunas das dimensões do cubo, o recibo da CAT e o recibo da CAT original
+    """
+    df = pd.DataFrame({
+        'dia': pd.to_datetime(df_cat['DTEmissaoCAT'], format='%d/%m/%Y', errors='coerce').dt.strftime('%Y-%m-%d'),
+        'sguf_local_acidente': df_cat['sguf_local_acidente'],
+        'uorg_local_acidente': df_cat['uorg_local_acidente'],
+        'tpacid': df_cat['tpacid'].apply(lambda x: '' if pd.isna(x) else str(int(x))),
+        'Consequencia': df_cat['Consequencia'].apply(lambda x: SEPARADOR_LISTA.join(x)),
+        'CDFatorAmbiental': df_cat['CDFatorAmbiental'].apply(lambda x: SEPARADOR_LISTA.join(_codigos_fatores_risco(x))),
+        'secao_cnae_local_acidente': df_cat['secao_cnae_local_acidente'],
+        'meta_nr_recibo': df_cat['meta_nr_recibo'],
+        'recibo_raiz': df_cat['recibo_raiz'] if 'recibo_raiz' in df_cat else df_cat['meta_nr_recibo'],
+    }).fillna('')
+
+    return (df
+            .sort_values('meta_nr_recibo')
+            .drop_duplicates('recibo_raiz', keep='last')
+            .reset_index(drop=True))
+
+
+def _agregar(cats: pd.DataFrame) -> pd.DataFrame:
+    return (cats
+            .groupby(DIMENSOES, dropna=False)
+            .agg(qtd=('meta_nr_recibo', 'size'), ultimo_recibo=('meta_nr_recibo', 'max'))
+            .reset_index())
+
+
+def cubo_celulas(df_cat: pd.DataFrame) -> pd.DataFrame:
+    """Agrega as CATs tratadas em células do cubo, com um único registro por acidente (ver cubo_cats).
+
+    As dimensões com múltiplos valores ('Consequencia' e 'CDFatorAmbiental') são mantidas como a combinação de valores
+    de cada CAT, de modo que cada CAT seja contada uma única vez e as agregações permaneçam exatas.
+
+    Args:
+        df_cat: DataFrame com os dados das CATs tratadas.
+
+    Returns:
+        DataFrame com as colunas das dimensões do cubo, a quantidade de CATs e o maior recibo de cada célula
+    """
+    return _agregar(cubo_cats(df_cat))
+
+
+def cubo_carregar(cubo_path: Path) -> pd.DataFrame:
+    """Carrega o cubo salvo em arquivo .csv. As dimensões com múltiplos valores são convertidas em listas.
+
+    Args:
+        cubo_path: Path do arquivo .csv contendo o cubo
+
+    Returns:
+        DataFrame com as células do cubo
+    """
+    if not os.path.isfile(cubo_path):
+        return pd.DataFrame(columns=COLUNAS).astype({'qtd': int})
+
+    cubo = pd.read_csv(cubo_path, dtype='object', keep_default_na=False)
+    cubo['qtd'] = cubo['qtd'].astype(int)
+    for col in DIMENSOES_LISTA:
+        cubo[col] = cubo[col].apply(lambda x: x.split(SEPARADOR_LISTA) if x else [])
+    cubo['tpacid'] = pd.to_numeric(cubo['tpacid'], errors='coerce')
+
+    return cubo
+
+
+def cubo_atualizar(cubo_path: Path, df_cat: pd.DataFrame) -> pd.DataFrame:
+    """Acrescenta ao cubo as CATs de um novo lote. CATs com recibo igual ou anterior ao último recibo já contabilizado
+    são ignoradas, de modo que o reprocessamento de um lote não duplique as contagens. A reabertura de uma CAT já
+    contabilizada substitui a contagem da CAT original, conforme o índice mantido ao lado do cubo (ver
+    cubo_indice_path), de modo que cada acidente seja contado uma única vez.
+
+    Args:
+        cubo_path: Path do arquivo .csv contendo o cubo. Deve ser incluindo o sufixo '.csv'
+        df_cat: DataFrame com os dados das CATs tratadas.
+
+    Returns:
+        DataFrame com as células do cubo atualizado
+    """
+    if cubo_path.suffix != '.csv':
+        raise ValueError('O argumento cubo_path deve conter o diretório e nome do arquivo a ser salvo, incluindo o sufixo .csv')
+    Path(cubo_path).parent.mkdir(parents=True, exist_ok=True)
+
+    if os.path.isfile(cubo_path):
+        cubo = pd.read_csv(cubo_path, dtype='object', keep_default_na=False)
+        cubo['qtd'] = cubo['qtd'].astype(int)
+    else:
+        cubo = pd.DataFrame(columns=COLUNAS)
+
+    indice_path = cubo_indice_path(cubo_path)
+    if os.path.isfile(indice_path):
+        indice = pd.read_csv(indice_path, dtype='object', keep_default_na=False)
+    else:
+        indice = pd.DataFrame(columns=['recibo_raiz'] + DIMENSOES)
+
+    if not cubo.empty:
+        df_cat = df_cat[df_cat['meta_nr_recibo'] > cubo['ultimo_recibo'].max()]
+
+    if not df_cat.empty:
+        cats = cubo_cats(df_cat)
+
+        # Acidentes já contabilizados são retirados das células em que foram contados
+        anteriores = indice[indice['recibo_raiz'].isin(cats['recibo_raiz'])]
+        if not anteriores.empty:
+            retirar = anteriores.groupby(DIMENSOES).size().rename('retirar').reset_index()
+            cubo = cubo.merge(retirar, on=DIMENSOES, how='left')
+            cubo['qtd'] -= cubo.pop('retirar').fillna(0).astype(int)
+            cubo = cubo[cubo['qtd'] > 0]
+
+        celulas = _agregar(cats)
+        cubo = celulas if cubo.empty else pd.concat([cubo, celulas])
+        cubo = (cubo
+                .groupby(DIMENSOES, dropna=False)
+                .agg(qtd=('qtd', 'sum'), ultimo_recibo=('ultimo_recibo', 'max'))
+                .reset_index()
+                .loc[:, COLUNAS])
+
+        cubo.to_csv(cubo_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+        indice = pd.concat([indice[~indice['recibo_raiz'].isin(cats['recibo_raiz'])],
+                            cats[['recibo_raiz'] + DIMENSOES]])
+        indice.to_csv(indice_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    return cubo_carregar(cubo_path)
+
+
+def _data_iso(data: str | date | datetime | None) -> str | None:
+    if data is None:
+        return None
+    return pd.Timestamp(data).strftime('%Y-%m-%d')
+
+
+def cubo_fatiar(cubo: pd.DataFrame,
+                dt_inicio: str | date | datetime | None = None,
+                dt_fim: str | date | datetime | None = None,
+                **filtros) -> pd.DataFrame:
+    """Seleciona as células do cubo que atendem aos filtros informados.
+
+    Args:
+        cubo: DataFrame com as células do cubo, conforme cubo_carregar
+        dt_inicio: Data de emissão inicial (inclusive)
+        dt_fim: Data de emissão final (inclusive)
+        **filtros: Valores aceitos para cada dimensão, informados como valor único ou lista (ex.:
+            sguf_local_acidente='MG', tpacid=[1, 2]). Nas dimensões com múltiplos valores, a célula é selecionada se
+            houver interseção com os valores informados.
+
+    Returns:
+        DataFrame com as células selecionadas
+    """
+    dimensoes_invalidas = set(filtros) - set(DIMENSOES)
+    if dimensoes_invalidas:
+        raise ValueError(f'Dimensões inexistentes no cubo: {dimensoes_invalidas}')
+
+    selecao = pd.Series(True, index=cubo.index)
+
+    if dt_inicio is not None:
+        selecao &= cubo['dia'] >= _data_iso(dt_inicio)
+    if dt_fim is not None:
+        selecao &= cubo['dia'] <= _data_iso(dt_fim)
+
+    for dimensao, valores in filtros.items():
+        if valores is None:
+            continue
+        valores = valores if isinstance(valores, (list, tuple, set)) else [valores]
+        if dimensao in DIMENSOES_LISTA:
+            selecao &= cubo[dimensao].apply(lambda x: not set(x).isdisjoint(valores))
+        else:
+            selecao &= cubo[dimensao].isin(valores)
+
+    return cubo[selecao]
+
+
+def cubo_contar(cubo: pd.DataFrame, **filtros) -> int:
+    """Conta as CATs das células do cubo que atendem aos filtros informados.
+
+    Args:
+        cubo: DataFrame com as células do cubo, conforme cubo_carregar
+        **filtros: Filtros aceitos por cubo_fatiar
+
+    Returns:
+        Quantidade de CATs
+    """
+    return int(cubo_fatiar(cubo, **filtros)['qtd'].sum())
+
+
+def cubo_agregar(cubo: pd.DataFrame, por: list[str], **filtros) -> pd.DataFrame:
+    """Agrega (roll-up) as contagens do cubo pelas dimensões informadas.
+
+    Quando a agregação é feita por uma dimensão com múltiplos valores, a CAT é contada uma vez para cada um de seus
+    valores (ex.: um acidente com óbito e amputação é contado em ambas as consequências).
+
+    Args:
+        cubo: DataFrame com as células do cubo, conforme cubo_carregar
+        por: Lista de dimensões pelas quais as contagens serão agregadas
+        **filtros: Filtros aceitos por cubo_fatiar
+
+    Returns:
+        DataFrame com as dimensões informadas e a quantidade de CATs
+    """
+    dimensoes_invalidas = set(por) - set(DIMENSOES)
+    if dimensoes_invalidas:
+        raise ValueError(f'Dimensões inexistentes no cubo: {dimensoes_invalidas}')
+
+    df = cubo_fatiar(cubo, **filtros)
+    for dimensao in por:
+        if dimensao in DIMENSOES_LISTA:
+            df = df.explode(dimensao)
+
+    return (df
+            .groupby(por, dropna=False)['qtd']
+            .sum()
+            .reset_index()
+            .sort_values(por)
+            .reset_index(drop=True))
@@ -0,0 +1,179 @@
+"""Módulo com funções para planejar e gerar, em paralelo, os PDFs das CATs que serão anexados aos alertas"""
+
+import math
+import multiprocessing
+import os
+import time
+from pathlib import Path
+import pandas as pd
+import weasyprint
+from . import acidentes
+from .cache_pdf import CachePDF
+
+try:
+    import resource
+except ImportError:  # Indisponível no Windows
+    resource = None
+
+# Parâmetros da renderização, definidos uma única vez em cada processo de trabalho
+_parametros_processo = {}
+
+
+def planejar_anexos(cats_destinatarios: list[pd.DataFrame], limite_anexos: int) -> pd.DataFrame:
+    """Identifica o conjunto, sem duplicidades, das CATs que serão efetivamente anexadas aos alertas. As CATs de
+    destinatários cujo número de acidentes excede o limite de anexos não são incluídas, pois não serão anexadas.
+
+    Args:
+        cats_destinatarios: Lista com as DataFrames das CATs filtradas para cada destinatário
+        limite_anexos: Número máximo de anexos por e-mail
+
+    Returns:
+        DataFrame com as CATs cujo PDF deve ser gerado
+    """
+    cats_anexadas = [cats for cats in cats_destinatarios if 0 < len(cats) <= limite_anexos]
+
+    if not cats_anexadas:
+        return pd.DataFrame(columns=['meta_nr_recibo'])
+
+    return (pd.concat(cats_anexadas)
+            .drop_duplicates(subset='meta_nr_recibo')
+            .reset_index(drop=True))
+
+
+def planejar_pdf_unico(cats_destinatarios: list[pd.DataFrame], limite_anexos: int) -> list[pd.DataFrame]:
+    """Identifica os conjuntos distintos de CATs dos destinatários cujo número de acidentes excede o limite de anexos,
+    para os quais é gerado um único PDF com todas as CATs.
+
+    Args:
+        cats_destinatarios: Lista com as DataFrames das CATs filtradas para cada destinatário
+        limite_anexos: Número máximo de anexos por e-mail
+
+    Returns:
+        Lista com as DataFrames das CATs de cada PDF único
+    """
+    conjuntos = {}
+    for cats in cats_destinatarios:
+        if len(cats) > limite_anexos:
+            conjuntos.setdefault(frozenset(cats.meta_nr_recibo), cats)
+
+    return list(conjuntos.values())
+
+
+def _inicializa_processo(html_template: Path,
+                         logo: Path,
+                         output_dir: Path,
+                         cache: CachePDF | None,
+                         memoria_max_mb: int | None):
+    """Prepara o processo de trabalho: limita a memória, compila o template e carrega as fontes do WeasyPrint"""
+    if memoria_max_mb and resource is not None:
+        limite = memoria_max_mb * 1024 ** 2
+        resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+
+    _parametros_processo.update({'html_template': html_template, 'logo': logo, 'output_dir': output_dir,
+                                 'cache': cache})
+
+    acidentes.cat_renderizador(html_template, logo)
+    weasyprint.HTML(string='<p style="font-family: Lato">.</p>').write_pdf()
+
+
+def _gera_pdf(campos: dict, html_template: Path, logo: Path, output_dir: Path, cache: CachePDF | None) -> str:
+    """Renderiza o PDF de uma CAT já procurada no cache, armazenando-o no cache e no diretório de destino"""
+    pdf = acidentes.cat_to_pdf(campos, html_template=html_template, logo=logo)
+
+    if cache is not None:
+        versao_template = acidentes.cat_renderizador(html_template, logo).versao
+        cache.put(cache.chave(campos, versao_template), pdf)
+
+    acidentes.gravar_pdf(output_dir / f'{campos["meta_nr_recibo"]}.pdf', pdf)
+
+    return campos['meta_nr_recibo']
+
+
+def _gera_pdf_processo(campos: dict) -> str:
+    return _gera_pdf(campos, **_parametros_processo)
+
+
+def cat_to_pdf_lote(cats: pd.DataFrame,
+                    html_template: Path,
+                    logo: Path,
+                    output_dir: Path,
+                    processos: int = 1,
+                    timeout: float | None = None,
+                    memoria_max_mb: int | None = None,
+                    cache: CachePDF | None = None) -> dict[str, bool]:
+    """Gera os PDFs de um conjunto de CATs em um pool de processos. Cada processo importa o WeasyPrint, compila o
+    template e carrega as fontes uma única vez, antes de receber as CATs.
+
+    Com tempo máximo informado, o lote tem um prazo único, de timeout segundos para cada rodada de CATs distribuídas
+    aos processos (ex.: 10 CATs em 4 processos, 3 rodadas). Ao fim do prazo, os processos são encerrados e as CATs
+    cujo PDF não foi gerado são informadas como falha. Mesmo com um único processo, as CATs são então geradas em
+    processo de trabalho, que pode ser encerrado.
+
+    Args:
+        cats: DataFrame com as CATs cujo PDF deve ser gerado
+        html_template: Local do template HTML.
+        logo: Local do logo para ser inserido no template
+        output_dir: Diretório de destino dos arquivos PDF
+        processos: Número de processos de trabalho. Com um único processo, e sem tempo máximo, os PDFs são gerados no
+            processo atual
+        timeout: Tempo máximo, em segundos, da geração do PDF de cada CAT, que determina o prazo do lote
+        memoria_max_mb: Limite de memória de cada processo de trabalho, em MB (não aplicável no Windows)
+        cache: Cache persistente de PDFs. As CATs encontradas no cache não são enviadas aos processos de trabalho
+
+    Returns:
+        Dicionário indicando, para cada número de recibo, se o PDF foi gerado com sucesso
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    # CATs cujo PDF já existe no diretório de destino não são geradas novamente. As demais são convertidas, em lote,
+    # nos campos utilizados pelo template, enviados aos processos de trabalho
+    resultado = {}
+    existentes = cats.meta_nr_recibo.map(lambda recibo: os.path.isfile(output_dir / f'{recibo}.pdf'))
+    resultado.update(dict.fromkeys(cats.meta_nr_recibo[existentes], True))
+    pendentes = acidentes.cat_contextos(cats[~existentes], acidentes.campos_template(html_template))
+
+    # CATs presentes no cache são gravadas diretamente no diretório de destino
+    if cache is not None:
+        versao_template = acidentes.cat_renderizador(html_template, logo).versao
+        nao_encontradas = []
+        for campos in pendentes:
+            pdf = cache.get(cache.chave(campos, versao_template))
+            if pdf is None:
+                nao_encontradas.append(campos)
+            else:
+                acidentes.gravar_pdf(output_dir / f'{campos["meta_nr_recibo"]}.pdf', pdf)
+                resultado[campos['meta_nr_recibo']] = True
+        pendentes = nao_encontradas
+
+    if not pendentes:
+        return resultado
+
+    if timeout is None and (processos <= 1 or len(pendentes) <= 1):
+        for campos in pendentes:
+            try:
+                _gera_pdf(campos, html_template=html_template, logo=logo, output_dir=output_dir, cache=cache)
+                resultado[campos['meta_nr_recibo']] = True
+            except Exception:
+                resultado[campos['meta_nr_recibo']] = False
+        return resultado
+
+    n_processos = max(1, min(processos, len(pendentes)))
+    pool = multiprocessing.Pool(processes=n_processos,
+                                initializer=_inicializa_processo,
+                                initargs=(html_template, logo, output_dir, cache, memoria_max_mb),
+                                maxtasksperchild=200)
+    try:
+        tarefas = [(campos['meta_nr_recibo'], pool.apply_async(_gera_pdf_processo, (campos,))) for campos in pendentes]
+        prazo = None if timeout is None else time.monotonic() + timeout * math.ceil(len(pendentes) / n_processos)
+        for recibo, tarefa in tarefas:
+            try:
+                tarefa.get(timeout=None if prazo is None else max(0.0, prazo - time.monotonic()))
+                resultado[recibo] = True
+            except Exception:
+                resultado[recibo] = False
+    finally:
+        # Encerra também os processos eventualmente travados após o timeout
+        pool.terminate()
+        pool.join()
+
+    return resultado
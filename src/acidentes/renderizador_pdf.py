@@ -0,0 +1,183 @@
+"""Módulo com o renderizador, em memória, dos PDFs das CATs"""
+
+import functools
+import hashlib
+import html
+import mimetypes
+import os
+import re
+import tempfile
+from pathlib import Path
+from urllib.parse import urljoin
+from jinja2 import Template, meta
+import weasyprint
+from weasyprint.text.fonts import FontConfiguration
+
+from utils import jinja_environment, jinja_template
+
+
+def cat_template(html_template: Path) -> Template:
+    """Retorna o template HTML da CAT, compilado pelo ambiente Jinja compartilhado, que o mantém em memória e em cache
+    de bytecode no disco.
+
+    Args:
+        html_template: Local do template HTML.
+
+    Returns:
+        Template compilado
+    """
+    return jinja_template(html_template)
+
+
+@functools.cache
+def campos_template(html_template: Path) -> frozenset[str]:
+    """Identifica os campos utilizados pelo template HTML da CAT, a partir da sua árvore sintática.
+
+    Args:
+        html_template: Local do template HTML.
+
+    Returns:
+        Conjunto com os nomes dos campos
+    """
+    html_template = Path(html_template).resolve()
+    ambiente = jinja_environment(html_template.parent)
+    fonte, _, _ = ambiente.loader.get_source(ambiente, html_template.name)
+    return frozenset(meta.find_undeclared_variables(ambiente.parse(fonte)))
+
+
+def gravar_pdf(pdf_path: Path, pdf: bytes):
+    """Grava o PDF em arquivo temporário, no mesmo diretório, renomeado ao final, de modo que o destino nunca contenha
+    um PDF incompleto, mesmo se o processo for encerrado durante a gravação (ex.: após o tempo máximo de geração).
+
+    Args:
+        pdf_path: Local do arquivo PDF de destino
+        pdf: Bytes do PDF
+    """
+    # O nome do arquivo temporário inclui o do destino, de modo que seja removido com os demais PDFs
+    with tempfile.NamedTemporaryFile(dir=Path(pdf_path).parent, prefix=f'.{Path(pdf_path).name}.', suffix='.tmp',
+                                     delete=False) as f:
+        f.write(pdf)
+    os.replace(f.name, pdf_path)
+
+
+class RenderizadorPDF:
+    """Renderiza CATs em PDF a partir do template compilado, sem arquivos HTML temporários. A logo é lida uma única
+    vez e servida ao WeasyPrint a partir da memória. A folha de estilos, localizada ao lado do template e com o mesmo
+    nome (ex.: cat.css), é interpretada uma única vez, com uma configuração de fontes compartilhada por todas as CATs.
+
+    Args:
+        html_template: Local do template HTML.
+        logo: Local do logo para ser inserido no template
+    """
+    def __init__(self, html_template: Path, logo: Path):
+        self.template = cat_template(html_template)
+        self.campos = campos_template(html_template)
+        self.logo = logo
+        self.base_url = Path(html_template).parent.resolve().as_uri() + '/'
+
+        with open(logo, 'rb') as f:
+            self._logo_bytes = f.read()
+        self._logo_url = urljoin(self.base_url, logo.name)
+        self._logo_mime_type = mimetypes.guess_type(logo.name)[0]
+
+        self.font_config = FontConfiguration()
+        css_path = Path(html_template).with_suffix('.css')
+        if css_path.is_file():
+            with open(css_path, 'rb') as f:
+                css_bytes = f.read()
+            self.stylesheets = [weasyprint.CSS(string=css_bytes.decode('utf-8'),
+                                               base_url=self.base_url,
+                                               font_config=self.font_config)]
+        else:
+            css_bytes = b''
+            self.stylesheets = []
+
+        # Versão do template, utilizada como parte da chave do cache de PDFs
+        with open(html_template, 'rb') as f:
+            self.versao = hashlib.sha256(f.read() + css_bytes + self._logo_bytes).hexdigest()
+
+    def _url_fetcher(self, url: str) -> dict:
+        if url == self._logo_url:
+            return {'string': self._logo_bytes, 'mime_type': self._logo_mime_type, 'redirected_url': url}
+        return weasyprint.default_url_fetcher(url)
+
+    @staticmethod
+    def _gravar(pdf: bytes, pdf_path: Path | None) -> bytes | None:
+        if pdf_path is None:
+            return pdf
+        gravar_pdf(pdf_path, pdf)
+
+    def html(self, campos: dict) -> str:
+        """Preenche o template com os dados da CAT.
+
+        Args:
+            campos: Dicionário com os dados da CAT
+
+        Returns:
+            String com o HTML da CAT
+        """
+        return self.template.render(campos | {'logo_path': self.logo.name})
+
+    def html_unico(self, lista_campos: list[dict]) -> str:
+        """Reúne as CATs em um único documento HTML, com uma seção por CAT. Cada seção inicia uma nova página e gera
+        um marcador (bookmark) no PDF.
+
+        Args:
+            lista_campos: Lista de dicionários com os dados de cada CAT
+
+        Returns:
+            String com o HTML das CATs
+        """
+        secoes = []
+        for campos in lista_campos:
+            corpo = re.search(r'<body>(.*)</body>', self.html(campos), flags=re.DOTALL).group(1)
+            marcador = html.escape(f'CAT {campos["meta_nr_recibo"]}', quote=True)
+            secoes.append(f'<section class="cat" data-bookmark="{marcador}">{corpo}</section>')
+
+        return f'<!DOCTYPE html>\n<html>\n<head></head>\n<body>\n{"".join(secoes)}\n</body>\n</html>\n'
+
+    def pdf(self, campos: dict, pdf_path: Path | None = None) -> bytes | None:
+        """Gera o PDF da CAT.
+
+        Args:
+            campos: Dicionário com os dados da CAT
+            pdf_path: Local do arquivo PDF de destino. Se não informado, o PDF é retornado em bytes
+
+        Returns:
+            Bytes do PDF, caso pdf_path não seja informado
+        """
+        documento = weasyprint.HTML(string=self.html(campos),
+                                    base_url=self.base_url,
+                                    url_fetcher=self._url_fetcher,
+                                    encoding='utf-8')
+        return self._gravar(documento.write_pdf(stylesheets=self.stylesheets, font_config=self.font_config), pdf_path)
+
+    def pdf_unico(self, lista_campos: list[dict], pdf_path: Path | None = None) -> bytes | None:
+        """Gera um único PDF, com várias páginas, contendo todas as CATs, em uma só etapa de diagramação.
+
+        Args:
+            lista_campos: Lista de dicionários com os dados de cada CAT
+            pdf_path: Local do arquivo PDF de destino. Se não informado, o PDF é retornado em bytes
+
+        Returns:
+            Bytes do PDF, caso pdf_path não seja informado
+        """
+        documento = weasyprint.HTML(string=self.html_unico(lista_campos),
+                                    base_url=self.base_url,
+                                    url_fetcher=self._url_fetcher,
+                                    encoding='utf-8')
+        return self._gravar(documento.write_pdf(stylesheets=self.stylesheets, font_config=self.font_config), pdf_path)
+
+
+@functools.cache
+def cat_renderizador(html_template: Path, logo: Path) -> RenderizadorPDF:
+    """Retorna o renderizador para o template e logo informados, mantido em memória para as chamadas seguintes.
+
+    Args:
+        html_template: Local do template HTML.
+        logo: Local do logo para ser inserido no template
+
+    Returns:
+        Renderizador dos PDFs das CATs
+    """
+    return RenderizadorPDF(html_template, logo)
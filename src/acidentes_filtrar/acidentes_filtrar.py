@@ -4,7 +4,7 @@ import re
 from functools import partial, reduce
 from pathlib import Path
 import pandas as pd
-import os
+import backup
 
 
 def uf(cats: pd.DataFrame, usuario: pd.Series) -> pd.DataFrame:
@@ -98,6 +98,23 @@ def consequencias(cats: pd.DataFrame, usuario: pd.Series) -> pd.DataFrame:
     return df[filtro_consequencias]
 
 
+def codigos_fatores_risco(fatores: list[str] | str) -> list[str]:
+    """Códigos dos fatores de risco da CAT, informados em lista (ex.: células do cubo de CATs) ou no formato
+    '111 - Descrição<br>...', obtido ao fim de acidentes.cat_tratadas
+
+    Args:
+        fatores: Lista de códigos ou string com os códigos e as descrições dos fatores de risco
+
+    Returns:
+        Lista com os códigos dos fatores de risco
+    """
+    if isinstance(fatores, list):
+        return fatores
+    if not isinstance(fatores, str):
+        return []
+    return re.findall(r'(?:^|<br>)([0-9]{3}) -', fatores)
+
+
 def risco(cats: pd.DataFrame, usuario: pd.Series) -> pd.DataFrame:
     """Filtra a DataFrame de CATs por fator de risco, de acordo com os critérios selecionados pelo usuário no
     formulário de inscrição
@@ -114,7 +131,7 @@ def risco(cats: pd.DataFrame, usuario: pd.Series) -> pd.DataFrame:
 
     df = cats.copy()
     lista_risco = re.findall(r'[0-9]{3}', usuario['Fatores de risco'])
-    filtro_risco = df['CDFatorAmbiental'].apply(lambda x: not set(x).isdisjoint(lista_risco))
+    filtro_risco = df['CDFatorAmbiental'].apply(lambda x: not set(codigos_fatores_risco(x)).isdisjoint(lista_risco))
     return df[filtro_risco]
 
 
@@ -138,6 +155,27 @@ def cnae(cats: pd.DataFrame, usuario: pd.Series) -> pd.DataFrame:
     return df[filtro_cnae]
 
 
+def ja_notificadas_log(log_alertas: Path, cats: pd.DataFrame) -> pd.DataFrame:
+    """Lê os alertas registrados no log que podem incluir as CATs informadas. Como um alerta é enviado somente após a
+    emissão da CAT, são lidas apenas as partições do log a partir da data de emissão da CAT mais antiga.
+
+    Args:
+        log_alertas: Path do log contendo os alertas anteriormente enviados
+        cats: DataFrame com as CATs
+
+    Returns:
+        DataFrame com os registros do log
+    """
+    if cats.empty:
+        return pd.DataFrame()
+
+    # As datas de emissão estão no formato 'dd/mm/yyyy' (ver acidentes.cat_formatar_datas)
+    emissao = (pd.to_datetime(cats['DTEmissaoCAT'], format='%d/%m/%Y', errors='coerce').min()
+               if 'DTEmissaoCAT' in cats else pd.NaT)
+    inicio = None if pd.isna(emissao) else emissao.date()
+    return backup.ler_log(log_alertas, inicio=inicio)
+
+
 def preferencias_usuario(cats: pd.DataFrame, usuario: pd.Series, log_alertas: Path):
     """Filtra CATs de acordo com as preferências do usuário
 
@@ -160,8 +198,8 @@ def preferencias_usuario(cats: pd.DataFrame, usuario: pd.Series, log_alertas: Pa
 
     cats_filtradas = reduce(lambda x, y: y(x), funcoes_filtra_cats_partial, cats)
 
-    if os.path.exists(log_alertas):
-        ja_notificadas = pd.read_csv(log_alertas)
+    ja_notificadas = ja_notificadas_log(log_alertas, cats_filtradas)
+    if not ja_notificadas.empty:
         ja_notificadas_recibo = (ja_notificadas[ja_notificadas.email == usuario['E-mail']]
                                  .meta_nr_recibo
                                  .to_list())
@@ -190,11 +228,36 @@ def preferencias_coordenador(cats: pd.DataFrame, coordenador: pd.Series, log_ale
 
     cats_filtradas = reduce(lambda x, y: y(x), funcoes_filtra_cats_partial, cats)
 
-    if os.path.exists(log_alertas):
-        ja_notificadas = pd.read_csv(log_alertas)
+    ja_notificadas = ja_notificadas_log(log_alertas, cats_filtradas)
+    if not ja_notificadas.empty:
         ja_notificadas_recibo = (ja_notificadas[ja_notificadas.email == coordenador['E-mail']]
                                  .meta_nr_recibo
                                  .to_list())
         cats_filtradas = cats_filtradas[~cats_filtradas.meta_nr_recibo.isin(ja_notificadas_recibo)]
 
     return cats_filtradas
+
+
+def contagem_preferencias(cubo: pd.DataFrame, usuario: pd.Series) -> int:
+    """Conta, a partir das células do cubo de CATs, quantos acidentes atendem às preferências do usuário, sem
+    percorrer as CATs individualmente. Útil para dimensionar o volume de alertas de uma inscrição.
+
+    Args:
+        cubo: DataFrame com as células do cubo de CATs, eventualmente já restritas a um período
+        usuario: Pandas Series com as preferências do usuário
+
+    Returns:
+        Quantidade de CATs que atendem às preferências do usuário
+    """
+    funcoes_filtra_cats = [uf,
+                           uorg,
+                           tpacid,
+                           consequencias,
+                           risco,
+                           cnae]
+
+    funcoes_filtra_cats_partial = [partial(function, usuario=usuario) for function in funcoes_filtra_cats]
+
+    celulas_filtradas = reduce(lambda x, y: y(x), funcoes_filtra_cats_partial, cubo)
+
+    return int(celulas_filtradas['qtd'].sum())
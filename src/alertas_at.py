@@ -4,86 +4,242 @@ Serviço de Alerta de Acidentes de Trabalho
 Autor: João Paulo Reis Ribeiro Teixeira - joao.reis@economia.gov.br'
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
+import functools
+import math
 import pandas as pd
 from pathlib import Path
 import os
+from typing import Callable
 
 import backup
 import acidentes
 import email_sender
 
+# Colunas das CATs registradas no log de alertas
+COLUNAS_LOG_ALERTAS = ['meta_nr_recibo', 'dtacid', 'DTEmissaoCAT']
 
-def alerta_usuario(usuario: pd.Series,
-                   cats: pd.DataFrame,
-                   cat_pdf_dir: Path,
-                   template_html: Path,
-                   cfg: dict,
-                   secrets: dict,
-                   logo: Path):
-    """ Envia e-mail de alerta ao usuário
+# Tamanho estimado do corpo dos alertas, sem a tabela de CATs, e dos cabeçalhos da mensagem, em bytes
+BYTES_CORPO_ALERTA = 16 * 1024
+
+
+def anexos_alerta(cats: pd.DataFrame, cat_pdf_dir: Path, cfg: dict) -> list[Path]:
+    """ Lista os arquivos PDF a serem anexados ao alerta
+
+    Args:
+        cats: Pandas DataFrame com as CATs que serão encaminhadas ao destinatário
+        cat_pdf_dir: Diretório com os arquivos das CATs em PDF
+        cfg: Dicionário com as configurações, contendo as chaves 'LIMITE_ANEXOS', 'PDF_UNICO' e 'DIVISAO_ANEXOS'
+
+    Returns:
+        Lista com os paths dos anexos
+    """
+    # Com a divisão por tamanho, todas as CATs são anexadas, e o alerta é dividido em várias mensagens, se necessário
+    if cfg['DIVISAO_ANEXOS']['ATIVO'] or len(cats) <= cfg['LIMITE_ANEXOS']:
+        return [cat_pdf_dir / f'{cat.meta_nr_recibo}.pdf' for cat in cats.itertuples()]
+
+    # Acima do limite, as CATs são reunidas em um único PDF ou, se essa opção estiver desativada, não são anexadas
+    if cfg['PDF_UNICO']['ATIVO']:
+        return [acidentes.cat_pdf_unico_path(cat_pdf_dir, cats)]
+
+    return []
+
+
+def partes_alerta(cats: pd.DataFrame, cat_pdf_dir: Path, logo: Path, cfg: dict) -> list[pd.DataFrame]:
+    """ Divide as CATs do alerta no menor número de mensagens cujo tamanho, com os PDFs anexados, respeita o limite
+    configurado. Os PDFs de todas as CATs devem ter sido gerados (ver acidentes.cat_to_pdf_lote)
+
+    Args:
+        cats: Pandas DataFrame com as CATs que serão encaminhadas ao destinatário
+        cat_pdf_dir: Diretório com os arquivos das CATs em PDF
+        logo: Path da imagem a ser inserida no cabeçalho do e-mail
+        cfg: Dicionário com as configurações, contendo as chaves 'DIVISAO_ANEXOS' e 'ANEXOS_ZIP'
+
+    Returns:
+        Lista com as DataFrames das CATs anexadas a cada mensagem
+    """
+    if not cfg['DIVISAO_ANEXOS']['ATIVO'] or cats.empty:
+        return [cats]
+
+    pdfs = {cat_pdf_dir / f'{recibo}.pdf': recibo for recibo in cats.meta_nr_recibo}
+    pdfs_ausentes = sorted(recibo for pdf, recibo in pdfs.items() if not os.path.isfile(pdf))
+    if pdfs_ausentes:
+        raise FileNotFoundError(f'PDF não encontrado para as CATs {", ".join(pdfs_ausentes)}.')
+
+    # A tabela de CATs e a logo são repetidas em todas as mensagens
+    cats_resumo_html = acidentes.cat_tabela_resumo_html(cats)
+    bytes_fixos = (email_sender.tamanho_codificado(len(cats_resumo_html.encode('utf-8')) + BYTES_CORPO_ALERTA)
+                   + email_sender.tamanho_codificado(os.path.getsize(logo)))
+
+    # Com os anexos compactados, é considerado o tamanho de cada PDF no arquivo .zip
+    grupos = email_sender.dividir_anexos(list(pdfs),
+                                         orcamento_bytes=int(cfg['DIVISAO_ANEXOS']['LIMITE_MB'] * 1024 ** 2),
+                                         bytes_fixos=bytes_fixos,
+                                         compactar=cfg['ANEXOS_ZIP'])
+    if len(grupos) <= 1:
+        return [cats]
+
+    recibos_partes = [{pdfs[pdf] for pdf in grupo} for grupo in grupos]
+
+    return [cats[cats.meta_nr_recibo.isin(recibos)] for recibos in recibos_partes]
+
+
+def texto_parte(parte: tuple[int, int] | None) -> str:
+    """ Texto com a numeração da mensagem, quando o alerta é dividido em várias mensagens
+
+    Args:
+        parte: Número da mensagem e total de mensagens do alerta
+
+    Returns:
+        Texto a ser inserido no e-mail
+    """
+    if parte is None:
+        return ''
+    return (f'Mensagem {parte[0]} de {parte[1]}. Os arquivos PDF das CATs listadas abaixo foram divididos em '
+            f'{parte[1]} mensagens, devido ao tamanho.')
+
+
+def campos_preferencias(usuario: pd.Series) -> dict:
+    """ Campos do template do alerta com as preferências do usuário
+
+    Args:
+        usuario: Pandas series com as preferências do usuário
+
+    Returns:
+        Dicionário com os campos do template
+    """
+    preferencias = usuario.fillna('-')
+    return {'uf': preferencias['UF'],
+            'uorg': preferencias['UORG'],
+            'tpacid': preferencias['Tipo de acidente'],
+            'consequencia': preferencias['Consequência do acidente'],
+            'setores': preferencias['Seção CNAE'],
+            'riscos': preferencias['Fatores de risco']}
+
+
+def agrupar_alertas(alertas: list[tuple[pd.Series, pd.DataFrame]],
+                    campos: Callable[[pd.Series], dict] | None = None) -> list[tuple[list[pd.Series], pd.DataFrame]]:
+    """ Agrupa os destinatários que recebem alertas idênticos, com as mesmas CATs e os mesmos campos do template, para
+    que o alerta seja enviado a todos em uma única mensagem
+
+    Args:
+        alertas: Lista de tuplas com o destinatário e as CATs do seu alerta
+        campos: Função que retorna os campos do template que dependem do destinatário (ex.: campos_preferencias)
+
+    Returns:
+        Lista de tuplas com os destinatários e as CATs de cada grupo, na ordem do primeiro destinatário de cada grupo
+    """
+    grupos = {}
+    for destinatario, cats in alertas:
+        chave = email_sender.CacheCorpos.chave(list(cats.get('meta_nr_recibo', [])),
+                                               campos(destinatario) if campos is not None else None)
+        grupos.setdefault(chave, ([], cats))[0].append(destinatario)
+    return list(grupos.values())
+
+
+def mensagem_usuario(usuario: pd.Series,
+                     cats: pd.DataFrame,
+                     cat_pdf_dir: Path,
+                     template_html: Path,
+                     cfg: dict,
+                     logo: Path,
+                     cache_mime: email_sender.CacheMIME | None = None,
+                     cats_anexos: pd.DataFrame | None = None,
+                     parte: tuple[int, int] | None = None,
+                     cache_corpos: email_sender.CacheCorpos | None = None,
+                     destinatarios: list[str] | None = None) -> email_sender.EmailMessageHTML:
+    """ Monta o e-mail de alerta ao usuário
 
     Args:
         usuario: Pandas series com as preferências do usuário
         cats: Pandas DataFrame com as CATs que serão encaminhadas ao usuário
         cat_pdf_dir: Diretório com os arquivos das CATs em PDF
         template_html: Template html a ser utilizado para mesclagem do email
-        cfg: Dicionário com as configurações para envio do email, contendo as chaves 'SENDER_EMAIL', 'SMPT_SERVER' e 'PORT'
-        secrets: Dicionário com as credenciais para envio do e-mail, contendo as chaves 'EMAIL' e 'PASSWORD'
+        cfg: Dicionário com as configurações do email, contendo as chaves 'SENDER_EMAIL', 'LIMITE_ANEXOS', 'PDF_UNICO',
+            'DIVISAO_ANEXOS' e 'ANEXOS_ZIP'
         logo: Path da imagem a ser inserida no cabeçalho do e-mail
+        cache_mime: Cache das imagens e anexos já codificados, compartilhado pelas mensagens da execução
+        cats_anexos: Pandas DataFrame com as CATs cujos PDFs são anexados à mensagem, quando o alerta é dividido em
+            várias mensagens (ver partes_alerta). Se não informada, são anexados os PDFs de todas as CATs
+        parte: Número da mensagem e total de mensagens do alerta, quando dividido em várias mensagens
+        cache_corpos: Cache dos corpos já montados, compartilhado pelas mensagens da execução
+        destinatarios: E-mails dos destinatários que recebem o mesmo alerta (ver agrupar_alertas), em uma única
+            mensagem. Se não informados, a mensagem é enviada somente ao e-mail do destinatário
 
+    Returns:
+        Mensagem a ser enviada
     """
-    # Se houver mais de 50 anexos, nenhum anexo é inserido
-    if len(cats) <= cfg['LIMITE_ANEXOS']:
-        anexos = [cat_pdf_dir / f'{cat.meta_nr_recibo}.pdf' for cat in cats.itertuples()]
+    cats_anexos = cats if cats_anexos is None else cats_anexos
+    campos_usuario = campos_preferencias(usuario)
+
+    def montar_corpo() -> email_sender.CorpoHTML:
+        cats_resumo_html = acidentes.cat_tabela_resumo_html(cats)
+
+        if cfg['DIVISAO_ANEXOS']['ATIVO']:
+            msg_anexos = 'Os anexos com as CATs em formato PDF são divididos em várias mensagens, quando necessário.'
+        elif cfg['PDF_UNICO']['ATIVO']:
+            msg_anexos = (
+                f'Como o número de acidentes excede {cfg["LIMITE_ANEXOS"]}, as CATs foram reunidas em um único arquivo '
+                f'PDF (limitado a {cfg["PDF_UNICO"]["LIMITE_CATS"]} CATs).'
+                )
+        else:
+            msg_anexos = (
+                'Os anexos com as CATs em formato PDF são enviados somente se o número de acidentes for menor do que '
+                f'{cfg["LIMITE_ANEXOS"]}.'
+                )
+
+        msg_muitos_acid = (
+            'Os critérios selecionados durante a inscrição são muito abrangentes. '
+            'Considere mudar suas preferências para reduzir o número de acidentes recebidos diariamente. '
+            f'{msg_anexos}'
+            )
+
+        alerta_muitos_acid = msg_muitos_acid if len(cats) > cfg['LIMITE_ANEXOS'] else ''
+
+        campos_email = {'cats': cats_resumo_html,
+                        **campos_usuario,
+                        'alerta_perfil': alerta_muitos_acid,
+                        'parte': texto_parte(parte)
+                        }
+
+        return email_sender.corpo_html(template_html=template_html,
+                                       template_campos=campos_email,
+                                       anexos=anexos_alerta(cats_anexos, cat_pdf_dir, cfg),
+                                       imagens=logo,
+                                       compactar_anexos=cfg['ANEXOS_ZIP'],
+                                       cache_mime=cache_mime)
+
+    # Usuários com as mesmas CATs e preferências recebem o mesmo corpo, montado uma única vez
+    if cache_corpos is None:
+        corpo = montar_corpo()
     else:
-        anexos = []
-
-    cats_resumo_html = acidentes.cat_tabela_resumo(cats).to_html(index=False, escape=False)
-
-    msg_muitos_acid = (
-        'Os critérios selecionados durante a inscrição são muito abrangentes. '
-        'Considere mudar suas preferências para reduzir o número de acidentes recebidos diariamente. '
-        'Os anexos com as CATs em formato PDF são enviados somente se o número de acidentes for menor do que '
-        f'{cfg["LIMITE_ANEXOS"]}.'
-        )
-
-    alerta_muitos_acid = msg_muitos_acid if len(cats) > cfg['LIMITE_ANEXOS'] else ''
-
-    campos_email = {'cats': cats_resumo_html,
-                    'uf': usuario.fillna('-')['UF'],
-                    'uorg': usuario.fillna('-')['UORG'],
-                    'tpacid': usuario.fillna('-')['Tipo de acidente'],
-                    'consequencia': usuario.fillna('-')['Consequência do acidente'],
-                    'setores': usuario.fillna('-')['Seção CNAE'],
-                    'riscos': usuario.fillna('-')['Fatores de risco'],
-                    'alerta_perfil': alerta_muitos_acid
-                    }
-
-    msg_usuario = email_sender.EmailMessageHTML(destinatario=usuario['E-mail'],
-                                                sender_email=cfg['SENDER_EMAIL'],
-                                                assunto='Alerta de acidente do trabalho',
-                                                template_html=template_html,
-                                                template_campos=campos_email,
-                                                anexos=anexos,
-                                                imagens=logo)
-
-    msg_usuario.send(auth_user=secrets['EMAIL'],
-                     password=secrets['PASSWORD'],
-                     smtp_server=cfg['SMPT_SERVER'],
-                     port=cfg['PORT'])
-
-
-def alerta_coordenador(coordenador: pd.Series,
-                       cats: pd.DataFrame,
-                       cats_coord: pd.DataFrame,
-                       cat_pdf_dir: Path,
-                       df_resumo_alertas_hj: pd.DataFrame,
-                       template_html: Path,
-                       cfg: dict,
-                       secrets: dict,
-                       logo: Path):
-    """ Envia e-mail de alerta ao coordenador
+        chave = email_sender.CacheCorpos.chave('usuario', str(template_html), list(cats.meta_nr_recibo),
+                                               list(cats_anexos.meta_nr_recibo), parte, campos_usuario)
+        corpo = cache_corpos.obter(chave, montar_corpo)
+
+    assunto = 'Alerta de acidente do trabalho' + (f' ({parte[0]}/{parte[1]})' if parte else '')
+
+    return email_sender.EmailMessageHTML(destinatario=destinatarios if destinatarios else usuario['E-mail'],
+                                         sender_email=cfg['SENDER_EMAIL'],
+                                         assunto=assunto,
+                                         corpo=corpo)
+
+
+def mensagem_coordenador(coordenador: pd.Series,
+                         cats: pd.DataFrame,
+                         cats_coord: pd.DataFrame,
+                         cat_pdf_dir: Path,
+                         df_resumo_alertas_hj: pd.DataFrame,
+                         template_html: Path,
+                         cfg: dict,
+                         logo: Path,
+                         df_resumo_cubo: pd.DataFrame | None = None,
+                         cache_mime: email_sender.CacheMIME | None = None,
+                         cats_anexos: pd.DataFrame | None = None,
+                         parte: tuple[int, int] | None = None,
+                         cache_corpos: email_sender.CacheCorpos | None = None,
+                         destinatarios: list[str] | None = None) -> email_sender.EmailMessageHTML:
+    """ Monta o e-mail de alerta ao coordenador
 
     Args:
         coordenador: Pandas series com as preferências do coordenador
@@ -92,44 +248,68 @@ def alerta_coordenador(coordenador: pd.Series,
         cat_pdf_dir: Diretório com os arquivos das CATs em PDF
         df_resumo_alertas_hj: Pandas DataFrame com o resumo dos alertas enviados na data corrente, por usuário
         template_html: Template html a ser utilizado para mesclagem do email
-        cfg: Dicionário com as configurações para envio do email, contendo as chaves 'SENDER_EMAIL', 'SMPT_SERVER' e 'PORT'
-        secrets: Dicionário com as credenciais para envio do e-mail, contendo as chaves 'EMAIL' e 'PASSWORD'
+        cfg: Dicionário com as configurações do email, contendo as chaves 'SENDER_EMAIL', 'LIMITE_ANEXOS', 'PDF_UNICO',
+            'DIVISAO_ANEXOS' e 'ANEXOS_ZIP'
         logo: Path da imagem a ser inserida no cabeçalho do e-mail
+        df_resumo_cubo: Pandas DataFrame com a quantidade de CATs emitidas nos últimos dias, por UF, obtida do cubo
+        cache_mime: Cache das imagens e anexos já codificados, compartilhado pelas mensagens da execução
+        cats_anexos: Pandas DataFrame com as CATs cujos PDFs são anexados à mensagem, quando o alerta é dividido em
+            várias mensagens (ver partes_alerta). Se não informada, são anexados os PDFs de todas as CATs
+        parte: Número da mensagem e total de mensagens do alerta, quando dividido em várias mensagens
+        cache_corpos: Cache dos corpos já montados, compartilhado pelas mensagens da execução
+        destinatarios: E-mails dos destinatários que recebem o mesmo alerta (ver agrupar_alertas), em uma única
+            mensagem. Se não informados, a mensagem é enviada somente ao e-mail do destinatário
 
+    Returns:
+        Mensagem a ser enviada
     """
-    if not cats_coord.empty:
-        # Se houver mais de 50 anexos, nenhum anexo é inserido
-        if len(cats_coord) <= cfg['LIMITE_ANEXOS']:
-            anexos_adm = [cat_pdf_dir / f'{cat.meta_nr_recibo}.pdf' for cat in cats_coord.itertuples()]
-        else:
-            anexos_adm = []
-        cats_resumo_html_adm = acidentes.cat_tabela_resumo(cats_coord).to_html(index=False, escape=False)
+    def montar_corpo() -> email_sender.CorpoHTML:
+        if not cats_coord.empty:
+            anexos_adm = anexos_alerta(cats_coord if cats_anexos is None else cats_anexos, cat_pdf_dir, cfg)
+            cats_resumo_html_adm = acidentes.cat_tabela_resumo_html(cats_coord)
 
+        else:
+            anexos_adm = None
+            cats_resumo_html_adm = None
+
+        resumo_alertas_hj_html = df_resumo_alertas_hj.to_html(index=False, escape=False)
+        resumo_cubo_html = df_resumo_cubo.to_html(index=False, escape=False) if df_resumo_cubo is not None else ''
+
+        campos_email_adm = {'qtd_cats': cats.shape[0],
+                            'cats': cats_resumo_html_adm if cats_resumo_html_adm else f'Sem novos registros',
+                            'resumo_notificacoes': resumo_alertas_hj_html,
+                            'resumo_cubo': resumo_cubo_html,
+                            'parte': texto_parte(parte)}
+
+        return email_sender.corpo_html(template_html=template_html,
+                                       template_campos=campos_email_adm,
+                                       anexos=anexos_adm if anexos_adm else None,
+                                       imagens=logo,
+                                       compactar_anexos=cfg['ANEXOS_ZIP'],
+                                       cache_mime=cache_mime)
+
+    # Coordenadores com as mesmas CATs recebem o mesmo corpo, montado uma única vez
+    if cache_corpos is None:
+        corpo = montar_corpo()
     else:
-        anexos_adm = None
-        cats_resumo_html_adm = None
-
-    resumo_alertas_hj_html = df_resumo_alertas_hj.to_html(index=False, escape=False)
-
-    campos_email_adm = {'qtd_cats': cats.shape[0],
-                        'cats': cats_resumo_html_adm if cats_resumo_html_adm else f'Sem novos registros',
-                        'resumo_notificacoes': resumo_alertas_hj_html}
+        resumos = [int(pd.util.hash_pandas_object(df, index=False).sum())
+                   for df in (df_resumo_alertas_hj, df_resumo_cubo) if df is not None]
+        chave = email_sender.CacheCorpos.chave(
+            'coordenador', str(template_html), cats.shape[0], list(cats_coord.get('meta_nr_recibo', [])),
+            None if cats_anexos is None else list(cats_anexos.meta_nr_recibo), parte, resumos)
+        corpo = cache_corpos.obter(chave, montar_corpo)
 
-    msg_adm = email_sender.EmailMessageHTML(destinatario=coordenador['E-mail'],
-                                            sender_email=cfg['SENDER_EMAIL'],
-                                            assunto=f'Alerta de acidente do trabalho ({str(datetime.now().strftime("%d/%m/%Y"))}) - Coordenador',
-                                            template_html=template_html,
-                                            template_campos=campos_email_adm,
-                                            anexos=anexos_adm if anexos_adm else None,
-                                            imagens=logo)
+    assunto = (f'Alerta de acidente do trabalho ({str(datetime.now().strftime("%d/%m/%Y"))}) - Coordenador'
+               + (f' ({parte[0]}/{parte[1]})' if parte else ''))
 
-    msg_adm.send(auth_user=secrets['EMAIL'],
-                 password=secrets['PASSWORD'],
-                 smtp_server=cfg['SMPT_SERVER'],
-                 port=cfg['PORT'])
+    return email_sender.EmailMessageHTML(destinatario=destinatarios if destinatarios else coordenador['E-mail'],
+                                         sender_email=cfg['SENDER_EMAIL'],
+                                         assunto=assunto,
+                                         corpo=corpo)
 
 
-def resumo_alertas_hj(usuarios: pd.DataFrame, log_alertas_usuario: Path) -> pd.DataFrame:
+def resumo_alertas_hj(usuarios: pd.DataFrame,
+                      log_alertas_usuario: Path) -> pd.DataFrame:
     """Cria DataFrame com o resumo dos alertas enviados na data corrente, por usuário
 
     Args:
@@ -145,18 +325,17 @@ def resumo_alertas_hj(usuarios: pd.DataFrame, log_alertas_usuario: Path) -> pd.D
                          .fillna('Todas')
                          .sort_values(['UF', 'UORG', 'E-mail', ]))
 
-    if os.path.exists(log_alertas_usuario):
-        envios = pd.read_csv(log_alertas_usuario)
-        envios.timestamp = pd.to_datetime(envios.timestamp)
-        envios_hj = envios[envios.timestamp.dt.date == datetime.now().date()]
+    # Somente a partição do dia é lida
+    envios_hj = backup.ler_log(log_alertas_usuario, inicio=datetime.now().date(), fim=datetime.now().date())
+    if envios_hj.empty:
+        envios_hj_count = pd.DataFrame(columns=['email', 'Status do envio', f"Acidentes <br>em {dt_hoje_str}"])
+    else:
         envios_hj_count = (envios_hj
                            .groupby(['email', 'status'])
                            .size()
                            .reset_index()
                            .rename(columns={0: f"Acidentes <br>em {dt_hoje_str}", 'status': "Status do envio"})
                            )
-    else:
-        envios_hj_count = pd.DataFrame(columns=['email', 'Status do envio', f"Acidentes <br>em {dt_hoje_str}"])
 
     df_resumo = (resumo_inscricoes
                  .merge(envios_hj_count, how='left', left_on='E-mail', right_on='email')
@@ -170,7 +349,40 @@ def resumo_alertas_hj(usuarios: pd.DataFrame, log_alertas_usuario: Path) -> pd.D
     return df_resumo
 
 
-def log_alertas(log: Path, destinatario: pd.Series, cats: pd.DataFrame, sucesso: bool):
+def resumo_cubo_periodo(cubo: pd.DataFrame, dias: int = 7) -> pd.DataFrame:
+    """Cria DataFrame com a quantidade de CATs emitidas nos últimos dias, por UF e tipo de acidente, a partir das
+    contagens pré-agregadas do cubo de CATs
+
+    Args:
+        cubo: DataFrame com as células do cubo de CATs
+        dias: Número de dias, contados a partir da data corrente, a serem considerados
+
+    Returns:
+        DataFrame com a quantidade de CATs por UF e tipo de acidente
+    """
+    dict_tpacid = {1: 'Acidentes típicos', 2: 'Doenças do Trabalho', 3: 'Acidentes de Trajeto'}
+
+    contagens = acidentes.cubo_agregar(cubo,
+                                       por=['sguf_local_acidente', 'tpacid'],
+                                       dt_inicio=datetime.now().date() - timedelta(days=dias))
+    contagens['tpacid'] = contagens['tpacid'].map(dict_tpacid)
+
+    df_resumo = (contagens
+                 .pivot_table(index='sguf_local_acidente', columns='tpacid', values='qtd', aggfunc='sum', fill_value=0)
+                 .reindex(columns=list(dict_tpacid.values()), fill_value=0))
+    df_resumo['Total'] = df_resumo.sum(axis=1)
+
+    return (df_resumo
+            .reset_index()
+            .rename(columns={'sguf_local_acidente': 'UF'})
+            .rename_axis(columns=None))
+
+
+def log_alertas(log: Path,
+                destinatario: pd.Series,
+                cats: pd.DataFrame,
+                sucesso: bool,
+                escritor: backup.EscritorLog | None = None):
     """Adiciona ao log o resultado do envio das CATs presentes na DataFrame ao destinatário
 
     Args:
@@ -178,16 +390,129 @@ def log_alertas(log: Path, destinatario: pd.Series, cats: pd.DataFrame, sucesso:
         destinatario: Pandas series com as preferências do usuário
         cats: Pandas DataFrame com as cats que serão encaminhadas ao usuário
         sucesso: Indica se houve sucesso no envio
+        escritor: Escritor do log, que acumula os registros para gravação em lote. Se não informado, os registros são
+            gravados imediatamente, em uma única escrita
 
     """
-    for _, cat in cats.iterrows():
-        log_dict = {'timestamp': str(datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                    'email': destinatario['E-mail'],
-                    'meta_nr_recibo': cat['meta_nr_recibo'],
-                    'dtacid': cat['dtacid'],
-                    'DTEmissaoCAT': cat['DTEmissaoCAT'],
-                    'status': 'Sucesso' if sucesso else 'Falhou'}
-        backup.backup_csv_append(log, log_dict)
+    registros = pd.DataFrame({'timestamp': str(datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+                              'email': destinatario['E-mail'],
+                              'meta_nr_recibo': cats['meta_nr_recibo'],
+                              'dtacid': cats['dtacid'],
+                              'DTEmissaoCAT': cats['DTEmissaoCAT'],
+                              'status': 'Sucesso' if sucesso else 'Falhou'})
+
+    if escritor is None:
+        backup.log_append(log, registros)
+    else:
+        escritor.adicionar(registros)
+
+
+def enfileirar_alerta(caixa_saida: email_sender.CaixaSaida,
+                      tipo: str,
+                      destinatario: pd.Series | list[pd.Series],
+                      cats: pd.DataFrame,
+                      mensagem: email_sender.EmailMessageHTML,
+                      id_execucao: str | None = None) -> str:
+    """Insere o alerta na caixa de saída. A chave da mensagem é formada pelo tipo de alerta, e-mails dos
+    destinatários, data e CATs incluídas, de modo que o mesmo alerta não seja enfileirado nem enviado duas vezes. Os
+    alertas sem CATs (resumo enviado aos coordenadores em cada execução) incluem na chave o identificador da execução,
+    de modo que somente a repetição na mesma execução é descartada
+
+    Args:
+        caixa_saida: Caixa de saída dos alertas
+        tipo: Tipo do alerta ('usuario' ou 'coordenador')
+        destinatario: Pandas series com as preferências do destinatário, ou lista de series, quando o alerta é
+            enviado a vários destinatários em uma única mensagem
+        cats: Pandas DataFrame com as CATs encaminhadas ao destinatário
+        mensagem: Mensagem do alerta
+        id_execucao: Identificador da execução, utilizado na chave dos alertas sem CATs. Se não informado, a data e hora
+            correntes
+
+    Returns:
+        Message-ID do alerta
+    """
+    emails = [d['E-mail'] for d in destinatario] if isinstance(destinatario, list) else [destinatario['E-mail']]
+    recibos = sorted(cats.meta_nr_recibo.astype(str))
+    chave = f'{tipo}|{",".join(sorted(emails))}|{datetime.now().date()}|{",".join(recibos)}'
+    if not recibos:
+        chave += f'|{id_execucao or datetime.now().isoformat()}'
+    metadados = {'tipo': tipo,
+                 'cats': cats[COLUNAS_LOG_ALERTAS].to_dict('records'),
+                 'bytes_anexos': mensagem.bytes_anexos,
+                 'bytes_anexos_compactados': mensagem.bytes_anexos_compactados}
+
+    return caixa_saida.enfileirar(mensagem, chave=chave, metadados=metadados)
+
+
+def recibos_pendentes(caixa_saida: email_sender.CaixaSaida, tipo: str) -> dict[str, set]:
+    """Identifica as CATs incluídas em alertas ainda pendentes na caixa de saída, por destinatário, para que não sejam
+    incluídas em novos alertas
+
+    Args:
+        caixa_saida: Caixa de saída dos alertas
+        tipo: Tipo do alerta ('usuario' ou 'coordenador')
+
+    Returns:
+        Dicionário com o e-mail do destinatário e o conjunto dos números de recibo pendentes
+    """
+    pendentes = {}
+    for mensagem in caixa_saida.pendentes():
+        metadados = mensagem['metadados']
+        if metadados['tipo'] == tipo:
+            for email in mensagem['destinatarios']:
+                pendentes.setdefault(email, set()).update(cat['meta_nr_recibo'] for cat in metadados['cats'])
+    return pendentes
+
+
+def log_alertas_finalizados(finalizados: list[dict],
+                            logs: dict[str, Path]) -> tuple[int, int]:
+    """Adiciona aos logs o resultado dos alertas que chegaram ao estado final na caixa de saída
+
+    Args:
+        finalizados: Lista com os alertas finalizados, conforme retornados por email_sender.CaixaSaida.drenar
+        logs: Dicionário com o Path do log de cada tipo de alerta
+
+    Returns:
+        Tamanho dos anexos dos alertas enviados, antes e depois da compactação
+    """
+    bytes_anexos = 0
+    bytes_anexos_compactados = 0
+    # Os registros de cada log são gravados em lote, ao final
+    escritores = {tipo: backup.EscritorLog(log) for tipo, log in logs.items()}
+    for finalizado in finalizados:
+        metadados = finalizado['metadados']
+        sucesso = finalizado['status'] == 'enviada'
+        cats = pd.DataFrame(metadados['cats'], columns=COLUNAS_LOG_ALERTAS)
+        # Nos alertas a vários destinatários, os recusados definitivamente pelo servidor são registrados como falha.
+        # Os recusados temporariamente são registrados quando finalizada a nova tentativa
+        recusados = set(finalizado['recusados'])
+        for email in [email for email in finalizado['destinatarios'] if email not in finalizado['reenfileirados']]:
+            log_alertas(log=logs[metadados['tipo']],
+                        destinatario=pd.Series({'E-mail': email}),
+                        cats=cats,
+                        sucesso=sucesso and email not in recusados,
+                        escritor=escritores[metadados['tipo']])
+        if sucesso:
+            bytes_anexos += metadados['bytes_anexos']
+            bytes_anexos_compactados += metadados['bytes_anexos_compactados']
+
+    for escritor in escritores.values():
+        escritor.gravar()
+
+    return bytes_anexos, bytes_anexos_compactados
+
+
+def log_desempenho(log: Path, metricas: dict):
+    """Adiciona ao log as métricas de desempenho da execução do script, uma linha por métrica
+
+    Args:
+        log: Path do arquivo .csv contendo o log de desempenho
+        metricas: Dicionário com o nome e o valor de cada métrica
+
+    """
+    timestamp = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    backup.log_append(log, [{'timestamp': timestamp, 'metrica': metrica, 'valor': valor}
+                            for metrica, valor in metricas.items()])
 
 
 def log_execucao(log_execucoes, sucesso: bool, cats=None, log_alertas_usuario=None):
@@ -201,12 +526,9 @@ def log_execucao(log_execucoes, sucesso: bool, cats=None, log_alertas_usuario=No
 
     """
     if sucesso:
-        if os.path.exists(log_alertas_usuario):
-            envios = pd.read_csv(log_alertas_usuario)
-            envios.timestamp = pd.to_datetime(envios.timestamp)
-            envios_hj = envios[envios.timestamp.dt.date == datetime.now().date()]
-        else:
-            envios_hj = pd.DataFrame()
+        # Somente a partição do dia é lida
+        qtd_envios_hj = len(backup.ler_log(log_alertas_usuario, inicio=datetime.now().date(),
+                                           fim=datetime.now().date()))
 
         ultima_cat = cats[cats.meta_nr_recibo == cats.meta_nr_recibo.max()]
 
@@ -214,7 +536,7 @@ def log_execucao(log_execucoes, sucesso: bool, cats=None, log_alertas_usuario=No
                     'qtd_cat_baixada': cats.shape[0],
                     'ultima_cat_baixada': ultima_cat.squeeze().meta_nr_recibo,
                     'dt_ultima_cat_baixada': ultima_cat.squeeze().DTEmissaoCAT,
-                    'alertas_enviados_no_dia': len(envios_hj),
+                    'alertas_enviados_no_dia': qtd_envios_hj,
                     'status': 'Sucesso'
                     }
     else:
@@ -226,7 +548,7 @@ def log_execucao(log_execucoes, sucesso: bool, cats=None, log_alertas_usuario=No
                     'status': 'Falhou'
                     }
 
-    backup.backup_csv_append(log_execucoes, log_dict)
+    backup.log_append(log_execucoes, log_dict)
 
 
 if __name__ == '__main__':
@@ -264,12 +586,33 @@ if __name__ == '__main__':
 
     # Cats em PDF
     cat_pdf_dir = Path('../data/output/cat_pdf')
+    cache_pdf = acidentes.CachePDF(diretorio=Path('../data/cache/cat_pdf'),
+                                   tamanho_max_mb=cfg['CACHE_PDF']['TAMANHO_MAX_MB'],
+                                   idade_max_dias=cfg['CACHE_PDF']['IDADE_MAX_DIAS'])
+
+    # Cubo com as contagens de CATs
+    cubo_path = Path('../data/output/cubo_cats.csv')
+
+    # Identificador da execução, que distingue os resumos enviados aos coordenadores em cada execução
+    id_execucao = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+
+    # Caixa de saída dos alertas, com novas tentativas de envio entre execuções
+    caixa_saida = email_sender.CaixaSaida(db_path=Path('../data/output/caixa_saida.sqlite3'),
+                                          tentativas_max=cfg['CAIXA_SAIDA']['TENTATIVAS'],
+                                          espera_base=cfg['CAIXA_SAIDA']['ESPERA_BASE_S'])
 
     # LOGs
     log_dir = Path('../data/log')
     log_alertas_usuario = log_dir / 'log_alertas_usuarios.csv'
     log_alertas_adm = log_dir / 'log_alertas_adm.csv'
     log_execucoes = log_dir / 'log_execucoes.csv'
+    log_desempenho_execucao = log_dir / 'log_desempenho.csv'
+
+    logs_particionados = [log_alertas_usuario, log_alertas_adm, log_execucoes, log_desempenho_execucao]
+
+    # Os logs .csv são gravados em partições diárias. Os logs gravados antes da adoção das partições são divididos
+    for log_csv in logs_particionados:
+        backup.particionar_log(log_csv)
 
     # Backup
     backup_dir = root_dir / 'data/backup'
@@ -284,7 +627,10 @@ if __name__ == '__main__':
     df_usuarios = usuarios.usuarios(id_gsheet_insc=cfg['FORM_INSC']['ID_GSHEET'],
                                     id_gsheet_canc=cfg['FORM_CANCEL']['ID_GSHEET'],
                                     codigos_desativados=codigos_desativados)
-    backup.backup_csv(df_usuarios, backup_path=backup_usuarios)
+    backup.backup_csv(df_usuarios,
+                      backup_path=backup_usuarios,
+                      incremental=cfg['BACKUP_INCREMENTAL']['ATIVO'],
+                      compactar_a_cada=cfg['BACKUP_INCREMENTAL']['COMPACTAR_A_CADA'])
 
     # Carrega lista de coordenadores
     df_coord = pd.DataFrame(cfg['COORDENADORES'])
@@ -297,74 +643,194 @@ if __name__ == '__main__':
                                                url_test_connection=cfg['VPN_URL_TEST_CONNECTION'],
                                                log_execucoes=log_execucoes,
                                                aux_tables_dir=aux_tables_dir,
-                                               fatores_risco=fatores_params_reshaped)
+                                               fatores_risco=fatores_params_reshaped,
+                                               cubo_path=cubo_path)
 
-        # Alerta usuários
+        # Renderiza, uma única vez, a linha de cada CAT na tabela de resumo dos alertas
+        cats_tratadas[acidentes.COLUNA_RESUMO_HTML] = acidentes.cat_resumo_html(cats_tratadas)
+
+        # Resumo das CATs emitidas nos últimos dias, a partir do cubo
+        df_resumo_cubo = resumo_cubo_periodo(acidentes.cubo_carregar(cubo_path))
+
+        # Filtra as CATs de cada usuário e coordenador. As CATs de alertas ainda pendentes na caixa de saída, que serão
+        # reenviados, não são incluídas em novos alertas
+        pendentes_usuarios = recibos_pendentes(caixa_saida, 'usuario')
+        alertas_usuarios = []
         for _, destinatario in df_usuarios.iterrows():
-            # Filtra CATs
             cats_filtradas = acidentes_filtrar.preferencias_usuario(cats_tratadas, destinatario, log_alertas_usuario)
-
-            # Gera PDF das CAT
+            cats_filtradas = cats_filtradas[~cats_filtradas.meta_nr_recibo.isin(
+                pendentes_usuarios.get(destinatario['E-mail'], set()))]
             if not cats_filtradas.empty:
-                if len(cats_filtradas) <= cfg['LIMITE_ANEXOS']:
-                    for index_cat, cat in cats_filtradas.iterrows():
-                        acidentes.cat_to_pdf(cat,
-                                             html_template=cat_html_template,
-                                             logo=logo_sit,
-                                             output_dir=cat_pdf_dir)
-
-                # Notifica usuário e registra no log
-                try:
-                    alerta_usuario(usuario=destinatario,
-                                   cats=cats_filtradas,
-                                   cat_pdf_dir=cat_pdf_dir,
-                                   template_html=alerta_user_html_template,
-                                   cfg=cfg,
-                                   secrets=secrets,
-                                   logo=logo_saat)
-                    log_alertas(log=log_alertas_usuario, destinatario=destinatario, cats=cats_filtradas, sucesso=True)
-
-                except:
-                    log_alertas(log=log_alertas_usuario, destinatario=destinatario, cats=cats_filtradas, sucesso=False)
-
-        # Alerta coordenador
+                alertas_usuarios.append((destinatario, cats_filtradas))
+
+        pendentes_coord = recibos_pendentes(caixa_saida, 'coordenador')
+        alertas_coord = []
         for _, destinatario in df_coord.iterrows():
-            # Filtra CATs
             cats_filtradas = acidentes_filtrar.preferencias_coordenador(cats_tratadas, destinatario, log_alertas_adm)
-
-            # Gera PDF das CAT
-            if not cats_filtradas.empty:
-                for index_cat, cat in cats_filtradas.iterrows():
-                    acidentes.cat_to_pdf(cat,
-                                         html_template=cat_html_template,
-                                         logo=logo_sit,
-                                         output_dir=cat_pdf_dir)
-
-            # Calcula número de alertas por usuário
-            df_resumo_alertas_hj = resumo_alertas_hj(usuarios=df_usuarios, log_alertas_usuario=log_alertas_usuario)
-
-            # Notifica coordenador e registra no log
-            try:
-                alerta_coordenador(coordenador=destinatario,
-                                   cats=cats_tratadas,
-                                   cats_coord=cats_filtradas,
-                                   cat_pdf_dir=cat_pdf_dir,
-                                   df_resumo_alertas_hj=df_resumo_alertas_hj,
-                                   template_html=alerta_adm_html_template,
-                                   cfg=cfg,
-                                   secrets=secrets,
-                                   logo=logo_saat)
-                log_alertas(log=log_alertas_adm, destinatario=destinatario, cats=cats_filtradas, sucesso=True)
-            except:
-                log_alertas(log=log_alertas_adm, destinatario=destinatario, cats=cats_filtradas, sucesso=False)
+            cats_filtradas = cats_filtradas[~cats_filtradas.meta_nr_recibo.isin(
+                pendentes_coord.get(destinatario['E-mail'], set()))]
+            alertas_coord.append((destinatario, cats_filtradas))
+
+        # Gera, uma única vez e em paralelo, os PDFs das CATs que serão efetivamente anexadas aos alertas. Com a divisão
+        # dos alertas por tamanho, todas as CATs são anexadas
+        limite_anexos = math.inf if cfg['DIVISAO_ANEXOS']['ATIVO'] else cfg['LIMITE_ANEXOS']
+        cats_anexos = acidentes.planejar_anexos([cats for _, cats in alertas_usuarios + alertas_coord],
+                                                limite_anexos=limite_anexos)
+        pdfs_gerados = acidentes.cat_to_pdf_lote(cats_anexos,
+                                                 html_template=cat_html_template,
+                                                 logo=logo_sit,
+                                                 output_dir=cat_pdf_dir,
+                                                 processos=cfg['PDF_PROCESSOS'],
+                                                 timeout=cfg['PDF_TIMEOUT'],
+                                                 memoria_max_mb=cfg['PDF_MEMORIA_MAX_MB'],
+                                                 cache=cache_pdf)
+
+        # A falha na geração de um PDF interrompe a execução, antes do envio dos alertas, e é comunicada aos
+        # administradores
+        falhas_pdf = sorted(recibo for recibo, sucesso in pdfs_gerados.items() if not sucesso)
+        if falhas_pdf:
+            raise Exception(f'Falha na geração do PDF das CATs {", ".join(falhas_pdf)}.')
+
+        # Destinatários com mais CATs do que o limite de anexos recebem um único PDF com todas as suas CATs
+        if cfg['PDF_UNICO']['ATIVO'] and not cfg['DIVISAO_ANEXOS']['ATIVO']:
+            for cats_pdf_unico in acidentes.planejar_pdf_unico([cats for _, cats in alertas_usuarios + alertas_coord],
+                                                               limite_anexos=cfg['LIMITE_ANEXOS']):
+                acidentes.cat_to_pdf_unico(cats_pdf_unico,
+                                           html_template=cat_html_template,
+                                           logo=logo_sit,
+                                           output_dir=cat_pdf_dir,
+                                           limite_cats=cfg['PDF_UNICO']['LIMITE_CATS'])
+
+        # As sessões SMTP, autenticadas uma só vez, são mantidas abertas e utilizadas concorrentemente no envio de
+        # todos os alertas, respeitando os limites de envio do servidor. O limite diário considera os destinatários
+        # dos alertas já enviados no dia, em execuções anteriores
+        limitador_envio = email_sender.LimitadorTaxa(
+            mensagens_por_minuto=cfg['LIMITE_ENVIO']['MENSAGENS_POR_MINUTO'],
+            destinatarios_por_dia=cfg['LIMITE_ENVIO']['DESTINATARIOS_POR_DIA'],
+            destinatarios_dia=caixa_saida.destinatarios_dia())
+        criar_sessao = functools.partial(email_sender.SessaoSMTP,
+                                         auth_user=secrets['EMAIL'],
+                                         password=secrets['PASSWORD'],
+                                         smtp_server=cfg['SMPT_SERVER'],
+                                         port=cfg['PORT'],
+                                         limitador=limitador_envio)
+
+        # A logo e os PDFs são lidos e codificados uma única vez, e reutilizados em todas as mensagens
+        cache_mime = email_sender.CacheMIME()
+
+        # Os corpos idênticos (mesmas CATs e campos) são montados uma única vez e compartilhados pelas mensagens
+        cache_corpos = email_sender.CacheCorpos()
+
+        logs_alertas = {'usuario': log_alertas_usuario, 'coordenador': log_alertas_adm}
+
+        with email_sender.DespachanteSMTP(criar_sessao, conexoes=cfg['SMTP_CONEXOES']) as despachante:
+            # Monta os alertas aos usuários e os insere na caixa de saída. Com o agrupamento ativo, os destinatários
+            # com alertas idênticos recebem uma única mensagem
+            if cfg['AGRUPAR_DESTINATARIOS']:
+                grupos_usuarios = agrupar_alertas(alertas_usuarios, campos=campos_preferencias)
+            else:
+                grupos_usuarios = [([destinatario], cats_filtradas)
+                                   for destinatario, cats_filtradas in alertas_usuarios]
+
+            for destinatarios, cats_filtradas in grupos_usuarios:
+                partes = partes_alerta(cats_filtradas, cat_pdf_dir, logo_saat, cfg)
+                for i, cats_parte in enumerate(partes, start=1):
+                    try:
+                        msg = mensagem_usuario(usuario=destinatarios[0],
+                                               cats=cats_filtradas,
+                                               cat_pdf_dir=cat_pdf_dir,
+                                               template_html=alerta_user_html_template,
+                                               cfg=cfg,
+                                               logo=logo_saat,
+                                               cache_mime=cache_mime,
+                                               cats_anexos=cats_parte,
+                                               parte=(i, len(partes)) if len(partes) > 1 else None,
+                                               cache_corpos=cache_corpos,
+                                               destinatarios=[destinatario['E-mail'] for destinatario in destinatarios])
+                        enfileirar_alerta(caixa_saida, 'usuario', destinatarios, cats_parte, msg, id_execucao)
+                    except:
+                        for destinatario in destinatarios:
+                            log_alertas(log=log_alertas_usuario, destinatario=destinatario, cats=cats_parte,
+                                        sucesso=False)
+
+            # Envia os alertas pendentes, incluindo os de execuções anteriores, e registra no log os finalizados
+            finalizados = caixa_saida.drenar(despachante)
+            bytes_envio, bytes_envio_compactados = log_alertas_finalizados(finalizados, logs_alertas)
+
+            # Alerta coordenadores, após o registro dos alertas aos usuários, que compõem o resumo dos alertas do dia
+            df_resumo_alertas_hj = resumo_alertas_hj(usuarios=df_usuarios,
+                                                   log_alertas_usuario=log_alertas_usuario)
+            if cfg['AGRUPAR_DESTINATARIOS']:
+                grupos_coord = agrupar_alertas(alertas_coord)
+            else:
+                grupos_coord = [([destinatario], cats_filtradas) for destinatario, cats_filtradas in alertas_coord]
+
+            for destinatarios, cats_filtradas in grupos_coord:
+                partes = partes_alerta(cats_filtradas, cat_pdf_dir, logo_saat, cfg)
+                for i, cats_parte in enumerate(partes, start=1):
+                    try:
+                        msg = mensagem_coordenador(coordenador=destinatarios[0],
+                                                   cats=cats_tratadas,
+                                                   cats_coord=cats_filtradas,
+                                                   cat_pdf_dir=cat_pdf_dir,
+                                                   df_resumo_alertas_hj=df_resumo_alertas_hj,
+                                                   template_html=alerta_adm_html_template,
+                                                   cfg=cfg,
+                                                   logo=logo_saat,
+                                                   df_resumo_cubo=df_resumo_cubo,
+                                                   cache_mime=cache_mime,
+                                                   cats_anexos=cats_parte,
+                                                   parte=(i, len(partes)) if len(partes) > 1 else None,
+                                                   cache_corpos=cache_corpos,
+                                                   destinatarios=[destinatario['E-mail']
+                                                                  for destinatario in destinatarios])
+                        enfileirar_alerta(caixa_saida, 'coordenador', destinatarios, cats_parte, msg,
+                                          id_execucao)
+                    except:
+                        for destinatario in destinatarios:
+                            log_alertas(log=log_alertas_adm, destinatario=destinatario, cats=cats_parte,
+                                        sucesso=False)
+
+            # Envia os alertas pendentes, aguardando as novas tentativas dos que falharam dentro do tempo máximo
+            finalizados = caixa_saida.drenar(despachante, espera_max=cfg['CAIXA_SAIDA']['ESPERA_MAX_S'])
+            bytes_envio_final, bytes_envio_compactados_final = log_alertas_finalizados(finalizados,
+                                                                                       logs_alertas)
+            bytes_anexos = bytes_envio + bytes_envio_final
+            bytes_anexos_compactados = bytes_envio_compactados + bytes_envio_compactados_final
 
         # Registra log da execução
         log_execucao(log_execucoes, sucesso=True, cats=cats_tratadas, log_alertas_usuario=log_alertas_usuario)
 
-        # Deleta os PDF do diretório de CATs
+        # Registra as métricas de desempenho da execução
+        estatisticas_cache_pdf = cache_pdf.estatisticas()
+        estatisticas_envio = limitador_envio.estatisticas()
+        estatisticas_mime = cache_mime.estatisticas()
+        estatisticas_corpos = cache_corpos.estatisticas()
+        log_desempenho(log_desempenho_execucao,
+                       {'cache_pdf_hits': estatisticas_cache_pdf['hits'],
+                        'cache_pdf_misses': estatisticas_cache_pdf['misses'],
+                        'bytes_anexos_pdf': bytes_anexos,
+                        'bytes_anexos_zip': bytes_anexos_compactados if cfg['ANEXOS_ZIP'] else '',
+                        'smtp_conexoes': despachante.conexoes_abertas,
+                        'envio_taxa_por_minuto': estatisticas_envio['taxa_por_minuto'],
+                        'envio_espera_total_s': estatisticas_envio['espera_total_s'],
+                        'envio_espera_max_s': estatisticas_envio['espera_max_s'],
+                        'envio_reducoes_taxa': estatisticas_envio['reducoes'],
+                        'mime_arquivos_codificados': estatisticas_mime['arquivos_codificados'],
+                        'mime_reutilizacoes': estatisticas_mime['reutilizacoes'],
+                        'mime_bytes_codificados': estatisticas_mime['bytes_codificados'],
+                        'corpos_montados': estatisticas_corpos['corpos_montados'],
+                        'corpos_reutilizados': estatisticas_corpos['corpos_reutilizados'],
+                        'corpos_taxa_deduplicacao': estatisticas_corpos['taxa_deduplicacao']})
+
+        # Deleta os PDF do diretório de CATs. Os PDFs permanecem disponíveis no cache para as próximas execuções
         pdfs = [file for file in os.listdir(cat_pdf_dir) if '.pdf' in file]
         for pdf in pdfs:
             os.remove(cat_pdf_dir / pdf)
+        cache_pdf.limpar()
+        caixa_saida.limpar(idade_max_dias=cfg['CAIXA_SAIDA']['IDADE_MAX_DIAS'])
+        for log_csv in logs_particionados:
+            backup.arquivar_log(log_csv, dias=cfg['LOGS']['DIAS_ARQUIVAMENTO'])
 
     except Exception as error:
         log_execucao(log_execucoes, sucesso=False)
@@ -1 +1,3 @@
-from .backup_csv import backup_csv, backup_csv_new_file, backup_csv_append
+from .backup_csv import backup_csv, backup_csv_new_file, backup_csv_append, backup_csv_append_lote, EscritorCSV
+from .log_particionado import (EscritorLog, log_append, ler_log, ler_log_recentes, log_existe, particionar_log,
+                               arquivar_log)
@@ -1,6 +1,9 @@
 """Módulo com funções para salvar backups em arquivo .csv"""
 
 from pathlib import Path
+import gzip
+import hashlib
+import numpy as np
 import pandas as pd
 import os
 from glob import glob
@@ -8,13 +11,83 @@ import csv
 from datetime import datetime
 
 
-def backup_csv(df: pd.DataFrame, backup_path: str | Path):
+def hashes_path(backup_path: str | Path) -> Path:
+    """Local do arquivo auxiliar com os hashes das linhas do backup incremental (ex.: usuarios.csv.hashes)"""
+    return Path(backup_path).with_name(Path(backup_path).name + '.hashes')
+
+
+def hashes_linhas(df: pd.DataFrame) -> np.ndarray:
+    """Calcula o hash (64 bits) de cada linha da DataFrame, considerando os valores de todas as colunas"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype='<u8')
+
+
+def _ler_hashes(backup_path: Path) -> tuple[int, int, np.ndarray] | None:
+    # Arquivo de hashes: tamanho do .csv e número de execuções desde a última compactação, seguidos dos hashes
+    path = hashes_path(backup_path)
+    if not path.is_file() or path.stat().st_size < 16:
+        return None
+    dados = np.fromfile(path, dtype='<u8')
+    return int(dados[0]), int(dados[1]), dados[2:]
+
+
+def _gravar_hashes(backup_path: Path, execucoes: int, hashes: np.ndarray, acrescentar: bool = False):
+    # Os hashes são gravados antes do cabeçalho. Se a gravação for interrompida, o tamanho do .csv registrado não
+    # corresponde ao do arquivo, e os hashes são recalculados na execução seguinte
+    with open(hashes_path(backup_path), 'r+b' if acrescentar else 'wb') as hashes_file:
+        if acrescentar:
+            hashes_file.seek(0, os.SEEK_END)
+        else:
+            hashes_file.write(np.zeros(2, dtype='<u8').tobytes())
+        hashes_file.write(hashes.astype('<u8').tobytes())
+        hashes_file.flush()
+        os.fsync(hashes_file.fileno())
+        hashes_file.seek(0)
+        hashes_file.write(np.array([os.path.getsize(backup_path), execucoes], dtype='<u8').tobytes())
+        hashes_file.flush()
+        os.fsync(hashes_file.fileno())
+
+
+def _backup_csv_incremental(df: pd.DataFrame, backup_path: Path, compactar_a_cada: int) -> bool:
+    """Acrescenta ao backup somente as linhas cujos hashes ainda não constam do arquivo de hashes. Retorna False, sem
+    alterar o backup, quando é necessária a compactação: arquivo de hashes ausente ou desatualizado, colunas diferentes
+    das do backup ou número de execuções desde a última compactação igual a compactar_a_cada."""
+    hashes_backup = _ler_hashes(backup_path)
+    if hashes_backup is None:
+        return False
+
+    tamanho_csv, execucoes, vistos = hashes_backup
+    if tamanho_csv != os.path.getsize(backup_path) or execucoes + 1 >= compactar_a_cada:
+        return False
+
+    with open(backup_path, newline='') as csv_file:
+        if next(csv.reader(csv_file), []) != [str(coluna) for coluna in df.columns]:
+            return False
+
+    hashes = hashes_linhas(df)
+    novas = ~np.isin(hashes, vistos) & ~pd.Series(hashes).duplicated().to_numpy()
+
+    if novas.any():
+        with open(backup_path, mode='a', newline='') as csv_file:
+            df[novas].to_csv(csv_file, header=False, index=False, quoting=csv.QUOTE_NONNUMERIC)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+    _gravar_hashes(backup_path, execucoes + 1, hashes[novas], acrescentar=True)
+    return True
+
+
+def backup_csv(df: pd.DataFrame, backup_path: str | Path, incremental: bool = False, compactar_a_cada: int = 30):
     """Faz backup da Dataframe em arquivo .csv quando ela for diferente do último backup realizado. O backup sobrescreve
     o arquivo anterior, adicionando os novos registros.
 
+    No modo incremental, os hashes das linhas do backup são mantidos em arquivo auxiliar (ver hashes_path), e somente
+    as linhas ainda não presentes no backup são acrescentadas ao arquivo, sem a sua leitura. A cada compactar_a_cada
+    execuções, o backup é lido e regravado sem linhas duplicadas, como no modo padrão, e os hashes são recalculados.
+
     Args:
         df: Pandas DataFrame com os dados a serem salvos
         backup_path: Diretório e nome do arquivo a ser salvo. Deve ser incluindo o sufixo '.csv'
+        incremental: Se True, utiliza o modo incremental
+        compactar_a_cada: No modo incremental, número de execuções entre as compactações do backup
     """
     if backup_path.suffix != '.csv':
         raise ValueError('O argumento backup_path deve conter o diretório e nome do arquivo a ser salvo, incluindo o sufixo .csv')
@@ -23,7 +96,11 @@ def backup_csv(df: pd.DataFrame, backup_path: str | Path):
     df = df.astype(str)
 
     if not os.path.isfile(backup_path):
-        df.to_csv(backup_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        compilado = df[~df.duplicated(keep='first')] if incremental else df
+        compilado.to_csv(backup_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    elif incremental and _backup_csv_incremental(df, backup_path, compactar_a_cada):
+        return
 
     else:
         df_backup = pd.read_csv(backup_path, dtype='object', keep_default_na=False)
@@ -33,30 +110,62 @@ def backup_csv(df: pd.DataFrame, backup_path: str | Path):
 
         compilado.to_csv(backup_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
 
+    if incremental:
+        _gravar_hashes(backup_path, 0, hashes_linhas(compilado.fillna('')))
+
+
+def digest_path(backup_file: str | Path) -> Path:
+    """Local do arquivo com o hash SHA-256 do conteúdo de um backup (ex.: 'opcoes 2022-08-01 T10.00.00.sha256')"""
+    nome = Path(backup_file).name.removesuffix('.gz').removesuffix('.csv')
+    return Path(backup_file).with_name(f'{nome}.sha256')
 
-def backup_csv_new_file(df: pd.DataFrame, backup_path: str | Path):
+
+def backup_csv_new_file(df: pd.DataFrame, backup_path: str | Path, compactar: bool = True):
     """Faz backup da Dataframe em arquivo .csv quando ela for diferente do último backup realizado. O backup se dá por
     meio da criação de um novo arquivo, com sufixo contendo data e hora.
 
+    A comparação com o último backup é feita pelo hash SHA-256 do conteúdo do arquivo .csv, gravado junto a cada backup
+    (ver digest_path), sem a leitura do backup anterior. Os backups anteriores à gravação dos hashes são lidos e
+    comparados com a DataFrame uma única vez: se forem iguais, o hash é gravado junto a eles.
+
     Args:
         df: Pandas DataFrame com os dados a serem salvos
         backup_path: Diretório e nome do arquivo a ser salvo. Deve ser incluindo o sufixo '.csv'
+        compactar: Se True, o novo backup é compactado em gzip (sufixo '.csv.gz')
     """
     if backup_path.suffix != '.csv':
         raise ValueError('O argumento backup_path deve conter o diretório e nome do arquivo a ser salvo, incluindo o sufixo .csv')
     Path(backup_path).parent.mkdir(parents=True, exist_ok=True)
 
-    backup_files = sorted(glob(f"{backup_path.parent / backup_path.stem} *.csv"))
+    # Os nomes diferem somente na data e hora, de modo que a ordem alfabética é a cronológica
+    backup_files = sorted(glob(f"{backup_path.parent / backup_path.stem} *.csv")
+                          + glob(f"{backup_path.parent / backup_path.stem} *.csv.gz"))
     agora_str = datetime.now().strftime("%Y-%m-%d T%H.%M.%S")
     df = df.astype(str)
 
-    if len(backup_files) == 0:
-        df.to_csv(f'{backup_path.parent / backup_path.stem} {agora_str}.csv', index=False, quoting=csv.QUOTE_NONNUMERIC)
-    else:
+    conteudo = df.to_csv(index=False, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n').encode('utf-8')
+    digest = hashlib.sha256(conteudo).hexdigest()
+
+    if len(backup_files) > 0:
         last_backup = backup_files[-1]
-        df_last_backup = pd.read_csv(last_backup, dtype='object', keep_default_na=False)
-        if not df.equals(df_last_backup):
-            df.to_csv(f'{backup_path.parent / backup_path.stem} {agora_str}.csv', index=False, quoting=csv.QUOTE_NONNUMERIC)
+        if digest_path(last_backup).is_file():
+            if digest_path(last_backup).read_text().strip() == digest:
+                return
+        else:
+            df_last_backup = pd.read_csv(last_backup, dtype='object', keep_default_na=False)
+            if df.equals(df_last_backup):
+                # O hash é gravado para o backup anterior, que deixa de ser lido nas próximas execuções
+                digest_path(last_backup).write_text(digest)
+                return
+
+    novo_backup = Path(f'{backup_path.parent / backup_path.stem} {agora_str}.csv')
+    if compactar:
+        # Sem a data de modificação no cabeçalho gzip, o mesmo conteúdo resulta no mesmo arquivo
+        novo_backup = novo_backup.with_name(novo_backup.name + '.gz')
+        novo_backup.write_bytes(gzip.compress(conteudo, mtime=0))
+    else:
+        novo_backup.write_bytes(conteudo)
+    digest_path(novo_backup).write_text(digest)
 
 
 def backup_csv_append(backup_path: str | Path, new_line_data: dict):
@@ -86,3 +195,87 @@ def backup_csv_append(backup_path: str | Path, new_line_data: dict):
 
         with open(backup_path, 'a') as csv_file:
             csv_file.write(linha)
+
+
+class EscritorCSV:
+    """Escritor de log em arquivo .csv, que acumula os registros em memória e os acrescenta ao arquivo em lote: o
+    cabeçalho é validado uma única vez, todas as linhas são gravadas em uma única escrita, com todos os campos entre
+    aspas (csv.QUOTE_ALL), e o arquivo é sincronizado com o disco (fsync) uma vez por lote. O formato é o mesmo de
+    backup_csv_append.
+
+    Args:
+        backup_path: Path do arquivo em formato .csv
+    """
+    def __init__(self, backup_path: str | Path):
+        backup_path = Path(backup_path)
+        if backup_path.suffix != '.csv':
+            raise ValueError('O argumento backup_path deve conter o diretório e nome do arquivo a ser salvo, incluindo o sufixo .csv')
+
+        self.backup_path = backup_path
+        self.colunas = None
+        self._linhas = []
+        self._cabecalho_validado = False
+
+    def adicionar(self, registros: pd.DataFrame | dict | list[dict]):
+        """Acrescenta registros ao lote. As chaves (ou colunas) representam o nome das colunas do arquivo.
+
+        Args:
+            registros: DataFrame, dicionário ou lista de dicionários com os dados dos novos registros
+        """
+        if isinstance(registros, dict):
+            registros = [registros]
+        df = registros if isinstance(registros, pd.DataFrame) else pd.DataFrame(registros)
+        if df.empty:
+            return
+
+        colunas = [str(coluna) for coluna in df.columns]
+        if self.colunas is None:
+            self.colunas = colunas
+        elif colunas != self.colunas:
+            raise ValueError('As colunas não correspondem ao cabeçalho do arquivo indicado.')
+
+        self._linhas.extend(df.astype(str).values.tolist())
+
+    def gravar(self):
+        """Acrescenta ao arquivo os registros acumulados, em uma única escrita"""
+        if not self._linhas:
+            return
+
+        cabecalho = ','.join(f'"{coluna}"' for coluna in self.colunas) + "\n"
+        novo_arquivo = not os.path.isfile(self.backup_path)
+
+        if novo_arquivo:
+            self.backup_path.parent.mkdir(parents=True, exist_ok=True)
+        elif not self._cabecalho_validado:
+            with open(self.backup_path) as csv_file:
+                if csv_file.readline() != cabecalho:
+                    raise ValueError('As colunas não correspondem ao cabeçalho do arquivo indicado.')
+        self._cabecalho_validado = True
+
+        with open(self.backup_path, mode='a', newline='') as csv_file:
+            writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL, lineterminator='\n')
+            if novo_arquivo:
+                writer.writerow(self.colunas)
+            writer.writerows(self._linhas)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+
+        self._linhas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.gravar()
+
+
+def backup_csv_append_lote(backup_path: str | Path, registros: pd.DataFrame | dict | list[dict]):
+    """Acrescenta vários registros a um arquivo .csv, em uma única escrita (ver EscritorCSV).
+
+    Args:
+        backup_path: Path do arquivo em formato .csv
+        registros: DataFrame, dicionário ou lista de dicionários com os dados dos novos registros
+    """
+    with EscritorCSV(backup_path) as escritor:
+        escritor.adicionar(registros)
@@ -0,0 +1,253 @@
+"""Módulo com funções para gravar e ler logs em .csv particionados por dia, com arquivamento compactado das partições
+antigas"""
+
+import csv
+import gzip
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+from .backup_csv import EscritorCSV
+
+SUFIXO_PARTICAO = '.csv'
+SUFIXO_ARQUIVO = '.csv.gz'
+
+
+def diretorio_particoes(log: str | Path) -> Path:
+    """Diretório das partições do log, com o nome do arquivo .csv, sem o sufixo (ex.: log/log_execucoes/)"""
+    return Path(log).with_suffix('')
+
+
+def particao_path(log: str | Path, dia: date) -> Path:
+    """Local da partição do log referente ao dia (ex.: log/log_execucoes/2022-08-01.csv)"""
+    return diretorio_particoes(log) / f'{dia.isoformat()}{SUFIXO_PARTICAO}'
+
+
+def particoes(log: str | Path, inicio: date | None = None, fim: date | None = None) -> list[tuple[date, Path]]:
+    """Lista as partições do log, ativas (.csv) ou arquivadas (.csv.gz), no intervalo de datas informado. Somente os
+    nomes dos arquivos são consultados.
+
+    Args:
+        log: Path do arquivo .csv correspondente ao log
+        inicio: Data inicial, inclusive. Se não informada, desde a primeira partição
+        fim: Data final, inclusive. Se não informada, até a última partição
+
+    Returns:
+        Lista, em ordem cronológica, com a data e o local de cada partição
+    """
+    diretorio = diretorio_particoes(log)
+    if not diretorio.is_dir():
+        return []
+
+    lista = []
+    for path in diretorio.iterdir():
+        for sufixo in (SUFIXO_PARTICAO, SUFIXO_ARQUIVO):
+            if path.name.endswith(sufixo):
+                try:
+                    dia = date.fromisoformat(path.name.removesuffix(sufixo))
+                except ValueError:
+                    break
+                if (inicio is None or dia >= inicio) and (fim is None or dia <= fim):
+                    lista.append((dia, path))
+                break
+
+    # Na mesma data, a partição arquivada precede a ativa, que contém registros posteriores ao arquivamento
+    return sorted(lista, key=lambda particao: (particao[0], not particao[1].name.endswith(SUFIXO_ARQUIVO)))
+
+
+def _dia_registros(df: pd.DataFrame) -> pd.Series:
+    if 'timestamp' in df.columns:
+        return df['timestamp'].astype(str).str[:10]
+    return pd.Series(date.today().isoformat(), index=df.index)
+
+
+class EscritorLog:
+    """Escritor de log particionado por dia, que acumula os registros em memória e, ao gravar, acrescenta cada registro
+    à partição da data do seu timestamp, em uma única escrita por partição (ver EscritorCSV). Registros sem a coluna
+    timestamp são gravados na partição da data corrente.
+
+    Args:
+        log: Path do arquivo .csv correspondente ao log
+    """
+    def __init__(self, log: str | Path):
+        if Path(log).suffix != '.csv':
+            raise ValueError('O argumento log deve conter o diretório e nome do arquivo, incluindo o sufixo .csv')
+        self.log = Path(log)
+        self._registros = []
+
+    def adicionar(self, registros: pd.DataFrame | dict | list[dict]):
+        """Acumula os registros para a próxima gravação.
+
+        Args:
+            registros: DataFrame, dicionário ou lista de dicionários com os dados dos novos registros
+        """
+        df = pd.DataFrame([registros] if isinstance(registros, dict) else registros)
+        if not df.empty:
+            self._registros.append(df)
+
+    def gravar(self):
+        """Acrescenta às partições os registros acumulados"""
+        if not self._registros:
+            return
+
+        df = pd.concat(self._registros, ignore_index=True)
+        for dia, registros_dia in df.groupby(_dia_registros(df), sort=True):
+            with EscritorCSV(particao_path(self.log, date.fromisoformat(dia))) as escritor:
+                escritor.adicionar(registros_dia)
+
+        self._registros = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.gravar()
+
+
+def log_append(log: str | Path, registros: pd.DataFrame | dict | list[dict]):
+    """Acrescenta os registros às partições diárias do log (ver EscritorLog).
+
+    Args:
+        log: Path do arquivo .csv correspondente ao log
+        registros: DataFrame, dicionário ou lista de dicionários com os dados dos novos registros
+    """
+    with EscritorLog(log) as escritor:
+        escritor.adicionar(registros)
+
+
+def _ler_legado(log: Path, inicio: date | None, fim: date | None, **kwargs) -> pd.DataFrame:
+    df = pd.read_csv(log, **kwargs)
+    if (inicio is not None or fim is not None) and 'timestamp' in df.columns:
+        dia = pd.to_datetime(df['timestamp']).dt.date
+        df = df[((dia >= inicio) if inicio is not None else True) & ((dia <= fim) if fim is not None else True)]
+    return df
+
+
+def ler_log(log: str | Path, inicio: date | None = None, fim: date | None = None, **kwargs) -> pd.DataFrame:
+    """Lê os registros do log no intervalo de datas informado, abrindo somente as partições desse intervalo. O arquivo
+    .csv ainda não particionado (ver particionar_log), se existir, também é lido.
+
+    Args:
+        log: Path do arquivo .csv correspondente ao log
+        inicio: Data inicial, inclusive. Se não informada, desde o primeiro registro
+        fim: Data final, inclusive. Se não informada, até o último registro
+        **kwargs: Argumentos repassados a pd.read_csv (ex.: dtype)
+
+    Returns:
+        DataFrame com os registros. Se não houver registros, DataFrame vazio
+    """
+    dfs = []
+    if Path(log).is_file():
+        dfs.append(_ler_legado(Path(log), inicio, fim, **kwargs))
+    dfs.extend(pd.read_csv(path, **kwargs) for _, path in particoes(log, inicio, fim))
+
+    if not dfs:
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+
+def ler_log_recentes(log: str | Path, **kwargs) -> Iterator[pd.DataFrame]:
+    """Lê as partições do log, uma a uma, da mais recente para a mais antiga, e, por último, o arquivo .csv ainda não
+    particionado, se existir. Permite obter os últimos registros sem a leitura do log completo.
+
+    Args:
+        log: Path do arquivo .csv correspondente ao log
+        **kwargs: Argumentos repassados a pd.read_csv (ex.: dtype)
+
+    Yields:
+        DataFrame com os registros de cada partição
+    """
+    for _, path in reversed(particoes(log)):
+        yield pd.read_csv(path, **kwargs)
+    if Path(log).is_file():
+        yield pd.read_csv(log, **kwargs)
+
+
+def log_existe(log: str | Path) -> bool:
+    """Indica se há registros gravados no log, particionado ou não"""
+    return Path(log).is_file() or bool(particoes(log))
+
+
+def _gravar_arquivo(arquivo: Path, dados: bytes):
+    """Grava o arquivo compactado em gzip por meio de arquivo temporário no mesmo diretório, que o substitui
+    atomicamente. Uma interrupção durante a gravação preserva o conteúdo anterior"""
+    temporario = tempfile.NamedTemporaryFile(dir=arquivo.parent, prefix=f'.{arquivo.name}.', suffix='.tmp',
+                                             delete=False)
+    try:
+        with temporario:
+            with gzip.GzipFile(fileobj=temporario, mode='wb') as destino:
+                destino.write(dados)
+            temporario.flush()
+            os.fsync(temporario.fileno())
+        os.replace(temporario.name, arquivo)
+    except BaseException:
+        Path(temporario.name).unlink(missing_ok=True)
+        raise
+
+
+def particionar_log(log: str | Path) -> int:
+    """Divide o arquivo .csv do log, gravado antes da adoção das partições, nas partições diárias. Os registros de cada
+    dia são gravados, já compactados, na partição arquivada (.csv.gz), que é substituída por inteiro, de modo que a
+    divisão interrompida possa ser repetida sem a duplicação dos registros. Após a gravação das partições, o arquivo é
+    renomeado com o sufixo .migrado.
+
+    Args:
+        log: Path do arquivo .csv do log
+
+    Returns:
+        Número de registros migrados
+    """
+    log = Path(log)
+    if not log.is_file():
+        return 0
+
+    df = pd.read_csv(log, dtype='object', keep_default_na=False)
+    for dia, registros_dia in df.groupby(_dia_registros(df), sort=True):
+        arquivo = diretorio_particoes(log) / f'{dia}{SUFIXO_ARQUIVO}'
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        dados = registros_dia.to_csv(index=False, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        _gravar_arquivo(arquivo, dados.encode())
+    log.rename(log.with_suffix('.csv.migrado'))
+    return len(df)
+
+
+def arquivar_log(log: str | Path, dias: int, hoje: date | None = None) -> int:
+    """Compacta, em gzip, as partições do log anteriores ao número de dias informado. As partições arquivadas
+    (.csv.gz) continuam sendo lidas por ler_log. O arquivo compactado é substituído atomicamente antes da remoção da
+    partição e, se o arquivamento for interrompido entre as duas etapas, a partição já arquivada é apenas removida na
+    execução seguinte.
+
+    Args:
+        log: Path do arquivo .csv correspondente ao log
+        dias: Idade mínima, em dias, das partições arquivadas
+        hoje: Data de referência. Se não informada, a data corrente
+
+    Returns:
+        Número de partições arquivadas
+    """
+    limite = (hoje or datetime.now().date()) - timedelta(days=dias)
+    arquivadas = 0
+    for dia, path in particoes(log, fim=limite - timedelta(days=1)):
+        if not path.name.endswith(SUFIXO_PARTICAO):
+            continue
+
+        arquivo = path.with_name(f'{dia.isoformat()}{SUFIXO_ARQUIVO}')
+        dados = path.read_bytes()
+        if arquivo.exists():
+            with gzip.open(arquivo, 'rb') as origem:
+                arquivados = origem.read()
+            # Registros gravados após o arquivamento da data são acrescentados, sem o cabeçalho, ao mesmo arquivo
+            dados = dados.partition(b'\n')[2]
+            if not arquivados.endswith(dados):
+                _gravar_arquivo(arquivo, arquivados + dados)
+        else:
+            _gravar_arquivo(arquivo, dados)
+        path.unlink()
+        arquivadas += 1
+
+    return arquivadas
@@ -1 +1,7 @@
-from .email_sender import EmailMessageHTML, EmailMessagText
\ No newline at end of file
+from .email_sender import SessaoSMTP, EmailMessageHTML, EmailMessagText, CorpoHTML, corpo_html
+from .limitador import LimitadorTaxa, LimiteDiarioExcedido
+from .despachante import DespachanteSMTP, ResultadoEnvio
+from .cache_mime import CacheMIME
+from .cache_corpos import CacheCorpos
+from .caixa_saida import CaixaSaida
+from .divisao import dividir_anexos, tamanho_codificado, tamanho_compactado
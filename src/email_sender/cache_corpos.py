@@ -0,0 +1,69 @@
+"""Módulo com o cache, por execução, dos corpos das mensagens já montados (html, imagens e anexos)"""
+
+import hashlib
+import json
+import threading
+from typing import Callable
+
+from .email_sender import CorpoHTML
+
+
+class CacheCorpos:
+    """Mantém em memória os corpos das mensagens já montados, indexados por uma chave derivada do conteúdo (ex.: CATs
+    incluídas e campos do template). Destinatários que recebem as mesmas CATs, com os mesmos campos, recebem corpos
+    idênticos, que são montados uma única vez por execução; somente os cabeçalhos são montados para cada mensagem.
+    """
+    def __init__(self):
+        self._corpos = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def chave(*componentes) -> str:
+        """Calcula a chave do corpo, a partir dos componentes que determinam o seu conteúdo.
+
+        Args:
+            *componentes: Valores serializáveis em JSON (ex.: recibos das CATs e campos do template)
+
+        Returns:
+            Hash SHA-256 dos componentes
+        """
+        return hashlib.sha256(json.dumps(componentes, default=str).encode('utf-8')).hexdigest()
+
+    def obter(self, chave: str, montar: Callable[[], CorpoHTML]) -> CorpoHTML:
+        """Retorna o corpo correspondente à chave, montando-o somente na primeira vez.
+
+        Args:
+            chave: Chave do corpo (ver chave)
+            montar: Função, sem argumentos, que monta o corpo
+
+        Returns:
+            Corpo da mensagem
+        """
+        with self._lock:
+            if chave in self._corpos:
+                self.hits += 1
+                return self._corpos[chave]
+
+        corpo = montar()
+
+        with self._lock:
+            if chave in self._corpos:
+                self.hits += 1
+                return self._corpos[chave]
+            self._corpos[chave] = corpo
+            self.misses += 1
+            return corpo
+
+    def estatisticas(self) -> dict:
+        """Retorna as estatísticas de uso do cache na execução corrente.
+
+        Returns:
+            Dicionário com o número de corpos montados, de reutilizações e a taxa de deduplicação (fração das mensagens
+            cujo corpo foi reutilizado)
+        """
+        total = self.hits + self.misses
+        return {'corpos_montados': self.misses,
+                'corpos_reutilizados': self.hits,
+                'taxa_deduplicacao': round(self.hits / total, 4) if total else 0.0}
@@ -0,0 +1,73 @@
+"""Módulo com o cache, por execução, das partes MIME já codificadas (imagens e anexos)"""
+
+import base64
+import os
+import threading
+from email import encoders
+from email.mime.application import MIMEApplication
+from pathlib import Path
+
+
+class CacheMIME:
+    """Mantém em memória o conteúdo, já codificado em base64, dos arquivos incluídos nas mensagens, indexado pelo
+    caminho, data de modificação e tamanho do arquivo. Cada imagem ou anexo é lido e codificado uma única vez por
+    execução, e o conteúdo codificado é reutilizado em todas as mensagens que o incluem.
+    """
+    def __init__(self):
+        self._conteudos = {}
+        self._lock = threading.Lock()
+        self.bytes_codificados = 0
+        self.hits = 0
+        self.misses = 0
+
+    def conteudo(self, path: Path) -> str:
+        """Retorna o conteúdo do arquivo codificado em base64, lendo-o do disco somente na primeira vez.
+
+        Args:
+            path: Local do arquivo
+
+        Returns:
+            Conteúdo codificado em base64, em linhas de 76 caracteres
+        """
+        stat = os.stat(path)
+        chave = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if chave in self._conteudos:
+                self.hits += 1
+                return self._conteudos[chave]
+
+            with open(path, 'rb') as f:
+                dados = f.read()
+            # Mesma codificação de email.encoders.encode_base64
+            conteudo = base64.encodebytes(dados).decode('ascii')
+
+            self._conteudos[chave] = conteudo
+            self.bytes_codificados += len(dados)
+            self.misses += 1
+            return conteudo
+
+    def parte(self, path: Path, **params) -> MIMEApplication:
+        """Cria a parte MIME do arquivo, com o conteúdo codificado obtido do cache.
+
+        Args:
+            path: Local do arquivo
+            **params: Parâmetros do cabeçalho Content-Type (ex.: Name)
+
+        Returns:
+            Parte MIME com o arquivo codificado em base64
+        """
+        parte = MIMEApplication(b'', _encoder=encoders.encode_noop, **params)
+        parte.set_payload(self.conteudo(path))
+        parte['Content-Transfer-Encoding'] = 'base64'
+        return parte
+
+    def estatisticas(self) -> dict:
+        """Retorna as estatísticas de uso do cache na execução corrente.
+
+        Returns:
+            Dicionário com o número de arquivos codificados, de reutilizações e o total de bytes codificados
+        """
+        return {'arquivos_codificados': self.misses,
+                'reutilizacoes': self.hits,
+                'bytes_codificados': self.bytes_codificados}
@@ -0,0 +1,318 @@
+"""Módulo com a caixa de saída persistente, que armazena as mensagens prontas até a confirmação do envio"""
+
+import contextlib
+import functools
+import hashlib
+import json
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO
+
+from .despachante import DespachanteSMTP
+from .email_sender import EmailMessage, TAMANHO_BLOCO
+
+PENDENTE = 'pendente'
+ENVIADA = 'enviada'
+FALHOU = 'falhou'
+
+# Separador dos destinatários das mensagens com vários destinatários, armazenados em uma única coluna
+SEPARADOR_DESTINATARIOS = ','
+
+
+class MensagemArmazenada(EmailMessage):
+    """Mensagem já serializada, lida da caixa de saída em blocos, no momento do envio"""
+    def __init__(self, message_id: str, sender_email: str, destinatario: str | list[str], db_path: Path, rowid: int):
+        self.message_id = message_id
+        self.sender_email = sender_email
+        self.destinatario = destinatario
+        self.db_path = db_path
+        self.rowid = rowid
+        self.message = None
+
+    def escrever(self, destino: BinaryIO):
+        # Conexão própria, pois a leitura ocorre na thread de envio
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conexao:
+            with conexao.blobopen('mensagens', 'conteudo', self.rowid, readonly=True) as blob:
+                while bloco := blob.read(TAMANHO_BLOCO):
+                    destino.write(bloco)
+
+
+def falha_definitiva(erro: Exception | None) -> bool:
+    """Indica se o erro no envio é definitivo (respostas 5xx do servidor), caso em que não há nova tentativa"""
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return erro.smtp_code >= 500
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return all(codigo >= 500 for codigo, _ in erro.recipients.values())
+    return False
+
+
+class CaixaSaida:
+    """Caixa de saída em SQLite com as mensagens já montadas e serializadas, cada uma com um Message-ID estável,
+    derivado de uma chave informada pelo chamador. Uma mensagem com a mesma chave não é enfileirada novamente, e as
+    mensagens pendentes são enviadas, com novas tentativas em intervalos crescentes (backoff exponencial), até serem
+    marcadas como enviadas, uma única vez, ou como falhas após o número máximo de tentativas.
+
+    Args:
+        db_path: Local do arquivo SQLite da caixa de saída
+        tentativas_max: Número máximo de tentativas de envio de cada mensagem
+        espera_base: Espera, em segundos, antes da segunda tentativa. A espera dobra a cada nova tentativa
+        dominio: Domínio utilizado no Message-ID
+        relogio: Função que retorna o instante atual, em segundos desde a época
+        dormir: Função que suspende a execução pelo tempo informado, em segundos
+    """
+    def __init__(self,
+                 db_path: Path,
+                 tentativas_max: int = 5,
+                 espera_base: float = 30,
+                 dominio: str = 'saat.local',
+                 relogio=time.time,
+                 dormir=time.sleep):
+        self.db_path = Path(db_path)
+        self.tentativas_max = tentativas_max
+        self.espera_base = espera_base
+        self.dominio = dominio
+        self._relogio = relogio
+        self._dormir = dormir
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conexao:
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS mensagens (
+                    message_id TEXT PRIMARY KEY,
+                    remetente TEXT NOT NULL,
+                    destinatario TEXT NOT NULL,
+                    conteudo BLOB,
+                    metadados TEXT,
+                    status TEXT NOT NULL,
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    proxima_tentativa REAL NOT NULL,
+                    erro TEXT,
+                    criada_em REAL NOT NULL,
+                    enviada_em REAL
+                )""")
+            self._conexao.execute('CREATE INDEX IF NOT EXISTS idx_mensagens_status '
+                                  'ON mensagens (status, proxima_tentativa)')
+
+    def message_id(self, chave: str) -> str:
+        """Calcula o Message-ID estável correspondente à chave.
+
+        Args:
+            chave: Chave que identifica a mensagem (ex.: destinatário, data e CATs incluídas)
+
+        Returns:
+            Message-ID, no formato <hash@dominio>
+        """
+        return f'<{hashlib.sha256(chave.encode("utf-8")).hexdigest()[:32]}@{self.dominio}>'
+
+    def enfileirar(self, mensagem: EmailMessage, chave: str, metadados: dict | None = None) -> str:
+        """Insere a mensagem na caixa de saída, com o Message-ID derivado da chave. Se já houver mensagem com a mesma
+        chave, pendente ou já enviada, a mensagem não é inserida novamente.
+
+        Args:
+            mensagem: Mensagem a ser enviada
+            chave: Chave que identifica a mensagem
+            metadados: Dicionário, serializável em JSON, com dados associados à mensagem, retornados após o envio
+
+        Returns:
+            Message-ID da mensagem
+        """
+        message_id = self.message_id(chave)
+        del mensagem.message['Message-ID']
+        mensagem.message['Message-ID'] = message_id
+
+        # A mensagem é serializada em arquivo temporário e copiada em blocos para o banco
+        with tempfile.SpooledTemporaryFile(max_size=16 * TAMANHO_BLOCO) as conteudo:
+            mensagem.escrever(conteudo)
+            tamanho = conteudo.tell()
+            conteudo.seek(0)
+
+            destinatario = mensagem.destinatario
+            if not isinstance(destinatario, str):
+                destinatario = SEPARADOR_DESTINATARIOS.join(destinatario)
+
+            agora = self._relogio()
+            with self._lock, self._conexao:
+                cursor = self._conexao.execute(
+                    'INSERT OR IGNORE INTO mensagens (message_id, remetente, destinatario, conteudo, metadados, status, '
+                    'proxima_tentativa, criada_em) VALUES (?, ?, ?, zeroblob(?), ?, ?, ?, ?)',
+                    (message_id, mensagem.sender_email, destinatario, tamanho,
+                     json.dumps(metadados, default=str), PENDENTE, agora, agora))
+
+                if cursor.rowcount:
+                    with self._conexao.blobopen('mensagens', 'conteudo', cursor.lastrowid) as blob:
+                        while bloco := conteudo.read(TAMANHO_BLOCO):
+                            blob.write(bloco)
+
+        return message_id
+
+    def pendentes(self) -> list[dict]:
+        """Retorna as mensagens pendentes de envio.
+
+        Returns:
+            Lista de dicionários com o Message-ID, o destinatário, a lista dos destinatários, o número de tentativas e
+            os metadados de cada mensagem
+        """
+        with self._lock:
+            linhas = self._conexao.execute('SELECT message_id, destinatario, tentativas, metadados FROM mensagens '
+                                           'WHERE status = ? ORDER BY criada_em', (PENDENTE,)).fetchall()
+        return [{'message_id': message_id, 'destinatario': destinatario,
+                 'destinatarios': destinatario.split(SEPARADOR_DESTINATARIOS), 'tentativas': tentativas,
+                 'metadados': json.loads(metadados)}
+                for message_id, destinatario, tentativas, metadados in linhas]
+
+    def _mensagem(self, message_id: str) -> MensagemArmazenada:
+        with self._lock:
+            rowid, remetente, destinatario = self._conexao.execute(
+                'SELECT rowid, remetente, destinatario FROM mensagens WHERE message_id = ?',
+                (message_id,)).fetchone()
+        if SEPARADOR_DESTINATARIOS in destinatario:
+            destinatario = destinatario.split(SEPARADOR_DESTINATARIOS)
+        return MensagemArmazenada(message_id, remetente, destinatario, self.db_path, rowid)
+
+    def _reenfileirar(self, message_id: str, destinatarios: list[str], agora: float):
+        """Insere, como nova mensagem pendente, o mesmo conteúdo da mensagem informada, aos destinatários indicados,
+        para nova tentativa após a espera. Deve ser chamado antes do descarte do conteúdo da mensagem original"""
+        novo_message_id = self.message_id(f'{message_id}|{SEPARADOR_DESTINATARIOS.join(destinatarios)}')
+        self._conexao.execute(
+            'INSERT OR IGNORE INTO mensagens (message_id, remetente, destinatario, conteudo, metadados, status, '
+            'tentativas, proxima_tentativa, criada_em) '
+            'SELECT ?, remetente, ?, conteudo, metadados, ?, tentativas + 1, ? + ? * (1 << tentativas), ? '
+            'FROM mensagens WHERE message_id = ?',
+            (novo_message_id, SEPARADOR_DESTINATARIOS.join(destinatarios), PENDENTE, agora, self.espera_base, agora,
+             message_id))
+
+    def _registrar(self,
+                   message_id: str,
+                   sucesso: bool,
+                   erro: Exception | None,
+                   recusados: dict | None = None) -> dict | None:
+        """Registra o resultado de uma tentativa de envio e, se a mensagem chegou ao estado final, retorna seus dados"""
+        agora = self._relogio()
+        reenfileirados = []
+        with self._lock, self._conexao:
+            if sucesso:
+                # Os destinatários recusados temporariamente (4xx), quando a mensagem foi aceita para os demais,
+                # recebem a mesma mensagem em nova tentativa, enquanto não atingido o número máximo de tentativas
+                if recusados:
+                    tentativas, status = self._conexao.execute('SELECT tentativas, status FROM mensagens '
+                                                                'WHERE message_id = ?', (message_id,)).fetchone()
+                    if status == PENDENTE and tentativas + 1 < self.tentativas_max:
+                        reenfileirados = sorted(destinatario for destinatario, (codigo, _) in recusados.items()
+                                                if codigo < 500)
+                    if reenfileirados:
+                        self._reenfileirar(message_id, reenfileirados, agora)
+
+                # O conteúdo é descartado; o registro é mantido para impedir o reenvio da mesma mensagem. Os
+                # destinatários recusados são registrados como erro
+                atualizadas = self._conexao.execute('UPDATE mensagens SET status = ?, enviada_em = ?, conteudo = NULL, '
+                                                    'tentativas = tentativas + 1, erro = ? '
+                                                    'WHERE message_id = ? AND status = ?',
+                                                    (ENVIADA, agora, repr(recusados) if recusados else None,
+                                                     message_id, PENDENTE)).rowcount
+                status = ENVIADA
+            else:
+                tentativas, = self._conexao.execute('SELECT tentativas FROM mensagens WHERE message_id = ?',
+                                                    (message_id,)).fetchone()
+                tentativas += 1
+                if tentativas >= self.tentativas_max or falha_definitiva(erro):
+                    status = FALHOU
+                    proxima_tentativa = agora
+                else:
+                    status = PENDENTE
+                    proxima_tentativa = agora + self.espera_base * 2 ** (tentativas - 1)
+                atualizadas = self._conexao.execute('UPDATE mensagens SET status = ?, tentativas = ?, '
+                                                    'proxima_tentativa = ?, erro = ? '
+                                                    'WHERE message_id = ? AND status = ?',
+                                                    (status, tentativas, proxima_tentativa, repr(erro), message_id,
+                                                     PENDENTE)).rowcount
+
+            if not atualizadas or status == PENDENTE:
+                return None
+
+            metadados, destinatario = self._conexao.execute('SELECT metadados, destinatario FROM mensagens '
+                                                            'WHERE message_id = ?', (message_id,)).fetchone()
+        return {'message_id': message_id, 'status': status, 'metadados': json.loads(metadados),
+                'destinatarios': destinatario.split(SEPARADOR_DESTINATARIOS),
+                'recusados': sorted(set(recusados) - set(reenfileirados)) if sucesso and recusados else [],
+                'reenfileirados': reenfileirados}
+
+    def drenar(self, despachante: DespachanteSMTP, espera_max: float = 0) -> list[dict]:
+        """Envia as mensagens pendentes cuja próxima tentativa já está liberada. Enquanto houver mensagens pendentes
+        com nova tentativa prevista dentro do tempo de espera máximo, aguarda e envia novamente.
+
+        Args:
+            despachante: Despachante utilizado no envio das mensagens
+            espera_max: Tempo máximo, em segundos, de espera pelas novas tentativas
+
+        Returns:
+            Lista de dicionários com o Message-ID, o status final ('enviada' ou 'falhou'), os metadados e os
+            destinatários das mensagens que chegaram ao estado final. Nas mensagens enviadas aos demais destinatários,
+            são informados os destinatários recusados definitivamente pelo servidor e os recusados temporariamente, que
+            receberão a mensagem em nova tentativa, como nova mensagem pendente
+        """
+        finalizadas = []
+        limite = self._relogio() + espera_max
+
+        while True:
+            with self._lock:
+                ids = [message_id for message_id, in self._conexao.execute(
+                    'SELECT message_id FROM mensagens WHERE status = ? AND proxima_tentativa <= ? ORDER BY criada_em',
+                    (PENDENTE, self._relogio()))]
+
+            resultados = despachante.despachar([functools.partial(self._mensagem, message_id) for message_id in ids])
+            for message_id, resultado in zip(ids, resultados):
+                finalizada = self._registrar(message_id, resultado.sucesso, resultado.erro, resultado.recusados)
+                if finalizada is not None:
+                    finalizadas.append(finalizada)
+
+            with self._lock:
+                proxima_tentativa, = self._conexao.execute(
+                    'SELECT MIN(proxima_tentativa) FROM mensagens WHERE status = ?', (PENDENTE,)).fetchone()
+
+            if proxima_tentativa is None or proxima_tentativa > limite:
+                return finalizadas
+            self._dormir(max(0.0, proxima_tentativa - self._relogio()))
+
+    def destinatarios_dia(self, dia: date | None = None) -> int:
+        """Conta os destinatários das mensagens enviadas em um dia, inclusive em execuções anteriores.
+
+        Args:
+            dia: Data dos envios. Se não informada, a data corrente
+
+        Returns:
+            Número de destinatários
+        """
+        dia = dia or date.fromtimestamp(self._relogio())
+        inicio = datetime.combine(dia, datetime.min.time()).timestamp()
+        fim = datetime.combine(dia + timedelta(days=1), datetime.min.time()).timestamp()
+        with self._lock:
+            linhas = self._conexao.execute('SELECT destinatario FROM mensagens '
+                                           'WHERE status = ? AND enviada_em >= ? AND enviada_em < ?',
+                                           (ENVIADA, inicio, fim)).fetchall()
+        return sum(len(destinatario.split(SEPARADOR_DESTINATARIOS)) for destinatario, in linhas)
+
+    def limpar(self, idade_max_dias: float):
+        """Remove os registros das mensagens já enviadas ou com falha criadas há mais do que a idade máxima.
+
+        Args:
+            idade_max_dias: Idade máxima, em dias, dos registros mantidos
+        """
+        with self._lock, self._conexao:
+            self._conexao.execute('DELETE FROM mensagens WHERE status != ? AND criada_em < ?',
+                                  (PENDENTE, self._relogio() - idade_max_dias * 86400))
+
+    def fechar(self):
+        self._conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.fechar()
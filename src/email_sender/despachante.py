@@ -0,0 +1,86 @@
+"""Módulo com o despachante concorrente de e-mails, que envia as mensagens por várias sessões SMTP simultâneas"""
+
+import asyncio
+from typing import Callable, NamedTuple
+
+from .email_sender import EmailMessage, SessaoSMTP
+
+
+class ResultadoEnvio(NamedTuple):
+    """Resultado do envio de uma mensagem pelo despachante. Nas mensagens com vários destinatários, os recusados
+    pelo servidor, quando a mensagem é aceita para os demais, são informados em recusados"""
+    sucesso: bool
+    mensagem: EmailMessage | None
+    erro: Exception | None
+    recusados: dict | None = None
+
+
+class DespachanteSMTP:
+    """Envia mensagens concorrentemente por um conjunto de sessões SMTP autenticadas, mantidas abertas entre os
+    despachos. A montagem de cada mensagem (MIME) e o seu envio são executados em threads, sob a coordenação de um
+    laço asyncio; a taxa global é controlada pelo limitador compartilhado pelas sessões.
+
+    Args:
+        criar_sessao: Função que cria uma nova sessão SMTP, ainda não conectada
+        conexoes: Número máximo de sessões SMTP simultâneas
+    """
+    def __init__(self, criar_sessao: Callable[[], SessaoSMTP], conexoes: int = 1):
+        self.criar_sessao = criar_sessao
+        self.conexoes = max(1, conexoes)
+        self.sessoes = []
+
+    @property
+    def conexoes_abertas(self) -> int:
+        """Número de conexões abertas pelas sessões, incluindo as reconexões"""
+        return sum(sessao.conexoes for sessao in self.sessoes)
+
+    def despachar(self, construtores: list[Callable[[], EmailMessage]]) -> list[ResultadoEnvio]:
+        """Monta e envia as mensagens, concorrentemente, pelas sessões SMTP.
+
+        Args:
+            construtores: Lista de funções, sem argumentos, que montam cada mensagem
+
+        Returns:
+            Lista com o resultado do envio de cada mensagem, na mesma ordem dos construtores
+        """
+        if not construtores:
+            return []
+
+        while len(self.sessoes) < min(self.conexoes, len(construtores)):
+            self.sessoes.append(self.criar_sessao())
+
+        return asyncio.run(self._despachar(construtores))
+
+    async def _despachar(self, construtores: list[Callable[[], EmailMessage]]) -> list[ResultadoEnvio]:
+        sessoes_livres = asyncio.Queue()
+        for sessao in self.sessoes:
+            sessoes_livres.put_nowait(sessao)
+
+        # Limita as mensagens montadas e ainda não enviadas, para não mantê-las todas em memória
+        em_andamento = asyncio.Semaphore(2 * len(self.sessoes))
+
+        async def enviar(construir: Callable[[], EmailMessage]) -> ResultadoEnvio:
+            async with em_andamento:
+                try:
+                    mensagem = await asyncio.to_thread(construir)
+                    sessao = await sessoes_livres.get()
+                    try:
+                        recusados = await asyncio.to_thread(mensagem.send, sessao=sessao)
+                    finally:
+                        sessoes_livres.put_nowait(sessao)
+                except Exception as error:
+                    return ResultadoEnvio(sucesso=False, mensagem=None, erro=error)
+
+                return ResultadoEnvio(sucesso=True, mensagem=mensagem, erro=None, recusados=recusados)
+
+        return await asyncio.gather(*(enviar(construir) for construir in construtores))
+
+    def fechar(self):
+        for sessao in self.sessoes:
+            sessao.fechar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.fechar()
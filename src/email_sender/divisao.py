@@ -0,0 +1,103 @@
+"""Módulo com a divisão dos anexos em mensagens que respeitam o tamanho máximo aceito pelo servidor SMTP"""
+
+import os
+import zlib
+from pathlib import Path
+
+# Tamanho estimado dos cabeçalhos MIME de cada anexo, sem o nome do arquivo
+CABECALHOS_ANEXO = 256
+
+# Tamanho dos registros do arquivo .zip, sem os nomes dos arquivos: cabeçalho local e registro no diretório central, de
+# cada arquivo, e registro final do diretório central
+REGISTROS_ZIP_ARQUIVO = 30 + 46
+REGISTRO_ZIP_FINAL = 22
+
+# Tamanho dos blocos lidos na compactação dos anexos
+TAMANHO_BLOCO = 64 * 1024
+
+
+def tamanho_codificado(tamanho: int) -> int:
+    """Calcula o tamanho de um conteúdo após a codificação base64, em linhas de 76 caracteres terminadas em CRLF.
+
+    Args:
+        tamanho: Tamanho original, em bytes
+
+    Returns:
+        Tamanho codificado, em bytes
+    """
+    return 4 * -(-tamanho // 3) + 2 * -(-tamanho // 57)
+
+
+def tamanho_anexo(anexo: Path) -> int:
+    """Estima o tamanho que o arquivo ocupa na mensagem, como anexo codificado em base64, incluindo os cabeçalhos.
+
+    Args:
+        anexo: Local do arquivo
+
+    Returns:
+        Tamanho estimado, em bytes
+    """
+    return tamanho_codificado(os.path.getsize(anexo)) + CABECALHOS_ANEXO + 2 * len(Path(anexo).name)
+
+
+def tamanho_compactado(anexo: Path, nivel: int = 9) -> int:
+    """Calcula o tamanho que o arquivo ocupa em um arquivo .zip, com a mesma compressão (deflate) utilizada na
+    compactação dos anexos (ver corpo_html), incluindo os seus registros no .zip. O arquivo é lido em blocos.
+
+    Args:
+        anexo: Local do arquivo
+        nivel: Nível de compressão
+
+    Returns:
+        Tamanho compactado, em bytes
+    """
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    tamanho = 0
+    with open(anexo, 'rb') as f:
+        while bloco := f.read(TAMANHO_BLOCO):
+            tamanho += len(compressor.compress(bloco))
+    tamanho += len(compressor.flush())
+    return tamanho + REGISTROS_ZIP_ARQUIVO + 2 * len(Path(anexo).name.encode('utf-8'))
+
+
+def dividir_anexos(anexos: list[Path],
+                   orcamento_bytes: int,
+                   bytes_fixos: int = 0,
+                   compactar: bool = False,
+                   nome_zip: str = 'CATs.zip') -> list[list[Path]]:
+    """Divide os anexos no menor número de mensagens que respeitem o limite de tamanho, pelo tamanho efetivo de cada
+    anexo (heurística first-fit decreasing). Um anexo que, sozinho, excede o limite é enviado em mensagem própria.
+
+    Args:
+        anexos: Lista com os locais dos anexos
+        orcamento_bytes: Tamanho máximo de cada mensagem, em bytes
+        bytes_fixos: Tamanho das partes repetidas em todas as mensagens (corpo, imagens e cabeçalhos), em bytes
+        compactar: Se True, os anexos de cada mensagem são reunidos em um único arquivo .zip (ver corpo_html), e é
+            considerado o tamanho compactado de cada anexo
+        nome_zip: Nome do arquivo .zip
+
+    Returns:
+        Lista com os anexos de cada mensagem, na ordem original
+    """
+    capacidade = orcamento_bytes - bytes_fixos
+    if compactar:
+        # A codificação base64 de cada anexo compactado, em separado, resulta em tamanho igual ou maior que a do .zip
+        # inteiro, de modo que a soma não subestima o tamanho da mensagem
+        capacidade -= tamanho_codificado(REGISTRO_ZIP_FINAL) + CABECALHOS_ANEXO + 2 * len(nome_zip)
+        tamanhos = {anexo: tamanho_codificado(tamanho_compactado(anexo)) for anexo in anexos}
+    else:
+        tamanhos = {anexo: tamanho_anexo(anexo) for anexo in anexos}
+    ordem = {anexo: i for i, anexo in enumerate(anexos)}
+
+    grupos = []
+    for anexo in sorted(anexos, key=tamanhos.get, reverse=True):
+        for grupo in grupos:
+            if grupo['livre'] >= tamanhos[anexo]:
+                grupo['anexos'].append(anexo)
+                grupo['livre'] -= tamanhos[anexo]
+                break
+        else:
+            grupos.append({'livre': capacidade - tamanhos[anexo], 'anexos': [anexo]})
+
+    divisao = [sorted(grupo['anexos'], key=ordem.get) for grupo in grupos]
+    return sorted(divisao, key=lambda grupo: ordem[grupo[0]])
@@ -1,16 +1,367 @@
 """Módulo com funções para enviar alertas por e-mail para os usuários do sistema"""
 
+import base64
+import io
 import os
+import re
+import secrets
+import weakref
 from pathlib import Path
 from os.path import basename
 import smtplib
 import ssl
+import tempfile
+import zipfile
+from typing import BinaryIO, Callable, NamedTuple
+from email import encoders
+from email.generator import BytesGenerator
+from email.message import Message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-from time import sleep
 
-from jinja2 import Template
+from utils import jinja_template
+
+from .cache_mime import CacheMIME
+from .limitador import LimitadorTaxa
+
+# Tamanho dos blocos transmitidos ao servidor SMTP e lidos da caixa de saída
+TAMANHO_BLOCO = 64 * 1024
+
+# Tamanho dos blocos dos arquivos codificados em base64 durante a serialização. Múltiplo de 57 bytes, que resultam em
+# uma linha codificada de 76 caracteres
+TAMANHO_BLOCO_BASE64 = 57 * 1024
+
+
+class ParteArquivo(MIMEApplication):
+    """Parte MIME de um arquivo em disco, codificado em base64 somente na serialização, em blocos, por escrever_mime, de
+    modo que o conteúdo do arquivo não é mantido em memória. Para compatibilidade com email.message.Message (ex.:
+    as_string), o conteúdo completo é lido e codificado quando solicitado por get_payload.
+
+    Args:
+        path: Local do arquivo
+        _subtype: Subtipo do Content-Type
+        remover: Se True, o arquivo é removido quando a parte deixa de ser utilizada (ex.: arquivo temporário)
+        **params: Parâmetros do cabeçalho Content-Type (ex.: Name)
+    """
+    def __init__(self, path: Path, _subtype: str = 'octet-stream', remover: bool = False, **params):
+        super().__init__(b'', _subtype, _encoder=encoders.encode_noop, **params)
+        self['Content-Transfer-Encoding'] = 'base64'
+        self.path = Path(path)
+        if remover:
+            weakref.finalize(self, self.path.unlink, missing_ok=True)
+
+    def get_payload(self, i=None, decode=False):
+        self.set_payload(base64.encodebytes(self.path.read_bytes()).decode('ascii'))
+        try:
+            return super().get_payload(i, decode)
+        finally:
+            self.set_payload('')
+
+    def escrever_conteudo(self, destino: BinaryIO, linesep: str = '\r\n'):
+        """Escreve o conteúdo do arquivo codificado em base64, em linhas de 76 caracteres, lendo-o em blocos"""
+        with open(self.path, 'rb') as f:
+            while bloco := f.read(TAMANHO_BLOCO_BASE64):
+                destino.write(base64.encodebytes(bloco).replace(b'\n', linesep.encode('ascii')))
+
+
+def _escrever_cabecalhos(destino: BinaryIO, parte: Message, linesep: str):
+    # Cabeçalhos sem quebra de linha, como em Message.as_string
+    politica = parte.policy.clone(linesep=linesep, max_line_length=0)
+    for nome, valor in parte.raw_items():
+        destino.write(politica.fold_binary(nome, valor))
+    destino.write(linesep.encode('ascii'))
+
+
+def escrever_mime(destino: BinaryIO, parte: Message, linesep: str = '\r\n'):
+    """Serializa a mensagem MIME no destino de escrita, parte a parte. Ao contrário de email.generator.BytesGenerator,
+    que monta em memória o corpo inteiro das mensagens multipart antes de escrevê-lo, somente uma parte não multipart
+    (ex.: um anexo) é mantida em memória de cada vez. O resultado é idêntico ao de Message.as_string, com as quebras de
+    linha informadas. O conteúdo das partes de arquivos em disco (ver ParteArquivo) é codificado em blocos.
+
+    Args:
+        destino: Destino de escrita
+        parte: Mensagem ou parte MIME
+        linesep: Quebra de linha
+    """
+    if isinstance(parte, ParteArquivo):
+        _escrever_cabecalhos(destino, parte, linesep)
+        parte.escrever_conteudo(destino, linesep)
+        return
+
+    if not parte.is_multipart():
+        BytesGenerator(destino, mangle_from_=False, maxheaderlen=0).flatten(parte, linesep=linesep)
+        return
+
+    boundary = parte.get_boundary()
+    if boundary is None:
+        boundary = f'==============={secrets.token_hex(16)}=='
+        parte.set_boundary(boundary)
+
+    _escrever_cabecalhos(destino, parte, linesep)
+
+    if parte.preamble is not None:
+        destino.write(re.sub(r'\r\n|\n|\r', linesep, parte.preamble).encode('ascii', 'surrogateescape'))
+        destino.write(linesep.encode('ascii'))
+
+    for i, subparte in enumerate(parte.get_payload()):
+        destino.write(f'{linesep if i else ""}--{boundary}{linesep}'.encode('ascii'))
+        escrever_mime(destino, subparte, linesep)
+    destino.write(f'{linesep}--{boundary}--{linesep}'.encode('ascii'))
+
+    if parte.epilogue is not None:
+        destino.write(re.sub(r'\r\n|\n|\r', linesep, parte.epilogue).encode('ascii', 'surrogateescape'))
+
+
+class FluxoDados:
+    """Destino de escrita que transmite a mensagem ao servidor, em blocos, durante o comando DATA. As quebras de linha
+    são convertidas em CRLF e o ponto no início das linhas é duplicado (RFC 5321, seção 4.5.2), como em
+    smtplib.SMTP.sendmail.
+
+    Args:
+        server: Conexão SMTP, após a resposta 354 ao comando DATA
+        tamanho_bloco: Tamanho mínimo, em bytes, dos blocos transmitidos
+    """
+    def __init__(self, server: smtplib.SMTP, tamanho_bloco: int = TAMANHO_BLOCO):
+        self.server = server
+        self.tamanho_bloco = tamanho_bloco
+        self.bytes_enviados = 0
+        self._buffer = bytearray()
+        self._inicio_linha = True
+
+    def write(self, dados: bytes) -> int:
+        self._buffer += dados
+        if len(self._buffer) >= self.tamanho_bloco:
+            self._transmitir(final=False)
+        return len(dados)
+
+    def _transmitir(self, final: bool):
+        dados = bytes(self._buffer)
+        self._buffer.clear()
+
+        # Um CR no final do bloco pode fazer parte de um CRLF dividido entre blocos
+        if not final and dados.endswith(b'\r'):
+            self._buffer += b'\r'
+            dados = dados[:-1]
+
+        dados = re.sub(rb'\r\n|\n|\r', b'\r\n', dados)
+        if self._inicio_linha and dados.startswith(b'.'):
+            dados = b'.' + dados
+        dados = dados.replace(b'\r\n.', b'\r\n..')
+
+        if dados:
+            self._inicio_linha = dados.endswith(b'\r\n')
+            self.server.send(dados)
+            self.bytes_enviados += len(dados)
+
+    def finalizar(self):
+        """Transmite o restante da mensagem e o marcador de fim dos dados"""
+        self._transmitir(final=True)
+        self.server.send(b'.\r\n' if self._inicio_linha else b'\r\n.\r\n')
+
+
+class SMTPFluxo(smtplib.SMTP):
+    """Cliente SMTP capaz de transmitir a mensagem à medida que é serializada, sem montá-la inteira em memória"""
+    def _falha(self, code: int):
+        # 421: o servidor encerra a conexão
+        if code == 421:
+            self.close()
+        else:
+            self._rset()
+
+    def sendmail_fluxo(self,
+                       from_addr: str,
+                       to_addrs: str | list[str],
+                       escrever: Callable[[BinaryIO], None]) -> dict:
+        """Equivalente a smtplib.SMTP.sendmail, com a mensagem escrita diretamente no comando DATA pela função
+        informada.
+
+        Args:
+            from_addr: Remetente
+            to_addrs: Destinatário ou lista de destinatários
+            escrever: Função que serializa a mensagem no destino de escrita recebido
+
+        Returns:
+            Dicionário com os destinatários recusados
+        """
+        self.ehlo_or_helo_if_needed()
+
+        code, resp = self.mail(from_addr)
+        if code != 250:
+            self._falha(code)
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+
+        recusados = {}
+        to_addrs = [to_addrs] if isinstance(to_addrs, str) else to_addrs
+        for addr in to_addrs:
+            code, resp = self.rcpt(addr)
+            if code not in (250, 251):
+                recusados[addr] = (code, resp)
+            if code == 421:
+                self.close()
+                raise smtplib.SMTPRecipientsRefused(recusados)
+        if len(recusados) == len(to_addrs):
+            self._rset()
+            raise smtplib.SMTPRecipientsRefused(recusados)
+
+        code, resp = self.docmd('data')
+        if code != 354:
+            self._falha(code)
+            raise smtplib.SMTPDataError(code, resp)
+
+        fluxo = FluxoDados(self)
+        escrever(fluxo)
+        fluxo.finalizar()
+
+        code, resp = self.getreply()
+        if code != 250:
+            self._falha(code)
+            raise smtplib.SMTPDataError(code, resp)
+
+        return recusados
+
+
+class SessaoSMTP:
+    """Sessão SMTP autenticada, reutilizada no envio de várias mensagens. A conexão é aberta no primeiro envio e, ao ser
+    reutilizada, é verificada com o comando NOOP e restabelecida caso o servidor a tenha encerrado. Falhas de conexão
+    durante o envio não são repetidas, pois não é possível saber se o servidor recebeu a mensagem. Se um limitador for
+    informado, cada envio aguarda a liberação pelo limitador, que é informado das respostas temporárias (4xx) do
+    servidor.
+
+    Args:
+        auth_user: Usuário para autenticação no servidor SMTP
+        password: Senha para autenticação no servidor SMTP
+        smtp_server: Endereço do servidor SMTP
+        port: Porta do servidor SMTP
+        ssl_context: Contexto SSL utilizado no STARTTLS. Se não informado, é utilizado o contexto padrão
+        limitador: Limitador da taxa de envio ao servidor
+    """
+    def __init__(self,
+                 auth_user: str,
+                 password: str,
+                 smtp_server: str,
+                 port: int,
+                 ssl_context: ssl.SSLContext | None = None,
+                 limitador: LimitadorTaxa | None = None):
+        self.auth_user = auth_user
+        self.password = password
+        self.smtp_server = smtp_server
+        self.port = port
+        self.ssl_context = ssl_context
+        self.limitador = limitador
+        self.server = None
+        self.conexoes = 0
+
+    def conectar(self):
+        context = self.ssl_context if self.ssl_context else ssl.create_default_context()
+        server = SMTPFluxo(self.smtp_server, self.port)
+        server.ehlo()
+        server.starttls(context=context)
+        server.ehlo()
+        server.login(self.auth_user, self.password)
+        self.server = server
+        self.conexoes += 1
+
+    def fechar(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                self.server.close()
+            self.server = None
+
+    def _descartar(self):
+        """Fecha o socket da conexão sem o comando QUIT, para conexões já encerradas pelo servidor"""
+        try:
+            self.server.close()
+        finally:
+            self.server = None
+
+    def _conexao_ativa(self) -> bool:
+        try:
+            code, _ = self.server.noop()
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            return False
+        return code == 250
+
+    def _enviar(self,
+                from_addr: str,
+                to_addrs: str | list[str],
+                msg: str | bytes | Callable[[BinaryIO], None]) -> dict:
+        try:
+            if callable(msg):
+                recusados = self.server.sendmail_fluxo(from_addr, to_addrs, msg)
+            else:
+                recusados = self.server.sendmail(from_addr, to_addrs, msg)
+        except smtplib.SMTPResponseException as error:
+            if self.limitador is not None and 400 <= error.smtp_code < 500:
+                self.limitador.reduzir()
+            raise
+        except smtplib.SMTPRecipientsRefused as error:
+            if self.limitador is not None and all(400 <= codigo < 500 for codigo, _ in error.recipients.values()):
+                self.limitador.reduzir()
+            raise
+
+        if self.limitador is not None:
+            self.limitador.aumentar()
+        return recusados
+
+    def sendmail(self,
+                 from_addr: str,
+                 to_addrs: str | list[str],
+                 msg: str | bytes | Callable[[BinaryIO], None]) -> dict:
+        """Envia a mensagem pela conexão aberta, reconectando caso o servidor tenha encerrado a conexão antes do envio.
+        A mensagem só é reenviada em nova conexão quando o servidor a recusa com a resposta 421 no comando MAIL, antes
+        da transmissão dos dados. Demais falhas são repassadas ao chamador.
+
+        Args:
+            from_addr: Remetente
+            to_addrs: Destinatário ou lista de destinatários
+            msg: Mensagem serializada ou função que a serializa, em blocos, no destino de escrita recebido. Neste
+                caso, a mensagem é transmitida ao servidor à medida que é serializada
+
+        Returns:
+            Dicionário com os destinatários recusados, conforme smtplib.SMTP.sendmail
+        """
+        if self.limitador is not None:
+            self.limitador.aguardar(1 if isinstance(to_addrs, str) else len(to_addrs))
+
+        if self.server is not None and not self._conexao_ativa():
+            self._descartar()
+        if self.server is None:
+            self.conectar()
+
+        try:
+            return self._enviar(from_addr, to_addrs, msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # A conexão pode ter caído durante ou após o DATA: o reenvio poderia duplicar a mensagem
+            self._descartar()
+            raise
+        except smtplib.SMTPSenderRefused as error:
+            # 421: o servidor encerra a conexão antes de receber a mensagem
+            if error.smtp_code != 421:
+                raise
+            self._descartar()
+
+        # A nova tentativa também respeita a taxa, já reduzida, sem contabilizar novamente os destinatários
+        if self.limitador is not None:
+            self.limitador.aguardar(0)
+        self.conectar()
+        return self._enviar(from_addr, to_addrs, msg)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.fechar()
+
+
+def cabecalho_destinatario(destinatario: str | list[str]) -> str:
+    """Cabeçalho To da mensagem. Com vários destinatários, os endereços são informados somente no envelope SMTP (cópia
+    oculta), e nenhum destinatário vê os demais"""
+    if isinstance(destinatario, str):
+        return destinatario
+    return destinatario[0] if len(destinatario) == 1 else 'undisclosed-recipients:;'
 
 
 class EmailMessage:
@@ -20,75 +371,152 @@ class EmailMessage:
         self.message = None
 
     def send(self,
-             auth_user: str,
-             password: str,
-             smtp_server: str,
-             port: int):
+             auth_user: str | None = None,
+             password: str | None = None,
+             smtp_server: str | None = None,
+             port: int | None = None,
+             sessao: SessaoSMTP | None = None) -> dict:
+        """Envia a mensagem. Se uma sessão SMTP for informada, a mensagem é enviada por ela, respeitando o seu
+        limitador de taxa; caso contrário, é aberta uma conexão exclusiva para a mensagem, com as credenciais
+        informadas. Retorna os destinatários recusados pelo servidor, quando a mensagem tem vários destinatários e
+        somente parte deles é recusada."""
+        if sessao is None:
+            with SessaoSMTP(auth_user, password, smtp_server, port) as sessao_unica:
+                return sessao_unica.sendmail(self.sender_email, self.destinatario, self.escrever)
+        return sessao.sendmail(self.sender_email, self.destinatario, self.escrever)
 
-        context = ssl.create_default_context()
-        server = smtplib.SMTP(smtp_server, port)
-        server.ehlo()
-        server.starttls(context=context)
-        server.ehlo()
-        server.login(auth_user, password)
-        server.sendmail(self.sender_email, self.destinatario, self.message.as_string())
-        server.quit()
-        sleep(1)
+    def escrever(self, destino: BinaryIO):
+        """Serializa a mensagem diretamente no destino de escrita, em partes, com quebras de linha CRLF"""
+        escrever_mime(destino, self.message)
 
+    def serializar(self) -> bytes:
+        """Retorna a mensagem serializada, no formato transmitido ao servidor SMTP"""
+        destino = io.BytesIO()
+        self.escrever(destino)
+        return destino.getvalue()
 
-class EmailMessageHTML(EmailMessage):
-    def __init__(self,
-                 destinatario: str,
-                 sender_email: str,
-                 assunto: str,
-                 template_html: Path,
-                 template_campos: dict,
-                 anexos: Path | list[Path] | None,
-                 imagens: Path | list[Path] | None):
 
-        self.destinatario = destinatario
-        self.sender_email = sender_email
+class CorpoHTML(NamedTuple):
+    """Partes MIME do corpo de uma mensagem HTML (html, imagens e anexos), que podem ser compartilhadas, sem alteração,
+    por várias mensagens"""
+    partes: list[Message]
+    bytes_anexos: int
+    bytes_anexos_compactados: int
 
-        # Create a multipart message
-        message = MIMEMultipart()
-        message["Subject"] = assunto
-        message["From"] = sender_email
-        message["To"] = destinatario
 
-        # Corpo em html
-        with open(template_html, 'r', encoding='utf-8') as f:
-            html_template = Template(f.read())
+def corpo_html(template_html: Path,
+               template_campos: dict,
+               anexos: Path | list[Path] | None,
+               imagens: Path | list[Path] | None,
+               compactar_anexos: bool = False,
+               nome_zip: str = 'CATs.zip',
+               cache_mime: CacheMIME | None = None) -> CorpoHTML:
+    """Monta as partes MIME do corpo de uma mensagem HTML.
 
-        html_string = html_template.render(template_campos)
-        message.attach(MIMEText(html_string, "html"))
+    Args:
+        template_html: Template html a ser utilizado para mesclagem do email
+        template_campos: Dicionário com os campos do template
+        anexos: Path ou lista de paths dos anexos
+        imagens: Path ou lista de paths das imagens referenciadas no html
+        compactar_anexos: Se True, os anexos são reunidos em um único arquivo .zip
+        nome_zip: Nome do arquivo .zip
+        cache_mime: Cache das imagens e anexos já codificados
 
-        # Imagens
-        if imagens:
-            imagens_list = [imagens] if type(imagens) != list else imagens
-            for imagem_path in imagens_list:
-                if os.path.isfile(imagem_path):
+    Returns:
+        Corpo da mensagem
+    """
+    partes = []
+    bytes_anexos = 0
+    bytes_anexos_compactados = 0
+
+    # Corpo em html, com o template compilado mantido em memória pelo ambiente Jinja compartilhado
+    html_string = jinja_template(template_html).render(template_campos)
+    partes.append(MIMEText(html_string, "html"))
+
+    # Imagens
+    if imagens:
+        imagens_list = [imagens] if type(imagens) != list else imagens
+        for imagem_path in imagens_list:
+            if os.path.isfile(imagem_path):
+                if cache_mime is not None:
+                    imagem = cache_mime.parte(imagem_path)
+                else:
                     with open(imagem_path, "rb") as img:
                         imagem = MIMEApplication(img.read())
-                    imagem.add_header('Content-ID', f'<{imagem_path.name}>')
-                    message.attach(imagem)
+                imagem.add_header('Content-ID', f'<{imagem_path.name}>')
+                partes.append(imagem)
+
+    # Anexos
+    if anexos:
+        anexos_list = [anexos] if type(anexos) != list else anexos
+        anexos_list = [anexo_path for anexo_path in anexos_list if os.path.isfile(anexo_path)]
+        bytes_anexos = sum(os.path.getsize(anexo_path) for anexo_path in anexos_list)
 
-        # Anexos
-        if anexos:
-            anexos_list = [anexos] if type(anexos) != list else anexos
+        if compactar_anexos and anexos_list:
+            # Os anexos são lidos do disco e compactados em partes, em um único arquivo .zip temporário, codificado
+            # em blocos na serialização da mensagem e removido quando a parte deixa de ser utilizada
+            with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as zip_file:
+                with zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+                    for anexo_path in anexos_list:
+                        zf.write(anexo_path, arcname=basename(anexo_path))
+                bytes_anexos_compactados = zip_file.tell()
+            anexo = ParteArquivo(zip_file.name, 'zip', remover=True, Name=nome_zip)
+
+            anexo['Content-Disposition'] = f'attachment; filename="{nome_zip}"'
+            partes.append(anexo)
+
+        else:
             for anexo_path in anexos_list:
-                if os.path.isfile(anexo_path):
+                if cache_mime is not None:
+                    anexo = cache_mime.parte(anexo_path, Name=basename(anexo_path))
+                else:
                     with open(anexo_path, "rb") as attachment:
                         anexo = MIMEApplication(attachment.read(), Name=basename(anexo_path))
 
-                    anexo['Content-Disposition'] = f'attachment; filename="{basename(anexo_path)}"'
-                    message.attach(anexo)
+                anexo['Content-Disposition'] = f'attachment; filename="{basename(anexo_path)}"'
+                partes.append(anexo)
+
+    return CorpoHTML(partes, bytes_anexos, bytes_anexos_compactados)
+
+
+class EmailMessageHTML(EmailMessage):
+    def __init__(self,
+                 destinatario: str | list[str],
+                 sender_email: str,
+                 assunto: str,
+                 template_html: Path | None = None,
+                 template_campos: dict | None = None,
+                 anexos: Path | list[Path] | None = None,
+                 imagens: Path | list[Path] | None = None,
+                 compactar_anexos: bool = False,
+                 nome_zip: str = 'CATs.zip',
+                 cache_mime: CacheMIME | None = None,
+                 corpo: CorpoHTML | None = None):
+        """Se o corpo já montado for informado (ver corpo_html), o template, os anexos e as imagens são ignorados. Com
+        vários destinatários, a mensagem é enviada em uma única transação SMTP, com os destinatários somente no
+        envelope (cópia oculta)"""
+        if corpo is None:
+            corpo = corpo_html(template_html, template_campos, anexos, imagens, compactar_anexos, nome_zip, cache_mime)
+
+        self.destinatario = destinatario
+        self.sender_email = sender_email
+        self.bytes_anexos = corpo.bytes_anexos
+        self.bytes_anexos_compactados = corpo.bytes_anexos_compactados
+
+        # Create a multipart message
+        message = MIMEMultipart()
+        message["Subject"] = assunto
+        message["From"] = sender_email
+        message["To"] = cabecalho_destinatario(destinatario)
+        for parte in corpo.partes:
+            message.attach(parte)
 
         self.message = message
 
 
 class EmailMessagText(EmailMessage):
     def __init__(self,
-                 destinatario: str,
+                 destinatario: str | list[str],
                  sender_email: str,
                  assunto: str,
                  conteudo: str):
@@ -99,7 +527,7 @@ class EmailMessagText(EmailMessage):
         message = MIMEMultipart()
         message["Subject"] = assunto
         message["From"] = sender_email
-        message["To"] = destinatario
+        message["To"] = cabecalho_destinatario(destinatario)
         message.attach(MIMEText(conteudo, "plain"))
 
         self.message = message
@@ -0,0 +1,114 @@
+"""Módulo com o limitador adaptativo da taxa de envio de e-mails ao servidor SMTP"""
+
+import threading
+import time
+from datetime import date
+
+
+class LimiteDiarioExcedido(RuntimeError):
+    """Indica que o envio excederia o número máximo de destinatários por dia"""
+
+
+class LimitadorTaxa:
+    """Limita a taxa de envio de mensagens ao servidor SMTP por meio de um balde de fichas (token bucket). A taxa é
+    reduzida à metade a cada resposta temporária (4xx/421) do servidor e aumentada gradualmente, até o máximo
+    configurado, a cada envio bem-sucedido. O número de destinatários é contabilizado por dia, a partir dos destinatários
+    já atendidos no dia corrente, em execuções anteriores. O limitador pode ser compartilhado por sessões utilizadas em
+    threads distintas.
+
+    Args:
+        mensagens_por_minuto: Taxa máxima de envio, em mensagens por minuto
+        destinatarios_por_dia: Número máximo de destinatários por dia. Se não informado, não há limite diário
+        destinatarios_dia: Número de destinatários já atendidos no dia corrente, antes do início da execução
+        taxa_min_por_minuto: Taxa mínima de envio, após as reduções, em mensagens por minuto
+        rajada: Número de mensagens que podem ser enviadas de imediato, sem espera
+        fator_reducao: Fator aplicado à taxa a cada resposta temporária do servidor
+        incremento: Aumento da taxa, em mensagens por minuto, a cada envio bem-sucedido
+        relogio: Função que retorna o instante atual, em segundos
+        dormir: Função que suspende a execução pelo tempo informado, em segundos
+    """
+    def __init__(self,
+                 mensagens_por_minuto: float,
+                 destinatarios_por_dia: int | None = None,
+                 destinatarios_dia: int = 0,
+                 taxa_min_por_minuto: float = 1,
+                 rajada: int = 1,
+                 fator_reducao: float = 0.5,
+                 incremento: float = 1,
+                 relogio=time.monotonic,
+                 dormir=time.sleep):
+        self.taxa_max = mensagens_por_minuto
+        self.taxa_min = min(taxa_min_por_minuto, mensagens_por_minuto)
+        self.taxa = mensagens_por_minuto
+        self.destinatarios_por_dia = destinatarios_por_dia
+        self.rajada = rajada
+        self.fator_reducao = fator_reducao
+        self.incremento = incremento
+        self._relogio = relogio
+        self._dormir = dormir
+        self._lock = threading.Lock()
+
+        self._fichas = rajada
+        self._ultimo = relogio()
+        self._dia = date.today()
+        self.destinatarios_dia = destinatarios_dia
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.reducoes = 0
+
+    def aguardar(self, destinatarios: int = 1):
+        """Aguarda até que uma nova mensagem possa ser enviada, respeitando a taxa atual e o limite diário.
+
+        Args:
+            destinatarios: Número de destinatários da mensagem, contabilizados no limite diário
+        """
+        # A espera ocorre com o lock adquirido, de modo que os envios concorrentes sejam liberados um a um
+        with self._lock:
+            self._aguardar(destinatarios)
+
+    def _aguardar(self, destinatarios: int):
+        if date.today() != self._dia:
+            self._dia = date.today()
+            self.destinatarios_dia = 0
+
+        if self.destinatarios_por_dia is not None and self.destinatarios_dia + destinatarios > self.destinatarios_por_dia:
+            raise LimiteDiarioExcedido(f'Limite de {self.destinatarios_por_dia} destinatários por dia atingido')
+
+        agora = self._relogio()
+        self._fichas = min(self.rajada, self._fichas + (agora - self._ultimo) * self.taxa / 60)
+        self._ultimo = agora
+
+        if self._fichas < 1:
+            espera = (1 - self._fichas) * 60 / self.taxa
+            self._dormir(espera)
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+            self._fichas = 1
+            self._ultimo = agora + espera
+
+        self._fichas -= 1
+        self.destinatarios_dia += destinatarios
+
+    def reduzir(self):
+        """Reduz a taxa de envio após uma resposta temporária (4xx/421) do servidor"""
+        with self._lock:
+            self.taxa = max(self.taxa_min, self.taxa * self.fator_reducao)
+            self.reducoes += 1
+
+    def aumentar(self):
+        """Aumenta a taxa de envio após um envio bem-sucedido, até a taxa máxima"""
+        with self._lock:
+            self.taxa = min(self.taxa_max, self.taxa + self.incremento)
+
+    def estatisticas(self) -> dict:
+        """Retorna as estatísticas do limitador na execução corrente.
+
+        Returns:
+            Dicionário com a taxa atual (mensagens por minuto), o tempo total e máximo de espera (segundos), o número de
+            reduções da taxa e o número de destinatários no dia
+        """
+        return {'taxa_por_minuto': self.taxa,
+                'espera_total_s': self.espera_total,
+                'espera_max_s': self.espera_max,
+                'reducoes': self.reducoes,
+                'destinatarios_dia': self.destinatarios_dia}
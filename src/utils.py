@@ -1,6 +1,43 @@
+import functools
+from pathlib import Path
+
+import jinja2
 import yaml
 
+# Cache, em disco, dos templates Jinja compilados, compartilhado entre execuções e processos
+JINJA_CACHE_DIR = Path(__file__).resolve().parents[1] / 'data/cache/jinja'
+
 
 def read_yaml(file_path):
     with open(file_path, "r", encoding='utf-8') as f:
         return yaml.safe_load(f)
+
+
+@functools.cache
+def jinja_environment(diretorio: Path) -> jinja2.Environment:
+    """Retorna o ambiente Jinja dos templates do diretório, único no processo. Os templates compilados são mantidos em
+    memória e, em bytecode, no cache em disco; um template é recompilado somente se o arquivo for modificado.
+
+    Args:
+        diretorio: Diretório dos templates
+
+    Returns:
+        Ambiente Jinja
+    """
+    JINJA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(diretorio, encoding='utf-8'),
+                              auto_reload=True,
+                              bytecode_cache=jinja2.FileSystemBytecodeCache(str(JINJA_CACHE_DIR)))
+
+
+def jinja_template(template_path: Path) -> jinja2.Template:
+    """Retorna o template compilado, a partir do ambiente Jinja compartilhado do seu diretório.
+
+    Args:
+        template_path: Local do template
+
+    Returns:
+        Template compilado
+    """
+    template_path = Path(template_path).resolve()
+    return jinja_environment(template_path.parent).get_template(template_path.name)
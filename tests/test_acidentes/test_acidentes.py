@@ -194,3 +194,51 @@ def test_atribui_consequencia():
 
     resultado = acidentes.cat_atribui_consequencia(cats)
     assert_frame_equal(esperado, resultado)
+
+
+def test_tabela_resumo_html():
+    """Testa se a tabela montada com as linhas pré-renderizadas é idêntica à gerada por DataFrame.to_html"""
+    cats = pd.DataFrame([{'meta_nr_recibo': '1.2.0000000000000000001',
+                          'ds_tpacid': 'Típico',
+                          'Consequencia': ['Óbito', 'Fratura (dedo)'],
+                          'CDFatorAmbiental': 'Ruído<br>Calor',
+                          'ds_municipio_local_acidente': 'São Paulo',
+                          'sguf_local_acidente': 'SP'},
+
+                         {'meta_nr_recibo': '1.2.0000000000000000002',
+                          'ds_tpacid': 'Trajeto',
+                          'Consequencia': [],
+                          'CDFatorAmbiental': None,
+                          'ds_municipio_local_acidente': np.nan,
+                          'sguf_local_acidente': 'RJ'},
+                         ]
+                        )
+    cats[acidentes.COLUNA_RESUMO_HTML] = acidentes.cat_resumo_html(cats)
+
+    for df in (cats, cats.iloc[[1]], cats.iloc[0:0]):
+        esperado = acidentes.cat_tabela_resumo(df).to_html(index=False, escape=False)
+        assert acidentes.cat_tabela_resumo_html(df) == esperado
+        assert acidentes.cat_tabela_resumo_html(df.drop(columns=acidentes.COLUNA_RESUMO_HTML)) == esperado
+
+
+def test_cat_contextos():
+    """Testa se os contextos das CATs contêm somente os campos do template, com os valores ausentes preenchidos"""
+    cats = pd.DataFrame([{'meta_nr_recibo': '1.2.0000000000000000001',
+                          'idade_DTAcidente': 35.0,
+                          'nmtrab': 'Trabalhador',
+                          'coluna_nao_utilizada': 1},
+
+                         {'meta_nr_recibo': '1.2.0000000000000000002',
+                          'idade_DTAcidente': np.nan,
+                          'nmtrab': None,
+                          'coluna_nao_utilizada': 2},
+                         ]
+                        )
+    campos = acidentes.campos_template(Path('data/input/html_templates/cat.html'))
+
+    resultado = acidentes.cat_contextos(cats, campos)
+
+    assert {'meta_nr_recibo', 'idade_DTAcidente', 'nmtrab'} <= campos
+    assert resultado == [{'meta_nr_recibo': '1.2.0000000000000000001', 'idade_DTAcidente': 35, 'nmtrab': 'Trabalhador'},
+                         {'meta_nr_recibo': '1.2.0000000000000000002', 'idade_DTAcidente': 'N/A', 'nmtrab': 'N/A'}]
+    assert type(resultado[0]['idade_DTAcidente']) is int
@@ -0,0 +1,69 @@
+import os
+import shutil
+import time
+from pathlib import Path
+import pytest
+import acidentes
+
+
+@pytest.fixture()
+def del_temp_dir():
+    yield None
+    shutil.rmtree("temp")
+
+
+class TestCachePDF:
+    def test_chave(self):
+        """Testa se a chave depende dos campos renderizados e da versão do template"""
+        campos = {'meta_nr_recibo': 'a001', 'Consequencia': ['Óbito']}
+
+        chave = acidentes.CachePDF.chave(campos, 'v1')
+
+        assert chave == acidentes.CachePDF.chave(dict(reversed(campos.items())), 'v1')
+        assert chave != acidentes.CachePDF.chave(campos, 'v2')
+        assert chave != acidentes.CachePDF.chave(campos | {'meta_nr_recibo': 'a002'}, 'v1')
+
+    def test_get_put(self, del_temp_dir):
+        """Testa o armazenamento, a recuperação e as estatísticas de uso"""
+        cache = acidentes.CachePDF(Path('temp/cache'))
+        chave = cache.chave({'meta_nr_recibo': 'a001'}, 'v1')
+
+        assert cache.get(chave) is None
+        cache.put(chave, b'%PDF')
+        assert cache.get(chave) == b'%PDF'
+
+        assert cache.estatisticas() == {'hits': 1, 'misses': 1, 'taxa_acerto': 0.5}
+        assert not list(Path('temp/cache').glob('*/*.tmp'))
+
+    def test_limpar_tamanho(self, del_temp_dir):
+        """Testa se os PDFs usados há mais tempo são removidos quando o cache excede o tamanho máximo"""
+        cache = acidentes.CachePDF(Path('temp/cache'), tamanho_max_mb=2 / 1024)
+        chaves = [cache.chave({'meta_nr_recibo': recibo}, 'v1') for recibo in ['a001', 'a002', 'a003']]
+
+        for i, chave in enumerate(chaves):
+            cache.put(chave, b'0' * 1024)
+            path = cache._path(chave)
+            os.utime(path, (time.time() - 100 + i, time.time()))
+
+        cache.get(chaves[0])
+        cache.limpar()
+
+        assert cache.get(chaves[0]) is not None
+        assert cache.get(chaves[1]) is None
+        assert cache.get(chaves[2]) is not None
+
+    def test_limpar_idade(self, del_temp_dir):
+        """Testa se os PDFs que excedem a idade máxima são removidos"""
+        cache = acidentes.CachePDF(Path('temp/cache'), idade_max_dias=1)
+        chave_antiga = cache.chave({'meta_nr_recibo': 'a001'}, 'v1')
+        chave_nova = cache.chave({'meta_nr_recibo': 'a002'}, 'v1')
+
+        cache.put(chave_antiga, b'%PDF')
+        cache.put(chave_nova, b'%PDF')
+        dois_dias_atras = time.time() - 2 * 86400
+        os.utime(cache._path(chave_antiga), (time.time(), dois_dias_atras))
+
+        cache.limpar()
+
+        assert cache.get(chave_antiga) is None
+        assert cache.get(chave_nova) is not None
@@ -0,0 +1,138 @@
+import shutil
+from functools import partial, reduce
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from utils import read_yaml
+import acidentes
+import acidentes_filtrar
+
+
+@pytest.fixture()
+def del_temp_dir():
+    yield None
+    shutil.rmtree("temp")
+
+
+def cats_lote(recibos: list[str]) -> pd.DataFrame:
+    cats = pd.DataFrame([{'DTEmissaoCAT': '01/08/2022',
+                          'sguf_local_acidente': 'MG',
+                          'uorg_local_acidente': '123456789',
+                          'tpacid': 1,
+                          'Consequencia': ['Óbito'],
+                          'CDFatorAmbiental': '111 - Máquinas<br>131 - Queda',
+                          'secao_cnae_local_acidente': 'C'},
+
+                         {'DTEmissaoCAT': '01/08/2022',
+                          'sguf_local_acidente': 'MG',
+                          'uorg_local_acidente': '123456789',
+                          'tpacid': 1,
+                          'Consequencia': ['Óbito'],
+                          'CDFatorAmbiental': '111 - Máquinas<br>131 - Queda',
+                          'secao_cnae_local_acidente': 'C'},
+
+                         {'DTEmissaoCAT': '02/08/2022',
+                          'sguf_local_acidente': 'SP',
+                          'uorg_local_acidente': '987654321',
+                          'tpacid': 2,
+                          'Consequencia': ['Óbito', 'Internação do trabalhador'],
+                          'CDFatorAmbiental': '',
+                          'secao_cnae_local_acidente': 'F'},
+                         ])
+    cats['meta_nr_recibo'] = recibos
+    return cats
+
+
+def cats_tratadas(cats: pd.DataFrame) -> pd.DataFrame:
+    """Aplica às CATs as etapas de acidentes.cat_tratadas que determinam as dimensões do cubo"""
+    fatores_params = read_yaml(Path('config/fatores_risco_classificacao.yaml'))
+    function_list = [acidentes.cat_identifica_recibo_raiz,
+                     acidentes.cat_mantem_recibo_ultima_reabertura,
+                     partial(acidentes.cat_atribui_fatores_risco,
+                             fatores_params_reshaped=acidentes.reshape_fatores_params(fatores_params)),
+                     acidentes.cat_compila_fatores_risco,
+                     acidentes.cat_atribui_consequencia,
+                     partial(acidentes.cat_inserir_descricoes_fatores_risco, aux_tables_dir=Path('data/input/aux_tables'))]
+    return reduce(lambda x, y: y(x), function_list, cats)
+
+
+def cat_bruta(recibo: str, recibo_anterior: str | None, obito: str, codcid: str, codcid_categoria: str,
+              uf: str) -> dict:
+    return {'meta_nr_recibo': recibo, 'nrRecCatOrig': recibo_anterior, 'DTEmissaoCAT': '01/08/2022',
+            'sguf_local_acidente': uf, 'uorg_local_acidente': '123456789', 'tpacid': 1,
+            'secao_cnae_local_acidente': 'C', 'codsitgeradora': '200044300' if uf == 'MG' else '',
+            'codagntcausador': '', 'dsclesao': '', 'codcid': codcid, 'codcidCategoria': codcid_categoria,
+            'indcatobito': obito, 'indinternacao': 'N', 'codparteating': '', 'durtrat': 5}
+
+
+class TestCubo:
+    def test_atualizar(self, del_temp_dir):
+        """Testa se as CATs são agregadas em células e se o reprocessamento de um lote não duplica as contagens"""
+        cubo_path = Path('temp/cubo.csv')
+
+        acidentes.cubo_atualizar(cubo_path, cats_lote(['a001', 'a002', 'a003']))
+        cubo = acidentes.cubo_atualizar(cubo_path, cats_lote(['a001', 'a002', 'a003']))
+
+        assert len(cubo) == 2
+        assert acidentes.cubo_contar(cubo) == 3
+
+        cubo = acidentes.cubo_atualizar(cubo_path, cats_lote(['b001', 'b002', 'b003']))
+
+        assert len(cubo) == 2
+        assert acidentes.cubo_contar(cubo) == 6
+        assert cubo.ultimo_recibo.max() == 'b003'
+
+    def test_fatiar(self, del_temp_dir):
+        """Testa a contagem de CATs por período e por dimensão, inclusive as de múltiplos valores"""
+        cubo = acidentes.cubo_atualizar(Path('temp/cubo.csv'), cats_lote(['a001', 'a002', 'a003']))
+
+        assert acidentes.cubo_contar(cubo, dt_inicio='2022-08-02') == 1
+        assert acidentes.cubo_contar(cubo, dt_fim='2022-08-01') == 2
+        assert acidentes.cubo_contar(cubo, sguf_local_acidente='MG') == 2
+        assert acidentes.cubo_contar(cubo, tpacid=[1, 2]) == 3
+        assert acidentes.cubo_contar(cubo, Consequencia=['Internação do trabalhador']) == 1
+        assert acidentes.cubo_contar(cubo, CDFatorAmbiental='131') == 2
+
+    def test_agregar(self, del_temp_dir):
+        """Testa a agregação das contagens, contando a CAT em cada um dos valores das dimensões de múltiplos valores"""
+        cubo = acidentes.cubo_atualizar(Path('temp/cubo.csv'), cats_lote(['a001', 'a002', 'a003']))
+
+        esperado = pd.DataFrame([{'Consequencia': 'Internação do trabalhador', 'qtd': 1},
+                                 {'Consequencia': 'Óbito', 'qtd': 3}])
+
+        resultado = acidentes.cubo_agregar(cubo, por=['Consequencia'])
+
+        pd.testing.assert_frame_equal(esperado, resultado, check_dtype=False)
+
+    def test_reabertura(self, del_temp_dir):
+        """Testa se a reabertura de uma CAT, em lote posterior, substitui a contagem da CAT original, e se a contagem
+        por preferências, a partir das CATs tratadas, coincide com a das CATs selecionadas pelos filtros de alerta"""
+        cubo_path = Path('temp/cubo.csv')
+        lote1 = cats_tratadas(pd.DataFrame([cat_bruta('a001', None, 'N', 'J700', 'T70', 'MG'),
+                                            cat_bruta('a002', None, 'N', 'L504', 'L50', 'SP')]))
+        lote2 = cats_tratadas(pd.DataFrame([cat_bruta('a003', 'a001', 'S', 'J700', 'T70', 'MG')]))
+
+        acidentes.cubo_atualizar(cubo_path, lote1)
+        cubo = acidentes.cubo_atualizar(cubo_path, lote2)
+
+        assert acidentes.cubo_contar(cubo) == 2
+        assert acidentes.cubo_contar(cubo, Consequencia='Óbito') == 1
+        assert cubo.ultimo_recibo.max() == 'a003'
+
+        usuario = pd.Series({'UF': np.NAN,
+                             'UORG': np.NAN,
+                             'Tipo de acidente': 'Acidentes típicos',
+                             'Consequência do acidente': 'Todos',
+                             'Fator de risco': 'Sim',
+                             'Fatores de risco': '111 - Máquinas e equipamentos',
+                             'Setores econômicos': 'Não',
+                             'Seção CNAE': np.NAN})
+        cats = pd.concat([lote1[lote1.meta_nr_recibo == 'a002'], lote2])
+        filtros = [partial(filtro, usuario=usuario) for filtro in [acidentes_filtrar.uf, acidentes_filtrar.uorg,
+                                                                   acidentes_filtrar.tpacid,
+                                                                   acidentes_filtrar.consequencias,
+                                                                   acidentes_filtrar.risco, acidentes_filtrar.cnae]]
+
+        assert reduce(lambda x, y: y(x), filtros, cats).meta_nr_recibo.tolist() == ['a003']
+        assert acidentes_filtrar.contagem_preferencias(cubo, usuario) == 1
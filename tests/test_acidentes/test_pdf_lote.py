@@ -0,0 +1,117 @@
+import multiprocessing
+import shutil
+import time
+from pathlib import Path
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+import acidentes
+
+html_template = Path('data/input/html_templates/cat.html')
+logo = Path('data/input/images/logoSIT.png')
+output_dir = Path('temp/pdf')
+
+
+def cat_to_pdf_simulado(campos, html_template, logo):
+    """Renderização simulada, que falha ou excede o tempo máximo conforme o número do recibo"""
+    if campos['meta_nr_recibo'] == 'falha':
+        raise ValueError('Falha na renderização')
+    if campos['meta_nr_recibo'] == 'lenta':
+        time.sleep(60)
+    return b'%PDF ' + campos['meta_nr_recibo'].encode('ascii')
+
+
+@pytest.fixture()
+def renderizacao_simulada(monkeypatch):
+    # Os processos de trabalho herdam a renderização simulada somente quando criados por fork
+    if multiprocessing.get_start_method() != 'fork':
+        pytest.skip('Processos de trabalho não criados por fork')
+    monkeypatch.setattr('acidentes.acidentes.cat_to_pdf', cat_to_pdf_simulado)
+    yield None
+    shutil.rmtree('temp', ignore_errors=True)
+
+
+def test_planejar_anexos():
+    """Testa se o planejamento inclui, sem duplicidades, somente as CATs que serão anexadas"""
+    cats_usuario_1 = pd.DataFrame([{'meta_nr_recibo': 'a001'},
+                                   {'meta_nr_recibo': 'a002'}])
+
+    cats_usuario_2 = pd.DataFrame([{'meta_nr_recibo': 'a002'},
+                                   {'meta_nr_recibo': 'a003'}])
+
+    cats_usuario_excede_limite = pd.DataFrame([{'meta_nr_recibo': 'b001'},
+                                               {'meta_nr_recibo': 'b002'},
+                                               {'meta_nr_recibo': 'b003'}])
+
+    esperado = pd.DataFrame([{'meta_nr_recibo': 'a001'},
+                             {'meta_nr_recibo': 'a002'},
+                             {'meta_nr_recibo': 'a003'}])
+
+    resultado = acidentes.planejar_anexos([cats_usuario_1, cats_usuario_2, cats_usuario_excede_limite],
+                                          limite_anexos=2)
+
+    assert_frame_equal(esperado, resultado)
+
+
+def test_planejar_anexos_sem_cats():
+    resultado = acidentes.planejar_anexos([pd.DataFrame(columns=['meta_nr_recibo'])], limite_anexos=2)
+
+    assert resultado.empty
+
+
+def test_planejar_pdf_unico():
+    """Testa se é planejado um PDF único para cada conjunto distinto de CATs acima do limite de anexos"""
+    cats_usuario_1 = pd.DataFrame([{'meta_nr_recibo': 'a001'},
+                                   {'meta_nr_recibo': 'a002'},
+                                   {'meta_nr_recibo': 'a003'}])
+
+    cats_usuario_2 = pd.DataFrame([{'meta_nr_recibo': 'a003'},
+                                   {'meta_nr_recibo': 'a002'},
+                                   {'meta_nr_recibo': 'a001'}])
+
+    cats_usuario_dentro_limite = pd.DataFrame([{'meta_nr_recibo': 'b001'}])
+
+    resultado = acidentes.planejar_pdf_unico([cats_usuario_1, cats_usuario_2, cats_usuario_dentro_limite],
+                                             limite_anexos=2)
+
+    assert len(resultado) == 1
+    assert_frame_equal(cats_usuario_1, resultado[0])
+
+
+class TestCatToPdfLote:
+    def test_falha_e_timeout(self, renderizacao_simulada):
+        """Testa se as CATs cuja renderização falha ou excede o prazo do lote são informadas como falha, sem arquivo
+        no diretório de destino, e se o prazo do lote é respeitado"""
+        cats = pd.DataFrame({'meta_nr_recibo': ['a001', 'falha', 'lenta']})
+        inicio = time.monotonic()
+
+        resultado = acidentes.cat_to_pdf_lote(cats, html_template, logo, output_dir, processos=2, timeout=1)
+
+        assert resultado == {'a001': True, 'falha': False, 'lenta': False}
+        assert time.monotonic() - inicio < 30
+        assert (output_dir / 'a001.pdf').read_bytes() == b'%PDF a001'
+        assert sorted(path.name for path in output_dir.iterdir()) == ['a001.pdf']
+
+    def test_timeout_processo_unico(self, renderizacao_simulada):
+        """Testa se, com um único processo, o tempo máximo também é aplicado"""
+        cats = pd.DataFrame({'meta_nr_recibo': ['lenta']})
+        inicio = time.monotonic()
+
+        resultado = acidentes.cat_to_pdf_lote(cats, html_template, logo, output_dir, processos=1, timeout=1)
+
+        assert resultado == {'lenta': False}
+        assert time.monotonic() - inicio < 30
+
+    def test_cache(self, renderizacao_simulada):
+        """Testa se as CATs encontradas no cache são gravadas no diretório de destino, sem renderização"""
+        cats = pd.DataFrame({'meta_nr_recibo': ['falha', 'a001']})
+        cache = acidentes.CachePDF(Path('temp/cache'))
+        campos = acidentes.cat_contextos(cats.head(1), acidentes.campos_template(html_template))[0]
+        cache.put(cache.chave(campos, acidentes.cat_renderizador(html_template, logo).versao), b'%PDF cache')
+
+        resultado = acidentes.cat_to_pdf_lote(cats, html_template, logo, output_dir, processos=2, timeout=10,
+                                              cache=cache)
+
+        assert resultado == {'falha': True, 'a001': True}
+        assert (output_dir / 'falha.pdf').read_bytes() == b'%PDF cache'
+        assert cache.estatisticas()['hits'] == 1
@@ -0,0 +1,92 @@
+import shutil
+from pathlib import Path
+import pytest
+import weasyprint
+import acidentes
+
+html_template = Path('data/input/html_templates/cat.html')
+logo = Path('data/input/images/logoSIT.png')
+
+
+def weasyprint_disponivel() -> bool:
+    """Verifica se o WeasyPrint, com as bibliotecas nativas (Pango), diagrama um documento"""
+    try:
+        return len(weasyprint.HTML(string='<p>.</p>').render().pages) == 1
+    except Exception:
+        return False
+
+
+@pytest.fixture()
+def del_temp_dir():
+    Path('temp').mkdir(parents=True, exist_ok=True)
+    yield None
+    shutil.rmtree("temp")
+
+
+def test_gravar_pdf(del_temp_dir, monkeypatch):
+    """Testa se o PDF só é encontrado no destino após a gravação completa, e se o arquivo temporário de uma gravação
+    interrompida tem o nome do PDF, de modo que seja removido com os demais"""
+    pdf_path = Path('temp/a001.pdf')
+
+    def interrompe(origem, destino):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr('acidentes.renderizador_pdf.os.replace', interrompe)
+        with pytest.raises(KeyboardInterrupt):
+            acidentes.gravar_pdf(pdf_path, b'%PDF')
+    assert not pdf_path.exists()
+    assert len(list(Path('temp').glob('.a001.pdf.*.tmp'))) == 1
+
+    acidentes.gravar_pdf(pdf_path, b'%PDF')
+    assert pdf_path.read_bytes() == b'%PDF'
+
+
+class TestRenderizadorPDF:
+    def test_html(self):
+        """Testa se o template é preenchido com os dados da CAT e com a referência à logo"""
+        renderizador = acidentes.RenderizadorPDF(html_template, logo)
+
+        html = renderizador.html({'meta_nr_recibo': '1.2.0000000000000000001'})
+
+        assert '1.2.0000000000000000001' in html
+        assert f'src={logo.name}' in html
+
+    def test_logo_em_memoria(self):
+        """Testa se a logo é servida a partir da memória, sem cópia para o diretório de destino"""
+        renderizador = acidentes.RenderizadorPDF(html_template, logo)
+
+        resposta = renderizador._url_fetcher(renderizador.base_url + logo.name)
+
+        assert resposta['string'] == logo.read_bytes()
+        assert resposta['mime_type'] == 'image/png'
+
+    def test_html_unico(self):
+        """Testa se as CATs são reunidas em um único documento, com uma seção e um marcador por CAT"""
+        renderizador = acidentes.RenderizadorPDF(html_template, logo)
+
+        html = renderizador.html_unico([{'meta_nr_recibo': 'a001'}, {'meta_nr_recibo': 'a002'}])
+
+        assert html.count('<section class="cat"') == 2
+        assert 'data-bookmark="CAT a001"' in html
+        assert 'data-bookmark="CAT a002"' in html
+        assert html.count('<body>') == 1
+
+    @pytest.mark.skipif(not weasyprint_disponivel(), reason='WeasyPrint indisponível')
+    def test_marcadores_pdf_unico(self):
+        """Testa se o PDF único diagramado pelo WeasyPrint tem um marcador por CAT, na ordem das CATs, cada um no início
+        de uma nova página"""
+        renderizador = acidentes.RenderizadorPDF(html_template, logo)
+        recibos = ['a001', 'a002', 'a003']
+
+        documento = weasyprint.HTML(string=renderizador.html_unico([{'meta_nr_recibo': r} for r in recibos]),
+                                    base_url=renderizador.base_url,
+                                    url_fetcher=renderizador._url_fetcher,
+                                    encoding='utf-8').render(stylesheets=renderizador.stylesheets,
+                                                             font_config=renderizador.font_config)
+        marcadores = documento.make_bookmark_tree()
+
+        assert [marcador[0] for marcador in marcadores] == [f'CAT {recibo}' for recibo in recibos]
+        paginas = [marcador[1][0] for marcador in marcadores]
+        assert paginas[0] == 0 and paginas == sorted(set(paginas))
+        assert renderizador.pdf_unico([{'meta_nr_recibo': r} for r in recibos]).startswith(b'%PDF')
@@ -1,7 +1,10 @@
+import shutil
+from pathlib import Path
 import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 import acidentes_filtrar
+import backup
 
 
 def test_uf():
@@ -216,3 +219,57 @@ def test_cnae_nao_optado():
     resultado = acidentes_filtrar.cnae(cats, df_usuarios).reset_index(drop=True)
 
     assert_frame_equal(esperado, resultado)
+
+
+def test_contagem_preferencias():
+    df_usuarios = pd.Series({'UF': 'MG',
+                             'UORG': np.NAN,
+                             'Tipo de acidente': 'Acidentes típicos, Doenças do Trabalho',
+                             'Consequência do acidente': 'Óbito',
+                             'Fator de risco': 'Sim',
+                             'Fatores de risco': '611 - Máquinas e equipamentos',
+                             'Setores econômicos': 'Não',
+                             'Seção CNAE': np.NAN})
+
+    cubo = pd.DataFrame([{'sguf_local_acidente': 'MG', 'uorg_local_acidente': '123456789', 'tpacid': 1,
+                          'Consequencia': ['Óbito'], 'CDFatorAmbiental': ['611'],
+                          'secao_cnae_local_acidente': 'A', 'qtd': 3},
+                         {'sguf_local_acidente': 'MG', 'uorg_local_acidente': '123456789', 'tpacid': 2,
+                          'Consequencia': ['Óbito', 'Amputação (dedo)'], 'CDFatorAmbiental': ['611', '621'],
+                          'secao_cnae_local_acidente': 'B', 'qtd': 2},
+                         {'sguf_local_acidente': 'MG', 'uorg_local_acidente': '123456789', 'tpacid': 3,
+                          'Consequencia': ['Óbito'], 'CDFatorAmbiental': ['611'],
+                          'secao_cnae_local_acidente': 'A', 'qtd': 7},
+                         {'sguf_local_acidente': 'SP', 'uorg_local_acidente': '987654321', 'tpacid': 1,
+                          'Consequencia': ['Óbito'], 'CDFatorAmbiental': ['611'],
+                          'secao_cnae_local_acidente': 'A', 'qtd': 11},
+                         ])
+
+    assert acidentes_filtrar.contagem_preferencias(cubo, df_usuarios) == 5
+
+
+def test_preferencias_usuario_ja_notificadas():
+    """Testa se as CATs notificadas em partição do log anterior à data de emissão lida como mês/dia são excluídas"""
+    usuario = pd.Series({'E-mail': 'usuario@economia.gov.br',
+                         'UF': np.NAN,
+                         'UORG': np.NAN,
+                         'Tipo de acidente': 'Acidentes típicos',
+                         'Consequência do acidente': 'Todos',
+                         'Fator de risco': 'Não',
+                         'Setores econômicos': 'Não'})
+
+    # Emitidas em 10/08/2022, que, lida como mês/dia, seria 08/10/2022
+    cats = pd.DataFrame([{'meta_nr_recibo': '1.2.0000000000000000001', 'tpacid': 1, 'DTEmissaoCAT': '10/08/2022'},
+                         {'meta_nr_recibo': '1.2.0000000000000000002', 'tpacid': 1, 'DTEmissaoCAT': '11/08/2022'}])
+
+    log_alertas = Path('temp/log_alertas_usuarios.csv')
+    backup.log_append(log_alertas, {'timestamp': '2022-08-12 10:00:00',
+                                    'email': 'usuario@economia.gov.br',
+                                    'meta_nr_recibo': '1.2.0000000000000000001',
+                                    'status': 'Sucesso'})
+    try:
+        resultado = acidentes_filtrar.preferencias_usuario(cats, usuario, log_alertas)
+    finally:
+        shutil.rmtree('temp')
+
+    assert resultado.meta_nr_recibo.tolist() == ['1.2.0000000000000000002']
@@ -65,6 +65,45 @@ class TestBackupCSV:
         assert_frame_equal(df_backup, esperado)
 
 
+class TestBackupCSVIncremental:
+    execucoes = [pd.DataFrame({'A': [1, 2, 3], 'B': ['x', 'y', None]}),
+                 pd.DataFrame({'A': [1, 2, 3, 4, 4], 'B': ['x', 'y', None, 'z', 'z']}),
+                 pd.DataFrame({'A': [2, 5], 'B': ['w', 'v']}),
+                 pd.DataFrame({'A': [1], 'B': ['x']})]
+
+    def test_equivalencia_modo_padrao(self, del_temp_dir):
+        """Testa se o backup incremental, com compactações, resulta no mesmo arquivo do modo padrão"""
+        for df in self.execucoes:
+            backup.backup_csv(df=df, backup_path=Path('temp/padrao.csv'))
+            backup.backup_csv(df=df, backup_path=Path('temp/incremental.csv'), incremental=True, compactar_a_cada=3)
+
+        # No modo padrão, as linhas duplicadas da primeira DataFrame são mantidas
+        df_padrao = pd.read_csv('temp/padrao.csv', dtype='object', keep_default_na=False)
+        assert_frame_equal(df_padrao[~df_padrao.duplicated()].reset_index(drop=True),
+                           pd.read_csv('temp/incremental.csv', dtype='object', keep_default_na=False))
+
+    def test_somente_novas_linhas(self, del_temp_dir):
+        """Testa se somente as novas linhas são acrescentadas e se os hashes desatualizados são recalculados"""
+        backup_path = Path('temp/backup.csv')
+        backup.backup_csv(df=self.execucoes[0], backup_path=backup_path, incremental=True)
+        conteudo_anterior = backup_path.read_bytes()
+
+        backup.backup_csv(df=self.execucoes[1], backup_path=backup_path, incremental=True)
+        conteudo = backup_path.read_bytes()
+
+        assert conteudo.startswith(conteudo_anterior)
+        assert conteudo[len(conteudo_anterior):] == b'"4","z"\n'
+        assert Path('temp/backup.csv.hashes').stat().st_size == 8 * (2 + 4)
+
+        # Linha acrescentada sem a atualização dos hashes
+        with open(backup_path, 'a') as csv_file:
+            csv_file.write('"5","v"\n')
+        backup.backup_csv(df=self.execucoes[2], backup_path=backup_path, incremental=True)
+
+        df_backup = pd.read_csv(backup_path, dtype='object', keep_default_na=False)
+        assert df_backup.A.tolist() == ['1', '2', '3', '4', '5', '2']
+
+
 class TestBackupCSVNewFile:
     def test_com_mudancas(self, del_temp_dir):
         """Testa se o backup é realizado quando algo mudou"""
@@ -87,7 +126,8 @@ class TestBackupCSVNewFile:
         # Executa função
         backup.backup_csv_new_file(df=df, backup_path=backup_path)
 
-        assert len(glob(f'{backup_path.with_suffix("")} *.csv')) == 2
+        assert len(glob(f'{backup_path.with_suffix("")} *.csv')) == 1
+        assert len(glob(f'{backup_path.with_suffix("")} *.csv.gz')) == 1
 
     def teste_sem_mudancas(self, del_temp_dir):
         """Testa se o backup deixa de ser realizado quando nada mudou"""
@@ -111,3 +151,72 @@ class TestBackupCSVNewFile:
         backup.backup_csv_new_file(df=df, backup_path=backup_path)
 
         assert len(glob(f'{backup_path} *.csv')) == 1
+
+    def test_hash_conteudo(self, del_temp_dir):
+        """Testa se o backup compactado é comparado pelo hash, sem a leitura, e se o seu conteúdo é o da DataFrame"""
+        df = pd.DataFrame({'A': [1, 2, 3], 'B': ['x', None, 'z']})
+        backup_path = Path('temp/backup.csv')
+
+        backup.backup_csv_new_file(df=df, backup_path=backup_path)
+        backup_file, = glob('temp/backup *.csv.gz')
+        assert_frame_equal(pd.read_csv(backup_file, dtype='object', keep_default_na=False), df.astype(str))
+
+        # O backup não é lido quando há hash gravado
+        Path(backup_file).write_bytes(b'')
+        sleep(1)
+        backup.backup_csv_new_file(df=df, backup_path=backup_path)
+        assert glob('temp/backup *.csv.gz') == [backup_file]
+
+        backup.backup_csv_new_file(df=df.iloc[:2], backup_path=backup_path)
+        assert len(glob('temp/backup *.csv.gz')) == 2
+        assert len(glob('temp/backup *.sha256')) == 2
+
+    def test_hash_backup_anterior(self, del_temp_dir, monkeypatch):
+        """Testa se o backup anterior, sem hash, é lido uma única vez quando é igual à DataFrame"""
+        df = pd.DataFrame({'A': [1, 2, 3], 'B': [1, 2, 3]})
+        backup_path = Path('temp/backup.csv')
+        backup_path.parent.mkdir(parents=True, exist_ok=True)
+        backup_time = datetime.now().strftime("%Y-%m-%d T%H.%M.%S")
+        df.astype(str).to_csv(backup_path.parent / f'{backup_path.stem} {backup_time}.csv',
+                              index=False,
+                              quoting=csv.QUOTE_NONNUMERIC)
+
+        backup.backup_csv_new_file(df=df, backup_path=backup_path)
+        assert len(glob('temp/backup *.sha256')) == 1
+
+        def read_csv(*args, **kwargs):
+            raise AssertionError('O backup anterior não deveria ser lido')
+
+        monkeypatch.setattr(pd, 'read_csv', read_csv)
+        backup.backup_csv_new_file(df=df, backup_path=backup_path)
+
+        assert glob('temp/backup *.csv*') == [str(backup_path.parent / f'{backup_path.stem} {backup_time}.csv')]
+
+
+class TestEscritorCSV:
+    def test_formato_igual_append(self, del_temp_dir):
+        """Testa se a gravação em lote produz o mesmo arquivo que a gravação registro a registro"""
+        registros = [{'timestamp': '2022-08-01 10:00:00', 'email': 'a@economia.gov.br', 'valor': 1.5},
+                     {'timestamp': '2022-08-01 10:00:00', 'email': 'b@economia.gov.br', 'valor': ''}]
+
+        for registro in registros:
+            backup.backup_csv_append(Path('temp/append.csv'), registro)
+
+        with backup.EscritorCSV(Path('temp/lote.csv')) as escritor:
+            escritor.adicionar(pd.DataFrame(registros[:1]))
+            escritor.adicionar(registros[1])
+            assert not os.path.isfile('temp/lote.csv')
+
+        assert Path('temp/lote.csv').read_text() == Path('temp/append.csv').read_text()
+
+        backup.backup_csv_append_lote(Path('temp/lote.csv'), registros)
+        assert len(pd.read_csv('temp/lote.csv')) == 4
+
+    def test_aspas_e_cabecalho(self, del_temp_dir):
+        """Testa se os valores com aspas e vírgulas são escapados e se colunas diferentes do cabeçalho são recusadas"""
+        backup_path = Path('temp/log.csv')
+        backup.backup_csv_append_lote(backup_path, {'A': 'texto, com "aspas"', 'B': 1})
+
+        assert pd.read_csv(backup_path, dtype='object').A.tolist() == ['texto, com "aspas"']
+        with pytest.raises(ValueError):
+            backup.backup_csv_append_lote(backup_path, {'A': 1, 'C': 2})
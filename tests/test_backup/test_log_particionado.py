@@ -0,0 +1,95 @@
+import shutil
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import src.backup as backup
+
+log = Path('temp/log_alertas.csv')
+
+registros = pd.DataFrame({'timestamp': ['2022-08-01 10:00:00', '2022-08-01 23:59:59', '2022-08-02 00:00:00',
+                                        '2022-08-03 11:00:00'],
+                          'email': ['a@economia.gov.br', 'a@economia.gov.br', 'a@economia.gov.br',
+                                    'b@economia.gov.br'],
+                          'meta_nr_recibo': ['1', '2', '3', '4']})
+
+
+@pytest.fixture()
+def del_temp_dir():
+    yield None
+    shutil.rmtree("temp")
+
+
+class TestLogParticionado:
+    def test_particoes_diarias(self, del_temp_dir):
+        """Testa se os registros são gravados na partição do dia e se somente as partições do intervalo são lidas"""
+        backup.log_append(log, registros)
+
+        assert sorted(path.name for path in Path('temp/log_alertas').iterdir()) == ['2022-08-01.csv',
+                                                                                     '2022-08-02.csv',
+                                                                                     '2022-08-03.csv']
+        assert [dia for dia, _ in backup.log_particionado.particoes(log, inicio=date(2022, 8, 2))] == \
+               [date(2022, 8, 2), date(2022, 8, 3)]
+
+        lidos = backup.ler_log(log, inicio=date(2022, 8, 2), fim=date(2022, 8, 2), dtype='object')
+        assert lidos.meta_nr_recibo.tolist() == ['3']
+        assert_frame_equal(backup.ler_log(log, dtype='object'), registros)
+
+    def test_arquivamento(self, del_temp_dir):
+        """Testa se as partições antigas são compactadas e continuam sendo lidas, inclusive após novos registros"""
+        backup.log_append(log, registros)
+
+        assert backup.arquivar_log(log, dias=1, hoje=date(2022, 8, 3)) == 1
+        assert sorted(path.name for path in Path('temp/log_alertas').iterdir()) == ['2022-08-01.csv.gz',
+                                                                                     '2022-08-02.csv',
+                                                                                     '2022-08-03.csv']
+        assert_frame_equal(backup.ler_log(log, dtype='object'), registros)
+
+        # Registro gravado em partição já arquivada
+        backup.log_append(log, registros.iloc[:1])
+        assert backup.arquivar_log(log, dias=1, hoje=date(2022, 8, 3)) == 1
+        lidos = backup.ler_log(log, fim=date(2022, 8, 1), dtype='object')
+        assert lidos.meta_nr_recibo.tolist() == ['1', '2', '1']
+
+    def test_particionar_log(self, del_temp_dir):
+        """Testa se o log gravado antes das partições é lido, filtrado por data, e dividido em partições"""
+        backup.backup_csv_append_lote(log, registros)
+
+        lidos = backup.ler_log(log, inicio=date(2022, 8, 3), dtype='object')
+        assert lidos.meta_nr_recibo.tolist() == ['4']
+
+        assert backup.particionar_log(log) == 4
+        assert not log.exists()
+        assert_frame_equal(backup.ler_log(log, dtype='object'), registros)
+        assert [execucao.meta_nr_recibo.tolist() for execucao in backup.ler_log_recentes(log, dtype='object')] == \
+               [['4'], ['3'], ['1', '2']]
+
+    def test_particionar_log_interrompido(self, del_temp_dir):
+        """Testa se a divisão do log interrompida antes da renomeação do arquivo pode ser repetida sem a duplicação dos
+        registros"""
+        backup.backup_csv_append_lote(log, registros)
+        backup.particionar_log(log)
+        # Interrupção após a gravação das partições: o arquivo original permanece
+        shutil.copy(log.with_suffix('.csv.migrado'), log)
+
+        assert backup.particionar_log(log) == 4
+        assert not log.exists()
+        assert_frame_equal(backup.ler_log(log, dtype='object'), registros)
+
+    def test_arquivamento_interrompido(self, del_temp_dir):
+        """Testa se o arquivamento interrompido antes da remoção da partição pode ser repetido sem a duplicação dos
+        registros"""
+        backup.log_append(log, registros)
+        particao = Path('temp/log_alertas/2022-08-01.csv')
+        conteudo = particao.read_bytes()
+        backup.arquivar_log(log, dias=1, hoje=date(2022, 8, 3))
+        # Interrupção após a gravação do arquivo compactado: a partição permanece
+        particao.write_bytes(conteudo)
+
+        assert backup.arquivar_log(log, dias=1, hoje=date(2022, 8, 3)) == 1
+        assert not particao.exists()
+        assert_frame_equal(backup.ler_log(log, dtype='object'), registros)
+
@@ -0,0 +1,172 @@
+import email
+import smtplib
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+import pytest
+import email_sender
+
+db_path = Path('temp/caixa_saida.sqlite3')
+
+
+class RelogioFalso:
+    """Relógio simulado, que avança somente quando a execução é suspensa"""
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.agora += segundos
+
+
+class DespachanteFalso:
+    """Despachante simulado, que registra as mensagens enviadas e falha com os erros programados"""
+    def __init__(self, erros=None):
+        self.erros = list(erros or [])
+        self.enviadas = []
+
+    def despachar(self, construtores):
+        resultados = []
+        for construir in construtores:
+            mensagem = construir()
+            erro = self.erros.pop(0) if self.erros else None
+            if erro is None:
+                self.enviadas.append(mensagem.serializar())
+            resultados.append(email_sender.ResultadoEnvio(sucesso=erro is None, mensagem=mensagem, erro=erro))
+        return resultados
+
+
+class DespachanteRecusa(DespachanteFalso):
+    """Despachante simulado, que aceita as mensagens, com a recusa dos destinatários programados"""
+    def __init__(self, recusados):
+        super().__init__()
+        self.recusados = recusados
+
+    def despachar(self, construtores):
+        mensagens = [construir() for construir in construtores]
+        self.enviadas.extend(mensagens)
+        return [email_sender.ResultadoEnvio(sucesso=True, mensagem=m, erro=None,
+                                            recusados={destinatario: resposta
+                                                       for destinatario, resposta in self.recusados.items()
+                                                       if destinatario in m.destinatario})
+                for m in mensagens]
+
+
+@pytest.fixture()
+def caixa():
+    relogio = RelogioFalso()
+    caixa = email_sender.CaixaSaida(db_path, tentativas_max=3, espera_base=30, relogio=relogio, dormir=relogio.dormir)
+    yield caixa
+    caixa.fechar()
+    shutil.rmtree("temp")
+
+
+def mensagem(destinatario='usuario@economia.gov.br'):
+    return email_sender.EmailMessagText(destinatario=destinatario,
+                                        sender_email='remetente@economia.gov.br',
+                                        assunto='Teste',
+                                        conteudo='Teste')
+
+
+class TestCaixaSaida:
+    def test_enfileirar_idempotente(self, caixa):
+        """Testa se a mesma chave gera o mesmo Message-ID e se a mensagem é enviada uma única vez"""
+        message_id = caixa.enfileirar(mensagem(), chave='usuario|a', metadados={'email': 'a'})
+        assert caixa.enfileirar(mensagem(), chave='usuario|a', metadados={'email': 'a'}) == message_id
+
+        despachante = DespachanteFalso()
+        finalizadas = caixa.drenar(despachante)
+        caixa.enfileirar(mensagem(), chave='usuario|a', metadados={'email': 'a'})
+
+        assert caixa.drenar(despachante) == []
+        assert finalizadas == [{'message_id': message_id, 'status': 'enviada', 'metadados': {'email': 'a'},
+                                'destinatarios': ['usuario@economia.gov.br'], 'recusados': [], 'reenfileirados': []}]
+        assert len(despachante.enviadas) == 1
+        assert email.message_from_bytes(despachante.enviadas[0])['Message-ID'] == message_id
+
+    def test_novas_tentativas(self, caixa):
+        """Testa se as falhas temporárias são reenviadas com espera crescente, dentro do tempo máximo de espera"""
+        caixa.enfileirar(mensagem(), chave='usuario|a')
+        despachante = DespachanteFalso(erros=[smtplib.SMTPServerDisconnected(), smtplib.SMTPServerDisconnected()])
+        inicio = caixa._relogio()
+
+        finalizadas = caixa.drenar(despachante, espera_max=600)
+
+        assert [finalizada['status'] for finalizada in finalizadas] == ['enviada']
+        assert caixa._relogio() - inicio == 30 + 60
+        assert caixa.pendentes() == []
+
+    def test_pendente_entre_execucoes(self, caixa):
+        """Testa se a mensagem com falha temporária permanece pendente, para envio em execução posterior"""
+        caixa.enfileirar(mensagem(), chave='usuario|a', metadados={'email': 'a'})
+
+        assert caixa.drenar(DespachanteFalso(erros=[smtplib.SMTPServerDisconnected()])) == []
+        assert caixa.pendentes()[0]['tentativas'] == 1
+
+    def test_falha_definitiva(self, caixa):
+        """Testa se a mensagem recusada pelo servidor (5xx) não é reenviada"""
+        caixa.enfileirar(mensagem(), chave='usuario|a')
+        erro = smtplib.SMTPRecipientsRefused({'usuario@economia.gov.br': (550, b'Mailbox unavailable')})
+
+        finalizadas = caixa.drenar(DespachanteFalso(erros=[erro]), espera_max=600)
+
+        assert [finalizada['status'] for finalizada in finalizadas] == ['falhou']
+        assert caixa.pendentes() == []
+
+    def test_varios_destinatarios(self, caixa):
+        """Testa se a mensagem a vários destinatários é armazenada e enviada em uma única transação, com os
+        destinatários somente no envelope, e se os recusados definitivamente (5xx) pelo servidor são informados"""
+        destinatarios = ['usuario1@economia.gov.br', 'usuario2@economia.gov.br']
+        caixa.enfileirar(mensagem(destinatarios), chave='usuario|grupo')
+
+        despachante = DespachanteRecusa({destinatarios[1]: (550, b'Mailbox unavailable')})
+        finalizadas = caixa.drenar(despachante, espera_max=600)
+
+        assert despachante.enviadas[0].destinatario == destinatarios
+        assert len(despachante.enviadas) == 1
+        assert finalizadas[0]['status'] == 'enviada'
+        assert finalizadas[0]['destinatarios'] == destinatarios
+        assert finalizadas[0]['recusados'] == [destinatarios[1]]
+        assert finalizadas[0]['reenfileirados'] == []
+
+    def test_recusa_temporaria(self, caixa):
+        """Testa se os destinatários recusados temporariamente (4xx), na mensagem aceita para os demais, recebem a
+        mesma mensagem em nova tentativa, e se são informados como recusados ao atingir o número máximo de tentativas"""
+        destinatarios = ['usuario1@economia.gov.br', 'usuario2@economia.gov.br']
+        message_id = caixa.enfileirar(mensagem(destinatarios), chave='usuario|grupo', metadados={'email': 'a'})
+
+        despachante = DespachanteRecusa({destinatarios[1]: (450, b'Mailbox busy')})
+        inicio = caixa._relogio()
+        finalizadas = caixa.drenar(despachante)
+
+        assert finalizadas == [{'message_id': message_id, 'status': 'enviada', 'metadados': {'email': 'a'},
+                                'destinatarios': destinatarios, 'recusados': [],
+                                'reenfileirados': [destinatarios[1]]}]
+        assert [pendente['destinatarios'] for pendente in caixa.pendentes()] == [[destinatarios[1]]]
+        assert caixa.pendentes()[0]['tentativas'] == 1
+
+        # Nova tentativa, após a espera, somente ao destinatário recusado, novamente recusado até o número máximo
+        finalizadas = caixa.drenar(despachante, espera_max=600)
+
+        assert caixa._relogio() - inicio == 30 + 60
+        assert [mensagem.destinatario for mensagem in despachante.enviadas] == [destinatarios, destinatarios[1],
+                                                                                destinatarios[1]]
+        assert [(finalizada['destinatarios'], finalizada['recusados'], finalizada['reenfileirados'])
+                for finalizada in finalizadas] == [([destinatarios[1]], [], [destinatarios[1]]),
+                                                   ([destinatarios[1]], [destinatarios[1]], [])]
+        assert caixa.pendentes() == []
+
+    def test_destinatarios_dia(self, caixa):
+        """Testa se são contados os destinatários das mensagens enviadas no dia, inclusive por outra instância da
+        caixa de saída"""
+        caixa.enfileirar(mensagem(['usuario1@economia.gov.br', 'usuario2@economia.gov.br']), chave='usuario|grupo')
+        caixa.enfileirar(mensagem(), chave='usuario|a')
+        caixa.enfileirar(mensagem('usuario3@economia.gov.br'), chave='usuario|b')
+        caixa.drenar(DespachanteFalso(erros=[None, None, smtplib.SMTPRecipientsRefused({})]))
+
+        with email_sender.CaixaSaida(db_path, relogio=caixa._relogio) as outra:
+            assert outra.destinatarios_dia() == 3
+        dia = date.fromtimestamp(caixa._relogio())
+        assert caixa.destinatarios_dia(dia + timedelta(days=1)) == 0
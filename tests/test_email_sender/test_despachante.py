@@ -0,0 +1,99 @@
+import functools
+import io
+import threading
+import time
+import pytest
+import email_sender
+
+LATENCIA = 0.05
+
+
+class SMTPLento:
+    """Servidor SMTP simulado, com latência fixa em cada envio e recusa dos destinatários inválidos"""
+    conexoes = []
+    lock = threading.Lock()
+
+    def __init__(self, host, port):
+        self.enviadas = []
+        with SMTPLento.lock:
+            SMTPLento.conexoes.append(self)
+
+    def ehlo(self):
+        pass
+
+    def starttls(self, context=None):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        return 250, b'OK'
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        time.sleep(LATENCIA)
+        if 'invalido' in to_addrs:
+            raise email_sender.email_sender.smtplib.SMTPRecipientsRefused({to_addrs: (550, b'Mailbox unavailable')})
+        self.enviadas.append(to_addrs)
+        return {}
+
+    def sendmail_fluxo(self, from_addr, to_addrs, escrever):
+        destino = io.BytesIO()
+        escrever(destino)
+        return self.sendmail(from_addr, to_addrs, destino.getvalue())
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def smtp_lento(monkeypatch):
+    SMTPLento.conexoes = []
+    monkeypatch.setattr(email_sender.email_sender, 'SMTPFluxo', SMTPLento)
+    yield SMTPLento
+
+
+def construtores(n):
+    return [functools.partial(email_sender.EmailMessagText,
+                              destinatario=f'usuario{i}@economia.gov.br',
+                              sender_email='remetente@economia.gov.br',
+                              assunto='Teste',
+                              conteudo='Teste')
+            for i in range(n)]
+
+
+def despachar(n, conexoes):
+    criar_sessao = functools.partial(email_sender.SessaoSMTP, 'user', 'senha', 'smtp.teste', 587)
+    inicio = time.perf_counter()
+    with email_sender.DespachanteSMTP(criar_sessao, conexoes=conexoes) as despachante:
+        resultados = despachante.despachar(construtores(n))
+    return resultados, time.perf_counter() - inicio
+
+
+class TestDespachanteSMTP:
+    def test_concorrencia(self, smtp_lento):
+        """Testa se as mensagens são distribuídas entre as conexões e se o tempo total diminui com mais conexões"""
+        _, tempo_serial = despachar(12, conexoes=1)
+        smtp_lento.conexoes = []
+        resultados, tempo_concorrente = despachar(12, conexoes=4)
+
+        assert all(resultado.sucesso for resultado in resultados)
+        assert len(smtp_lento.conexoes) == 4
+        assert sum(len(conexao.enviadas) for conexao in smtp_lento.conexoes) == 12
+        assert tempo_concorrente < tempo_serial * 0.7
+
+    def test_resultados(self, smtp_lento):
+        """Testa se o resultado de cada envio é registrado na ordem das mensagens"""
+        mensagens = construtores(3)
+        mensagens[1] = functools.partial(mensagens[1], destinatario='invalido@economia.gov.br')
+
+        criar_sessao = functools.partial(email_sender.SessaoSMTP, 'user', 'senha', 'smtp.teste', 587)
+        with email_sender.DespachanteSMTP(criar_sessao, conexoes=2) as despachante:
+            resultados = despachante.despachar(mensagens)
+
+        assert [resultado.sucesso for resultado in resultados] == [True, False, True]
+        assert resultados[0].mensagem.destinatario == 'usuario0@economia.gov.br'
+        assert isinstance(resultados[1].erro, email_sender.email_sender.smtplib.SMTPRecipientsRefused)
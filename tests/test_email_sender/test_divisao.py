@@ -0,0 +1,97 @@
+import base64
+import os
+import shutil
+from pathlib import Path
+import pytest
+import email_sender
+
+template_html = Path('data/input/html_templates/alerta_usuario.html')
+logo = Path('data/input/images/logoSAAT_email.png')
+
+
+@pytest.fixture()
+def anexos():
+    Path('temp').mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, tamanho_kb in enumerate([300, 120, 500, 80, 250, 400, 60]):
+        path = Path(f'temp/cat{i}.pdf')
+        path.write_bytes(os.urandom(tamanho_kb * 1024))
+        paths.append(path)
+    yield paths
+    shutil.rmtree("temp")
+
+
+@pytest.mark.parametrize('tamanho', [0, 1, 56, 57, 58, 1000, 123457])
+def test_tamanho_codificado(tamanho):
+    """Testa se o tamanho calculado corresponde ao da codificação base64 em linhas terminadas em CRLF"""
+    codificado = base64.encodebytes(b'x' * tamanho).replace(b'\n', b'\r\n')
+    assert email_sender.tamanho_codificado(tamanho) == len(codificado)
+
+
+def test_dividir_anexos(anexos):
+    """Testa se os anexos são divididos no menor número de mensagens, na ordem original, sem exceder o limite"""
+    orcamento = 1024 ** 2
+    bytes_fixos = email_sender.tamanho_codificado(logo.stat().st_size) + 16 * 1024
+
+    grupos = email_sender.dividir_anexos(anexos, orcamento_bytes=orcamento, bytes_fixos=bytes_fixos)
+
+    # 1.710 KB, após a codificação base64, não cabem em duas mensagens de 1 MB
+    assert len(grupos) == 3
+    assert sorted(anexo for grupo in grupos for anexo in grupo) == sorted(anexos)
+    for grupo in grupos:
+        assert grupo == sorted(grupo, key=anexos.index)
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=grupo,
+                                            imagens=logo)
+        assert len(msg.serializar()) <= orcamento
+
+
+def test_anexo_maior_que_limite(anexos):
+    """Testa se o anexo que excede sozinho o limite é enviado em mensagem própria"""
+    grupos = email_sender.dividir_anexos(anexos[:3], orcamento_bytes=600 * 1024)
+
+    assert grupos == [[anexos[0], anexos[1]], [anexos[2]]]
+
+
+def test_tamanho_compactado(anexos):
+    """Testa se o tamanho calculado corresponde ao do anexo no arquivo .zip gerado na compactação dos anexos"""
+    anexos[0].write_bytes(b'%PDF-1.7 ' + b'conteudo repetido ' * 10000 + os.urandom(1000))
+    msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                        sender_email='remetente@economia.gov.br',
+                                        assunto='Teste',
+                                        template_html=template_html,
+                                        template_campos={},
+                                        anexos=anexos[:1],
+                                        imagens=logo,
+                                        compactar_anexos=True)
+
+    assert email_sender.tamanho_compactado(anexos[0]) + 22 == msg.bytes_anexos_compactados
+
+
+def test_dividir_anexos_compactados(anexos):
+    """Testa se, com os anexos compactados, a divisão considera o tamanho compactado, sem exceder o limite"""
+    for i, anexo in enumerate(anexos):
+        anexo.write_bytes(os.urandom(20 * 1024 * (i + 1)) + b'conteudo repetido ' * 30000)
+    orcamento = 512 * 1024
+    bytes_fixos = email_sender.tamanho_codificado(logo.stat().st_size) + 16 * 1024
+
+    assert len(email_sender.dividir_anexos(anexos, orcamento_bytes=orcamento, bytes_fixos=bytes_fixos)) == 7
+
+    grupos = email_sender.dividir_anexos(anexos, orcamento_bytes=orcamento, bytes_fixos=bytes_fixos, compactar=True)
+
+    assert len(grupos) == 2
+    assert sorted(anexo for grupo in grupos for anexo in grupo) == sorted(anexos)
+    for grupo in grupos:
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=grupo,
+                                            imagens=logo,
+                                            compactar_anexos=True)
+        assert len(msg.serializar()) <= orcamento
@@ -0,0 +1,306 @@
+import io
+import shutil
+import zipfile
+from pathlib import Path
+import pytest
+import email_sender
+
+template_html = Path('data/input/html_templates/alerta_usuario.html')
+logo = Path('data/input/images/logoSAAT_email.png')
+
+
+@pytest.fixture()
+def anexos():
+    Path('temp').mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(3):
+        path = Path(f'temp/cat{i}.pdf')
+        path.write_bytes(b'%PDF-1.7 ' + b'conteudo repetido ' * 1000)
+        paths.append(path)
+    yield paths
+    shutil.rmtree("temp")
+
+
+class TestEmailMessageHTML:
+    def test_anexos_separados(self, anexos):
+        """Testa se cada anexo é inserido em uma parte da mensagem"""
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=anexos,
+                                            imagens=logo)
+
+        nomes_anexos = [parte.get_filename() for parte in msg.message.get_payload() if parte.get_filename()]
+
+        assert nomes_anexos == ['cat0.pdf', 'cat1.pdf', 'cat2.pdf']
+
+    def test_anexos_zip(self, anexos):
+        """Testa se os anexos são compactados em um único arquivo .zip e se a redução de tamanho é informada"""
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=anexos,
+                                            imagens=logo,
+                                            compactar_anexos=True)
+
+        partes_anexos = [parte for parte in msg.message.get_payload() if parte.get_filename()]
+
+        assert [parte.get_filename() for parte in partes_anexos] == ['CATs.zip']
+        with zipfile.ZipFile(io.BytesIO(partes_anexos[0].get_payload(decode=True))) as zf:
+            assert zf.namelist() == ['cat0.pdf', 'cat1.pdf', 'cat2.pdf']
+            assert zf.read('cat1.pdf') == anexos[1].read_bytes()
+
+        assert msg.bytes_anexos == sum(anexo.stat().st_size for anexo in anexos)
+        assert 0 < msg.bytes_anexos_compactados < msg.bytes_anexos
+
+    def test_varios_destinatarios(self, anexos):
+        """Testa se, com vários destinatários, os endereços não são expostos no cabeçalho da mensagem"""
+        destinatarios = ['usuario1@economia.gov.br', 'usuario2@economia.gov.br']
+        msg = email_sender.EmailMessageHTML(destinatario=destinatarios,
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=anexos,
+                                            imagens=logo)
+
+        assert msg.destinatario == destinatarios
+        assert msg.message['To'] == 'undisclosed-recipients:;'
+        assert b'usuario1' not in msg.serializar()
+
+    def test_cache_mime(self, anexos):
+        """Testa se a logo e os anexos são codificados uma única vez e se as partes são idênticas às não armazenadas"""
+        cache_mime = email_sender.CacheMIME()
+        mensagens = [email_sender.EmailMessageHTML(destinatario=f'usuario{i}@economia.gov.br',
+                                                   sender_email='remetente@economia.gov.br',
+                                                   assunto='Teste',
+                                                   template_html=template_html,
+                                                   template_campos={},
+                                                   anexos=anexos,
+                                                   imagens=logo,
+                                                   cache_mime=cache_mime)
+                     for i in range(10)]
+        msg_sem_cache = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                                      sender_email='remetente@economia.gov.br',
+                                                      assunto='Teste',
+                                                      template_html=template_html,
+                                                      template_campos={},
+                                                      anexos=anexos,
+                                                      imagens=logo)
+
+        tamanho_arquivos = logo.stat().st_size + sum(anexo.stat().st_size for anexo in anexos)
+        assert cache_mime.estatisticas() == {'arquivos_codificados': 4,
+                                             'reutilizacoes': 36,
+                                             'bytes_codificados': tamanho_arquivos}
+
+        partes_cache = mensagens[-1].message.get_payload()[1:]
+        partes_sem_cache = msg_sem_cache.message.get_payload()[1:]
+        for parte_cache, parte_sem_cache in zip(partes_cache, partes_sem_cache):
+            assert parte_cache.as_string() == parte_sem_cache.as_string()
+
+    def test_cache_corpos(self, anexos):
+        """Testa se os corpos idênticos são montados uma única vez e se as mensagens diferem somente nos cabeçalhos"""
+        cache_corpos = email_sender.CacheCorpos()
+        montagens = []
+
+        def montar(campos):
+            montagens.append(campos)
+            return email_sender.corpo_html(template_html, campos, anexos, logo)
+
+        mensagens = []
+        for i in range(10):
+            campos = {'uf': 'SP' if i % 2 else 'RJ'}
+            corpo = cache_corpos.obter(email_sender.CacheCorpos.chave(campos), lambda: montar(campos))
+            mensagens.append(email_sender.EmailMessageHTML(destinatario=f'usuario{i}@economia.gov.br',
+                                                           sender_email='remetente@economia.gov.br',
+                                                           assunto='Teste',
+                                                           corpo=corpo))
+        msg_sem_cache = email_sender.EmailMessageHTML(destinatario='usuario9@economia.gov.br',
+                                                      sender_email='remetente@economia.gov.br',
+                                                      assunto='Teste',
+                                                      template_html=template_html,
+                                                      template_campos={'uf': 'SP'},
+                                                      anexos=anexos,
+                                                      imagens=logo)
+
+        assert len(montagens) == 2
+        assert cache_corpos.estatisticas() == {'corpos_montados': 2, 'corpos_reutilizados': 8,
+                                               'taxa_deduplicacao': 0.8}
+        assert mensagens[1].message.get_payload()[0] is mensagens[9].message.get_payload()[0]
+        assert mensagens[9].bytes_anexos == msg_sem_cache.bytes_anexos
+
+        texto_sem_cache = msg_sem_cache.message.as_string()
+        mensagens[9].message.set_boundary(msg_sem_cache.message.get_boundary())
+        assert mensagens[9].message.as_string() == texto_sem_cache
+
+
+class SMTPFalso:
+    """Servidor SMTP simulado, que registra os comandos recebidos e pode encerrar a conexão em um envio"""
+    conexoes = []
+
+    def __init__(self, host, port):
+        self.logins = 0
+        self.enviadas = []
+        self.desconectar = False
+        self.encerrada = False
+        self.fechada = False
+        SMTPFalso.conexoes.append(self)
+
+    def ehlo(self):
+        pass
+
+    def starttls(self, context=None):
+        pass
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def noop(self):
+        if self.encerrada:
+            raise email_sender.email_sender.smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return 250, b'OK'
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.desconectar:
+            raise email_sender.email_sender.smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.enviadas.append(to_addrs)
+        return {}
+
+    def sendmail_fluxo(self, from_addr, to_addrs, escrever):
+        destino = io.BytesIO()
+        escrever(destino)
+        return self.sendmail(from_addr, to_addrs, destino.getvalue())
+
+    def quit(self):
+        pass
+
+    def close(self):
+        self.fechada = True
+
+
+@pytest.fixture()
+def smtp_falso(monkeypatch):
+    SMTPFalso.conexoes = []
+    monkeypatch.setattr(email_sender.email_sender, 'SMTPFluxo', SMTPFalso)
+    yield SMTPFalso
+
+
+class TestSessaoSMTP:
+    def test_sessao_unica(self, smtp_falso):
+        """Testa se várias mensagens são enviadas com uma única conexão e autenticação"""
+        with email_sender.SessaoSMTP('user', 'senha', 'smtp.teste', 587) as sessao:
+            for i in range(5):
+                msg = email_sender.EmailMessagText(destinatario=f'usuario{i}@economia.gov.br',
+                                                   sender_email='remetente@economia.gov.br',
+                                                   assunto='Teste',
+                                                   conteudo='Teste')
+                msg.send(sessao=sessao)
+
+        assert len(smtp_falso.conexoes) == 1
+        assert smtp_falso.conexoes[0].logins == 1
+        assert len(smtp_falso.conexoes[0].enviadas) == 5
+        assert sessao.server is None
+
+    def test_reconexao(self, smtp_falso):
+        """Testa se a sessão é restabelecida, sem perda da mensagem, quando o servidor encerra a conexão ociosa"""
+        with email_sender.SessaoSMTP('user', 'senha', 'smtp.teste', 587) as sessao:
+            sessao.sendmail('remetente@economia.gov.br', 'usuario0@economia.gov.br', 'msg')
+            smtp_falso.conexoes[0].encerrada = True
+            sessao.sendmail('remetente@economia.gov.br', 'usuario1@economia.gov.br', 'msg')
+
+        assert sessao.conexoes == 2
+        assert smtp_falso.conexoes[0].fechada
+        assert smtp_falso.conexoes[1].enviadas == ['usuario1@economia.gov.br']
+
+    def test_desconexao_no_envio(self, smtp_falso):
+        """Testa se a mensagem não é reenviada quando a conexão cai durante o envio, pois o servidor pode tê-la
+        recebido"""
+        with email_sender.SessaoSMTP('user', 'senha', 'smtp.teste', 587) as sessao:
+            sessao.sendmail('remetente@economia.gov.br', 'usuario0@economia.gov.br', 'msg')
+            smtp_falso.conexoes[0].desconectar = True
+            with pytest.raises(email_sender.email_sender.smtplib.SMTPServerDisconnected):
+                sessao.sendmail('remetente@economia.gov.br', 'usuario1@economia.gov.br', 'msg')
+            assert sessao.server is None
+
+        assert sessao.conexoes == 1
+        assert smtp_falso.conexoes[0].fechada
+
+    def test_limitador_resposta_temporaria(self, smtp_falso):
+        """Testa se a taxa do limitador é reduzida quando o servidor encerra a conexão com a resposta 421"""
+        def sendmail_421(from_addr, to_addrs, msg):
+            raise email_sender.email_sender.smtplib.SMTPSenderRefused(421, b'Service not available', from_addr)
+
+        limitador = email_sender.LimitadorTaxa(mensagens_por_minuto=30, dormir=lambda segundos: None)
+        with email_sender.SessaoSMTP('user', 'senha', 'smtp.teste', 587, limitador=limitador) as sessao:
+            sessao.conectar()
+            sessao.server.sendmail = sendmail_421
+            sessao.sendmail('remetente@economia.gov.br', 'usuario0@economia.gov.br', 'msg')
+
+        assert sessao.conexoes == 2
+        # Reduzida à metade pela resposta 421 e aumentada após o envio bem-sucedido na nova conexão
+        assert limitador.taxa == 16
+        assert limitador.destinatarios_dia == 1
+
+
+class ServidorGravador:
+    """Conexão SMTP simulada, que grava os bytes transmitidos"""
+    def __init__(self):
+        self.dados = b''
+
+    def send(self, dados):
+        self.dados += dados
+
+
+class TestFluxoDados:
+    @pytest.mark.parametrize('tamanho_bloco', [1, 2, 7, 1024])
+    def test_equivalencia_smtplib(self, tamanho_bloco):
+        """Testa se a transmissão em blocos produz os mesmos bytes que smtplib.SMTP.sendmail"""
+        mensagem = 'Subject: Teste\n\n.linha com ponto\r\nlinha\r.\n..\nfim'
+        servidor = ServidorGravador()
+
+        fluxo = email_sender.email_sender.FluxoDados(servidor, tamanho_bloco=tamanho_bloco)
+        for i in range(0, len(mensagem), 3):
+            fluxo.write(mensagem[i:i + 3].encode('ascii'))
+        fluxo.finalizar()
+
+        smtplib = email_sender.email_sender.smtplib
+        esperado = smtplib._quote_periods(smtplib._fix_eols(mensagem).encode('ascii')) + b'\r\n.\r\n'
+        assert servidor.dados == esperado
+
+    def test_serializacao(self, anexos):
+        """Testa se a mensagem serializada em partes é equivalente à obtida com as_string"""
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=anexos,
+                                            imagens=logo)
+
+        smtplib = email_sender.email_sender.smtplib
+        assert msg.serializar() == smtplib._fix_eols(msg.message.as_string()).encode('ascii')
+
+    def test_serializacao_zip(self, anexos, monkeypatch):
+        """Testa se o arquivo .zip, codificado em blocos a partir do disco, é serializado como em as_string, e se o
+        arquivo temporário é removido quando a mensagem deixa de ser utilizada"""
+        monkeypatch.setattr(email_sender.email_sender, 'TAMANHO_BLOCO_BASE64', 57)
+        msg = email_sender.EmailMessageHTML(destinatario='usuario@economia.gov.br',
+                                            sender_email='remetente@economia.gov.br',
+                                            assunto='Teste',
+                                            template_html=template_html,
+                                            template_campos={},
+                                            anexos=anexos,
+                                            imagens=logo,
+                                            compactar_anexos=True)
+        zip_path = [parte for parte in msg.message.get_payload() if parte.get_filename()][0].path
+
+        smtplib = email_sender.email_sender.smtplib
+        assert zip_path.stat().st_size == msg.bytes_anexos_compactados
+        assert msg.serializar() == smtplib._fix_eols(msg.message.as_string()).encode('ascii')
+
+        del msg
+        assert not zip_path.exists()
@@ -0,0 +1,65 @@
+import pytest
+import email_sender
+
+
+class RelogioFalso:
+    """Relógio simulado, que avança somente quando a execução é suspensa"""
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture()
+def relogio():
+    yield RelogioFalso()
+
+
+class TestLimitadorTaxa:
+    def test_taxa(self, relogio):
+        """Testa se os envios são espaçados conforme a taxa configurada"""
+        limitador = email_sender.LimitadorTaxa(mensagens_por_minuto=30, relogio=relogio, dormir=relogio.dormir)
+
+        for _ in range(11):
+            limitador.aguardar()
+
+        assert relogio.agora == pytest.approx(20)
+        assert limitador.estatisticas()['espera_max_s'] == pytest.approx(2)
+
+    def test_reducao_e_recuperacao(self, relogio):
+        """Testa se a taxa é reduzida nas respostas temporárias e recuperada, até o máximo, nos envios bem-sucedidos"""
+        limitador = email_sender.LimitadorTaxa(mensagens_por_minuto=30, taxa_min_por_minuto=10, relogio=relogio,
+                                               dormir=relogio.dormir)
+
+        limitador.reduzir()
+        assert limitador.taxa == 15
+        limitador.reduzir()
+        assert limitador.taxa == 10
+
+        for _ in range(50):
+            limitador.aumentar()
+        assert limitador.taxa == 30
+        assert limitador.estatisticas()['reducoes'] == 2
+
+    def test_limite_diario(self, relogio):
+        """Testa se o envio é interrompido ao atingir o limite diário de destinatários"""
+        limitador = email_sender.LimitadorTaxa(mensagens_por_minuto=60, destinatarios_por_dia=3, relogio=relogio,
+                                               dormir=relogio.dormir)
+
+        limitador.aguardar(2)
+        limitador.aguardar(1)
+        with pytest.raises(email_sender.LimiteDiarioExcedido):
+            limitador.aguardar(1)
+
+    def test_limite_diario_execucoes_anteriores(self, relogio):
+        """Testa se o limite diário considera os destinatários atendidos no dia em execuções anteriores"""
+        limitador = email_sender.LimitadorTaxa(mensagens_por_minuto=60, destinatarios_por_dia=3, destinatarios_dia=2,
+                                               relogio=relogio, dormir=relogio.dormir)
+
+        limitador.aguardar(1)
+        with pytest.raises(email_sender.LimiteDiarioExcedido):
+            limitador.aguardar(1)